@@ -1,41 +1,481 @@
+# Módulos de la biblioteca estándar para codificar los cursores de paginación
+# y leer la configuración del entorno
+import atexit
+import base64
+import binascii
+import io
+import json
+import os
+import time
+import zlib
+from datetime import datetime
+from itertools import islice
+
+import click
+
 # Importamos Flask, que es el framework web principal
-from flask import Flask, jsonify, render_template, request, redirect, url_for
+from flask import Flask, Response, g, jsonify, render_template, request, redirect, url_for
+from flask import before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache
+from markupsafe import Markup
 # Importamos las clases de nuestros modelos personalizados
-from models.biblioteca import Biblioteca
+from models.biblioteca import Biblioteca, ErrorBiblioteca, validar_campo_libros
+from models.biblioteca_sqlite import BibliotecaSQLite
+from models.compartida import BibliotecaReplicada
+from models.eventos import CanalEventos
+from models.importacion import exportar, formato_de, importar
 from models.libro import Libro
+from models.persistencia import Persistencia
+from models.texto import normalizar
 from models.usuario import Usuario
+from utils.cache import CacheFragmentos, CacheRespuestas, RespuestaCacheada
+from utils.metricas import Metricas, Perfilador
 
 
 # Creamos la instancia de la aplicación Flask
 app = Flask(__name__)
 
-# Creamos una instancia de Biblioteca que almacenará todos los datos en memoria
-biblioteca = Biblioteca()
+# ========== ALMACENAMIENTO ==========
+# La variable de entorno BIBLIOTECA_BACKEND elige dónde se guardan los datos:
+# - "memoria" (por defecto): todo en memoria; si además se define BIBLIOTECA_DATOS
+#   con una carpeta, la biblioteca se reconstruye desde el disco al iniciar y cada
+#   operación queda registrada ahí
+# - "sqlite": los datos viven en la base indicada en BIBLIOTECA_SQLITE
+# - "compartido": para correr varios procesos (ej: gunicorn -w 4). Los datos los
+#   tiene el servidor de estado (python estado.py) que escucha en el socket Unix
+#   BIBLIOTECA_ESTADO; cada proceso consulta una réplica local en memoria
+# Las rutas usan la misma interfaz en todos los casos
+app.config["BIBLIOTECA_BACKEND"] = os.environ.get("BIBLIOTECA_BACKEND", "memoria")
+app.config["BIBLIOTECA_SQLITE"] = os.environ.get("BIBLIOTECA_SQLITE", "biblioteca.db")
+app.config["BIBLIOTECA_DATOS"] = os.environ.get("BIBLIOTECA_DATOS")
+app.config["BIBLIOTECA_ESTADO"] = os.environ.get("BIBLIOTECA_ESTADO", "biblioteca.sock")
+app.config["BIBLIOTECA_ESTADO_CLAVE"] = os.environ.get("BIBLIOTECA_ESTADO_CLAVE", "biblioteca")
+
+if app.config["BIBLIOTECA_BACKEND"] == "sqlite":
+    biblioteca = BibliotecaSQLite(app.config["BIBLIOTECA_SQLITE"])
+    atexit.register(biblioteca.cerrar)
+elif app.config["BIBLIOTECA_BACKEND"] == "compartido":
+    biblioteca = BibliotecaReplicada(
+        app.config["BIBLIOTECA_ESTADO"], app.config["BIBLIOTECA_ESTADO_CLAVE"].encode()
+    )
+else:
+    # Creamos una instancia de Biblioteca que almacenará todos los datos en memoria
+    biblioteca = Biblioteca()
+
+    if app.config["BIBLIOTECA_DATOS"]:
+        persistencia = Persistencia(app.config["BIBLIOTECA_DATOS"])
+        persistencia.cargar(biblioteca)
+        # Al cerrar la aplicación nos aseguramos de bajar a disco las últimas operaciones
+        atexit.register(persistencia.cerrar)
+
+# ========== CACHÉ DE RESPUESTAS ==========
+# Los listados y búsquedas se guardan ya serializados; la caché se vacía sola
+# cuando la biblioteca cambia (ver Biblioteca.generacion)
+app.config["CACHE_ENTRADAS"] = int(os.environ.get("BIBLIOTECA_CACHE_ENTRADAS", 1024))
+app.config["CACHE_BYTES"] = int(os.environ.get("BIBLIOTECA_CACHE_BYTES", 32 * 2**20))
+cache = CacheRespuestas(app.config["CACHE_ENTRADAS"], app.config["CACHE_BYTES"])
+# La generación vuelve a empezar al reiniciar: este prefijo evita que un ETag
+# de antes del reinicio coincida por casualidad con uno nuevo
+PREFIJO_ETAG = os.urandom(4).hex()
+
+# ========== PLANTILLAS ==========
+# Las plantillas compiladas se guardan en disco (en BIBLIOTECA_PLANTILLAS_CACHE o,
+# si no se indica, en una carpeta temporal del usuario) y se cargan todas al
+# iniciar: un proceso nuevo no las vuelve a compilar y la primera petición no espera.
+# Las filas de las tablas de libros y usuarios se renderizan una vez por versión
+# del registro y se reutilizan (hasta BIBLIOTECA_FRAGMENTOS filas)
+app.config["PLANTILLAS_CACHE"] = os.environ.get("BIBLIOTECA_PLANTILLAS_CACHE")
+app.config["FRAGMENTOS_ENTRADAS"] = int(os.environ.get("BIBLIOTECA_FRAGMENTOS", 20_000))
+if app.config["PLANTILLAS_CACHE"]:
+    os.makedirs(app.config["PLANTILLAS_CACHE"], exist_ok=True)
+app.jinja_options = {
+    **app.jinja_options, "bytecode_cache": FileSystemBytecodeCache(app.config["PLANTILLAS_CACHE"])
+}
+for nombre_plantilla in app.jinja_env.list_templates():
+    app.jinja_env.get_template(nombre_plantilla)
+fragmentos = CacheFragmentos(app.config["FRAGMENTOS_ENTRADAS"])
+
+# ========== EVENTOS EN VIVO ==========
+# La biblioteca publica cada cambio en el canal y /eventos se los envía a las
+# páginas abiertas (Server-Sent Events), que actualizan sus filas sin volver a buscar.
+# Cada cliente tiene una cola de BIBLIOTECA_EVENTOS_COLA eventos: si no los lee a
+# tiempo recibe "reiniciar" y vuelve a pedir su página.
+# Con app.run cada cliente conectado ocupa un hilo; con muchas terminales abiertas
+# conviene asgi.py, que los atiende a todos desde el bucle de eventos
+app.config["EVENTOS_COLA"] = int(os.environ.get("BIBLIOTECA_EVENTOS_COLA", 1000))
+app.config["EVENTOS_CLIENTES"] = int(os.environ.get("BIBLIOTECA_EVENTOS_CLIENTES", 10_000))
+canal = CanalEventos(capacidad_cliente=app.config["EVENTOS_COLA"], max_clientes=app.config["EVENTOS_CLIENTES"])
+biblioteca.activar_eventos(canal)
+
+# ========== MÉTRICAS Y PERFILADO ==========
+# Desactivados por defecto. Con BIBLIOTECA_METRICAS=1 se mide el tiempo de cada
+# ruta (separando el de las plantillas) y se cuentan las operaciones de la
+# biblioteca; todo se publica en /metrics con el formato de Prometheus.
+# Con BIBLIOTECA_PERFILAR_CADA=N se perfila con cProfile una de cada N peticiones
+# y cada perfil se guarda en la carpeta BIBLIOTECA_PERFILES
+app.config["METRICAS"] = os.environ.get("BIBLIOTECA_METRICAS") == "1"
+app.config["PERFILAR_CADA"] = int(os.environ.get("BIBLIOTECA_PERFILAR_CADA", 0))
+app.config["PERFILES"] = os.environ.get("BIBLIOTECA_PERFILES", "perfiles")
+metricas = Metricas() if app.config["METRICAS"] else None
+perfilador = Perfilador(app.config["PERFILAR_CADA"], app.config["PERFILES"])
+
+
+# Los valores que ya llevan la biblioteca y la caché se leen al publicar /metrics
+def recolectar_operaciones():
+    operaciones, _ = biblioteca.contadores()
+    return [((("operacion", operacion),), cantidad) for operacion, cantidad in operaciones.items()]
+
+
+def recolectar_revisados():
+    _, revisados = biblioteca.contadores()
+    return [((("operacion", operacion),), cantidad) for operacion, cantidad in revisados.items()]
+
+
+def recolectar_cache():
+    datos = cache.estadisticas()
+    eventos = ("aciertos", "fallos", "desalojos", "invalidaciones", "no_modificados")
+    return [((("evento", evento),), datos[evento]) for evento in eventos]
+
+
+def recolectar_totales():
+    datos = biblioteca.estadisticas()
+    claves = ("libros", "usuarios", "disponibles", "prestados", "usuarios_con_prestamos")
+    return [((("tipo", clave),), datos[clave]) for clave in claves]
+
+
+# El tiempo de las plantillas se mide con las señales que Flask emite alrededor de cada render
+def antes_de_plantilla(sender, template, context, **extra):
+    g.inicio_plantilla = time.perf_counter()
+
+
+def despues_de_plantilla(sender, template, context, **extra):
+    inicio = g.pop("inicio_plantilla", None)
+    if inicio is None or "plantillas" not in g:
+        return
+    duracion = time.perf_counter() - inicio
+    g.plantillas += duracion
+    metricas.observar("biblioteca_plantilla_segundos", duracion, (("plantilla", template.name),))
+
+
+if metricas is not None:
+    biblioteca.activar_contadores()
+    metricas.describir("biblioteca_peticion_segundos", "histogram", "Duración de cada petición, por ruta.")
+    metricas.describir(
+        "biblioteca_manejador_segundos", "histogram", "Duración de cada petición sin contar las plantillas."
+    )
+    metricas.describir("biblioteca_plantilla_segundos", "histogram", "Duración del render de cada plantilla.")
+    metricas.describir("biblioteca_peticiones_total", "counter", "Peticiones respondidas, por ruta y estado.")
+    metricas.agregar_recolector(
+        "biblioteca_operaciones_total", "counter", "Operaciones de la biblioteca.", recolectar_operaciones
+    )
+    metricas.agregar_recolector(
+        "biblioteca_registros_revisados_total", "counter",
+        "Registros revisados por búsquedas, recorridos y ordenamientos.", recolectar_revisados
+    )
+    metricas.agregar_recolector(
+        "biblioteca_cache_eventos_total", "counter", "Eventos de la caché de respuestas.", recolectar_cache
+    )
+    metricas.agregar_recolector("biblioteca_totales", "gauge", "Totales actuales de la biblioteca.", recolectar_totales)
+    before_render_template.connect(antes_de_plantilla, app)
+    template_rendered.connect(despues_de_plantilla, app)
+
+
+# Sin métricas ni perfilador estos ganchos solo hacen una comparación por petición
+@app.before_request
+def iniciar_medicion():
+    if metricas is None and not perfilador.cada:
+        return
+    g.inicio = time.perf_counter()
+    g.plantillas = 0.0
+    g.perfil = perfilador.iniciar()
+
+
+@app.after_request
+def anotar_estado(respuesta):
+    g.estado = respuesta.status_code
+    return respuesta
+
+
+@app.teardown_request
+def terminar_medicion(error=None):
+    inicio = g.pop("inicio", None)
+    if inicio is None:
+        return
+    duracion = time.perf_counter() - inicio
+    ruta = request.url_rule.rule if request.url_rule else "<sin ruta>"
+    perfil = g.pop("perfil", None)
+    if perfil is not None:
+        perfilador.terminar(perfil, f"{request.method}-{ruta}")
+    if metricas is not None:
+        etiquetas = (("ruta", ruta), ("metodo", request.method))
+        metricas.observar("biblioteca_peticion_segundos", duracion, etiquetas)
+        metricas.observar("biblioteca_manejador_segundos", duracion - g.plantillas, etiquetas)
+        metricas.contar("biblioteca_peticiones_total", etiquetas + (("estado", g.get("estado", 500)),))
 
 # ========== DATOS INICIALES ==========
-# Agregamos 3 libros de prueba al iniciar la aplicación
-# Cada libro recibe: id, título, autor, género, y stock por defecto
-biblioteca.agregar_libro(Libro(1, "El principito", "Antoine de Saint-Exupéry", "Drama"))
-biblioteca.agregar_libro(Libro(2, "Cien Años de Soledad", "Gabriel García Márquez", "Realismo mágico"))
-biblioteca.agregar_libro(Libro(3, "Rayuela", "Julio Cortázar", "Ficción"))
-
-# Agregamos 3 usuarios de prueba al iniciar la aplicación
-# Cada usuario recibe: id, nombre, apellido, dni, teléfono, dirección, número de dirección
-biblioteca.agregar_usuario(
-    Usuario(
-        1, "Lautaro", "Ruspil", 23457382, "2284-225421", "Avenida Pellegrini", 2700, 
+# Si la biblioteca está vacía (primera ejecución o sin persistencia)
+# agregamos los datos de prueba. La biblioteca vuelve a verificar que esté vacía
+# al agregarlos: con varios procesos arrancando a la vez, solo el primero los carga
+if biblioteca.total_libros() == 0 and biblioteca.total_usuarios() == 0:
+    biblioteca.agregar_si_vacia(
+        [
+            # Agregamos 3 libros de prueba al iniciar la aplicación
+            # Cada libro recibe: id, título, autor, género, y stock por defecto
+            Libro(1, "El principito", "Antoine de Saint-Exupéry", "Drama"),
+            Libro(2, "Cien Años de Soledad", "Gabriel García Márquez", "Realismo mágico"),
+            Libro(3, "Rayuela", "Julio Cortázar", "Ficción"),
+        ],
+        [
+            # Agregamos 3 usuarios de prueba al iniciar la aplicación
+            # Cada usuario recibe: id, nombre, apellido, dni, teléfono, dirección, número de dirección
+            Usuario(1, "Lautaro", "Ruspil", 23457382, "2284-225421", "Avenida Pellegrini", 2700),
+            Usuario(2, "Franco", "Dell' Arciprete", 12345678, "2284-124443", "Piedras", 1123),
+            Usuario(3, "Alma", "Leguizamón", 124556321, "2284-565443", "San martín", 2020),
+        ],
     )
-)
 
-biblioteca.agregar_usuario(
-    Usuario(
-        2, "Franco", "Dell' Arciprete", 12345678, "2284-124443", "Piedras", 1123, 
-    )
-)
 
-biblioteca.agregar_usuario(
-    Usuario(3, "Alma", "Leguizamón", 124556321, "2284-565443", "San martín", 2020)
-)
+# ========== FUNCIONES AUXILIARES ==========
+# Cantidad máxima de registros por página en las búsquedas dinámicas
+LIMITE_MAXIMO = 500
+# Filas por página en las tablas de /libros y /usuarios; las siguientes se piden con "Cargar más"
+TAMANIO_PAGINA_HTML = 50
+# Cantidad máxima de pares en /prestamos/lote y /devoluciones/lote
+LOTE_MAXIMO = 1000
+# Tipos de evento que se pueden pedir en /eventos?tipos=
+TIPOS_EVENTOS = {"libro", "libro_eliminado", "usuario", "usuario_eliminado", "prestamo", "devolucion"}
+# Segundos sin eventos tras los que /eventos manda un comentario: los proxies no
+# cortan la conexión y se detecta a tiempo un cliente que ya se fue
+ESPERA_EVENTOS = 15
+# Primer bloque de /eventos: el navegador espera 3 s antes de reconectarse
+INICIO_EVENTOS = "retry: 3000\n\n"
+HEADERS_EVENTOS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+
+# Convierte un libro en un diccionario listo para enviar como JSON
+def libro_a_dict(l):
+    return {
+        "id_libro": l.id_libro,
+        "titulo": l.titulo,
+        "autor": l.autor,
+        "genero": l.genero,
+        "stock": l.stock,
+        "prestados": l.prestados
+    }
+
+
+# Convierte un usuario en un diccionario listo para enviar como JSON
+def usuario_a_dict(u):
+    return {
+        "id_usuario": u.id_usuario,
+        "nombre": u.nombre,
+        "apellido": u.apellido,
+        "dni": u.dni,
+        "telefono": u.telefono,
+        "direccion": u.direccion,
+        "nro_direccion": u.nro_direccion,
+        # Incluimos la lista de libros que tiene el usuario (título y autor de cada uno)
+        "libros": [{"titulo": l.titulo, "autor": l.autor} for l in u.libros]
+    }
+
+
+# El cursor es la clave de orden y el id del último registro entregado,
+# codificados para que el cliente lo devuelva tal cual en la página siguiente
+def codificar_cursor(cursor):
+    return base64.urlsafe_b64encode(json.dumps(cursor).encode()).decode()
+
+
+def decodificar_cursor(texto):
+    try:
+        clave, id_registro = json.loads(base64.urlsafe_b64decode(texto.encode()))
+    except (binascii.Error, UnicodeError, ValueError, TypeError):
+        return None
+    if not isinstance(clave, str) or not isinstance(id_registro, int):
+        return None
+    return (clave, id_registro)
+
+
+# Lee los parámetros "limit" y "cursor" de la URL
+# Devuelve (limite, desde); desde es None en la primera página
+def leer_paginacion():
+    limite = request.args.get("limit", type=int)
+    if limite is not None:
+        limite = min(max(limite, 1), LIMITE_MAXIMO)
+    cursor = request.args.get("cursor")
+    if not cursor:
+        return limite, None
+    desde = decodificar_cursor(cursor)
+    if desde is None:
+        raise ValueError("Cursor inválido.")
+    return limite, desde
+
+
+# Lee el cuerpo JSON de /prestamos/lote y /devoluciones/lote:
+#   {"pares": [[id_usuario, id_libro], ...], "todo_o_nada": true}
+# Cada par también puede venir como {"id_usuario": 1, "id_libro": 2}.
+# Devuelve (pares, todo_o_nada); si el formato no es válido lanza ErrorBiblioteca
+def leer_lote(datos):
+    if isinstance(datos, list):
+        datos = {"pares": datos}
+    if not isinstance(datos, dict) or not isinstance(datos.get("pares"), list):
+        raise ErrorBiblioteca('Se espera un JSON con la lista "pares".')
+    if len(datos["pares"]) > LOTE_MAXIMO:
+        raise ErrorBiblioteca(f"Un lote puede tener hasta {LOTE_MAXIMO} pares.")
+    pares = []
+    for par in datos["pares"]:
+        if isinstance(par, dict):
+            par = [par.get("id_usuario"), par.get("id_libro")]
+        if not isinstance(par, list) or len(par) != 2 or not all(type(i) is int for i in par):
+            raise ErrorBiblioteca(f"Par inválido: {json.dumps(par)}. Cada par lleva el id del usuario y el del libro.")
+        pares.append((par[0], par[1]))
+    return pares, datos.get("todo_o_nada") is True
+
+
+# Arma la respuesta de un lote, con un resultado por par en el mismo orden.
+# Si se pidió todo o nada y algún par falló no se aplicó ninguno: se responde 400
+# indicando cuáles fallaron. Devuelve (datos, código de estado)
+def respuesta_lote(pares, aplicado, resultados, mensaje):
+    detalle = []
+    for (id_usuario, id_libro), resultado in zip(pares, resultados):
+        item = {"id_usuario": id_usuario, "id_libro": id_libro}
+        if isinstance(resultado, ErrorBiblioteca):
+            item.update(ok=False, msg=str(resultado))
+        elif aplicado:
+            item.update(ok=True, msg=mensaje(*resultado))
+        else:
+            item.update(ok=True, msg="Sin errores, pero el lote no se aplicó.")
+        detalle.append(item)
+    errores = sum(1 for item in detalle if not item["ok"])
+    datos = {
+        "ok": aplicado,
+        "aplicados": len(detalle) - errores if aplicado else 0,
+        "errores": errores,
+        "resultados": detalle,
+    }
+    return datos, 200 if aplicado else 400
+
+
+def mensaje_prestamo(usuario, libro):
+    return f"Libro '{libro.titulo}' prestado correctamente a {usuario.nombre}."
+
+
+def mensaje_devolucion(usuario, libro):
+    return f"El libro '{libro.titulo}' fue devuelto correctamente."
+
+
+# Convierte un préstamo vencido en un diccionario; dias_vencido se cuenta hasta "hasta"
+def vencido_a_dict(p, hasta):
+    return {
+        "id_usuario": p.id_usuario,
+        "id_libro": p.id_libro,
+        "fecha": p.fecha.isoformat() if p.fecha else None,
+        "vence": p.vence.isoformat(),
+        "dias_vencido": (hasta - p.vence).days,
+    }
+
+
+def reserva_a_dict(r):
+    return {"id_usuario": r.id_usuario, "id_libro": r.id_libro, "fecha": r.fecha.isoformat() if r.fecha else None}
+
+
+# Lee los parámetros de /eventos: "tipos" (separados por coma; todos si no se indica)
+# y el header Last-Event-ID que manda el navegador al reconectarse.
+# Devuelve (tipos, desde); si hay un tipo desconocido lanza ErrorBiblioteca
+def leer_suscripcion(tipos, ultimo_id):
+    tipos = {t for t in tipos.split(",") if t} if tipos else None
+    if tipos is not None and not tipos <= TIPOS_EVENTOS:
+        raise ErrorBiblioteca(f"Tipos de evento desconocidos: {', '.join(sorted(tipos - TIPOS_EVENTOS))}.")
+    try:
+        desde = int(ultimo_id) if ultimo_id else None
+    except ValueError:
+        desde = None
+    return tipos, desde
+
+
+# Arma la respuesta de una búsqueda dinámica a partir de un iterador ya ordenado
+# - Con "limit" se corta la página y se informa el cursor siguiente en un header
+# - Con "formato=ndjson" se envía un registro por línea usando un generador,
+#   así la memoria no crece con el tamaño del catálogo
+def responder_resultados(registros, total, a_dict, cursor_de, limite):
+    headers = {"X-Total-Count": str(total)}
+
+    if limite:
+        pagina = list(islice(registros, limite))
+        # Si quedan registros después de la página, informamos desde dónde seguir
+        if len(pagina) == limite and next(registros, None) is not None:
+            headers["X-Siguiente-Cursor"] = codificar_cursor(cursor_de(pagina[-1]))
+        registros = iter(pagina)
+
+    if request.args.get("formato") == "ndjson":
+        def generar():
+            for registro in registros:
+                yield json.dumps(a_dict(registro), ensure_ascii=False) + "\n"
+        return Response(generar(), mimetype="application/x-ndjson", headers=headers)
+
+    return jsonify([a_dict(r) for r in registros]), headers
+
+
+# Corta la página de una tabla HTML a partir de un iterador ya ordenado que trae
+# un registro de más. Devuelve (registros de la página, cursor de la siguiente o None)
+def cortar_pagina(registros, limite, cursor_de):
+    pagina = list(islice(registros, limite + 1))
+    if len(pagina) <= limite:
+        return pagina, None
+    del pagina[limite:]
+    return pagina, codificar_cursor(cursor_de(pagina[-1]))
+
+
+# Devuelve una fila de tabla ya renderizada. La clave lleva la versión de los
+# registros que muestra la fila; si alguno no tiene versión (copias de SQLite)
+# la fila se renderiza cada vez
+def fragmento(plantilla, clave, **contexto):
+    if None not in clave:
+        fila = fragmentos.obtener(clave)
+        if fila is not None:
+            return fila
+    fila = Markup(app.jinja_env.get_template(plantilla).render(**contexto))
+    if None not in clave:
+        fragmentos.guardar(clave, fila)
+    return fila
+
+
+def fila_libro(libro):
+    return fragmento("filas/libro.html", ("libro", libro.id_libro, libro.version), book=libro)
+
+
+def fila_usuario(usuario):
+    # La fila muestra título y autor de los libros prestados: también depende de sus versiones
+    clave = ("usuario", usuario.id_usuario, usuario.version, *(l.version for l in usuario.libros))
+    return fragmento("filas/usuario.html", clave, user=usuario)
+
+
+# Devuelve la respuesta guardada para "clave" o la genera con generar() y la guarda.
+# El ETag depende de la generación de la biblioteca y de la clave, así que si el
+# cliente ya tiene el resultado (If-None-Match) se responde 304 sin calcular nada.
+# Las respuestas en streaming (NDJSON) no se guardan, pero también llevan ETag.
+def respuesta_cacheada(clave, generar):
+    generacion = biblioteca.generacion
+    etag = f"{PREFIJO_ETAG}-{generacion:x}-{zlib.crc32(repr(clave).encode()):08x}"
+    if etag in request.if_none_match:
+        cache.contar_no_modificado()
+        respuesta = Response(status=304)
+        respuesta.set_etag(etag)
+        return respuesta
+
+    entrada = cache.obtener(clave, generacion)
+    if entrada is None:
+        respuesta = app.make_response(generar())
+        respuesta.set_etag(etag)
+        if respuesta.status_code != 200 or respuesta.is_streamed:
+            return respuesta
+        headers = {k: v for k, v in respuesta.headers.items() if k.startswith("X-")}
+        entrada = RespuestaCacheada(respuesta.get_data(), respuesta.mimetype, headers)
+        cache.guardar(clave, generacion, entrada)
+        return respuesta
+
+    respuesta = Response(entrada.cuerpo, mimetype=entrada.mimetype, headers=entrada.headers)
+    respuesta.set_etag(etag)
+    return respuesta
 
 
 # ========== RUTA PRINCIPAL (INICIO) ==========
@@ -46,6 +486,75 @@ def inicio():
     return render_template("index.html", biblioteca=biblioteca, active_page="inicio")
 
 
+# ========== ESTADÍSTICAS (JSON) ==========
+# Totales del tablero: la biblioteca los mantiene al día en cada operación,
+# así que esta consulta cuesta lo mismo sin importar el tamaño del catálogo
+@app.route("/estadisticas")
+def estadisticas():
+    return jsonify(biblioteca.estadisticas())
+
+
+# Aciertos, fallos, desalojos e invalidaciones de la caché de respuestas
+# (y aciertos y fallos de la caché de filas de las tablas)
+@app.route("/estadisticas/cache")
+def estadisticas_cache():
+    return jsonify({**cache.estadisticas(), "fragmentos": fragmentos.estadisticas()})
+
+
+# ========== EVENTOS EN VIVO (SERVER-SENT EVENTS) ==========
+# Flujo de cambios para libros.html y usuarios.html. Ejemplo:
+#   curl -N "localhost:5000/eventos?tipos=libro,prestamo,devolucion"
+@app.route("/eventos")
+def eventos():
+    try:
+        tipos, desde = leer_suscripcion(request.args.get("tipos"), request.headers.get("Last-Event-ID"))
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+    suscripcion = canal.suscribir(tipos, desde)
+    if suscripcion is None:
+        return jsonify({"ok": False, "msg": "Hay demasiados clientes conectados."}), 503
+
+    def generar():
+        # Termina cuando falla la escritura al cliente (se desconectó)
+        try:
+            yield INICIO_EVENTOS
+            while True:
+                eventos, reinicio = suscripcion.tomar(ESPERA_EVENTOS)
+                yield suscripcion.texto(eventos, reinicio) or ": ping\n\n"
+        finally:
+            canal.cancelar(suscripcion)
+
+    return Response(generar(), mimetype="text/event-stream", headers=HEADERS_EVENTOS)
+
+
+# Clientes conectados a /eventos y número del último evento publicado
+@app.route("/estadisticas/eventos")
+def estadisticas_eventos():
+    return jsonify(canal.estadisticas())
+
+
+# ========== MÉTRICAS (PROMETHEUS) ==========
+# Solo con BIBLIOTECA_METRICAS=1
+@app.route("/metrics")
+def exportar_metricas():
+    if metricas is None:
+        return jsonify({"ok": False, "msg": "Las métricas están desactivadas (BIBLIOTECA_METRICAS=1)."}), 404
+    return Response(metricas.exportar(), mimetype="text/plain; version=0.0.4")
+
+
+# Consulta o cambia cada cuántas peticiones se perfila (cada=0 lo apaga)
+@app.route("/metrics/perfilador", methods=["GET", "POST"])
+def configurar_perfilador():
+    if metricas is None:
+        return jsonify({"ok": False, "msg": "Las métricas están desactivadas (BIBLIOTECA_METRICAS=1)."}), 404
+    if request.method == "POST":
+        cada = request.values.get("cada", type=int)
+        if cada is None or cada < 0:
+            return jsonify({"ok": False, "msg": "'cada' debe ser un entero mayor o igual a 0."}), 400
+        perfilador.cada = cada
+    return jsonify({"cada": perfilador.cada, "directorio": perfilador.directorio, "guardados": perfilador.guardados})
+
+
 # ========== GESTIÓN DE LIBROS ==========
 # Esta ruta maneja tanto GET (mostrar libros) como POST (agregar nuevo libro)
 @app.route("/libros", methods=["GET", "POST"])
@@ -59,95 +568,107 @@ def libros():
         genero = request.form["genero"]
         stock = int(request.form["stock"])  # Convertimos el stock a entero
 
-        # Creamos un nuevo objeto Libro
-        # El ID se calcula como la cantidad actual de libros + 1
-        nuevo_id = max([libro.id_libro for libro in biblioteca.libros]) + 1
-
-
+        # Creamos un nuevo objeto Libro, sin ID: lo asigna la biblioteca al
+        # agregarlo (el mayor ID actual + 1), así dos altas simultáneas no reciben el mismo
         nuevo_libro = Libro(
-            nuevo_id,
+            None,
             titulo,
             autor,
             genero,
             stock
         )
         # Agregamos el libro a la biblioteca
-        biblioteca.agregar_libro(nuevo_libro)
+        biblioteca.agregar_libros([nuevo_libro])
         # Redirigimos a la misma página para ver la lista actualizada
         return redirect(url_for("libros"))
 
     # Si la petición es GET, mostramos la lista de libros con filtros
     # Obtenemos los parámetros de búsqueda de la URL (si existen)
-    q = request.args.get("q", "").lower()  # Texto de búsqueda (convertido a minúsculas)
+    q = normalizar(request.args.get("q", ""))  # Texto de búsqueda (sin mayúsculas ni acentos)
     campo = request.args.get("campo", "titulo")  # Campo por el cual filtrar (por defecto: título)
     orden = request.args.get("orden", "Ascendente")  # Orden ascendente o descendente
 
-    # Si hay texto de búsqueda, filtramos los libros
-    if q:
-        # Filtramos libros donde el texto de búsqueda esté contenido en el campo especificado
-        books = [l for l in biblioteca.libros if q in getattr(l, campo).lower()]
-    else:
-        # Si no hay búsqueda, mostramos todos los libros
-        books = biblioteca.libros
-
     # Determinamos si el orden es descendente (True) o ascendente (False)
     reverse = orden == "Descendente"
-    # Ordenamos los libros por el campo especificado
-    books.sort(key=lambda l: getattr(l, campo).lower(), reverse=reverse)
 
-    # Renderizamos la plantilla HTML con los libros filtrados y ordenados
-    return render_template(
-        "libros.html",
-        books=books,
-        q=q,  # Pasamos el texto de búsqueda para mantenerlo en el input
-        campo=campo,  # Pasamos el campo seleccionado
-        orden=orden,  # Pasamos el orden seleccionado
-        active_page="libros"  # Indica qué página está activa en el menú
-    )
+    # Se muestra una sola página de la tabla ("limit" y "cursor" como en /buscar_libros)
+    try:
+        limite, desde = leer_paginacion()
+        validar_campo_libros(campo)
+    except (ValueError, ErrorBiblioteca) as error:
+        return str(error), 400
+    limite = limite or TAMANIO_PAGINA_HTML
+
+    def generar():
+        # Filtramos los libros donde el texto de búsqueda esté contenido en el campo especificado
+        # y los ordenamos por ese campo (sin texto de búsqueda se listan todos).
+        # Pedimos un libro de más para saber si hay otra página
+        total, books = biblioteca.consultar_libros(q, campo, reverse, desde, limite + 1)
+        books, siguiente = cortar_pagina(books, limite, lambda l: biblioteca.cursor_libro(l, campo))
+
+        # Renderizamos la plantilla HTML con las filas de la página
+        return render_template(
+            "libros.html",
+            filas=[fila_libro(l) for l in books],
+            total=total,  # Cantidad de libros que coinciden con la búsqueda
+            siguiente_cursor=siguiente,  # Desde dónde sigue "Cargar más" (None si no hay más)
+            q=q,  # Pasamos el texto de búsqueda para mantenerlo en el input
+            campo=campo,  # Pasamos el campo seleccionado
+            orden=orden,  # Pasamos el orden seleccionado
+            active_page="libros"  # Indica qué página está activa en el menú
+        )
+
+    # La misma búsqueda se sirve desde la caché mientras la biblioteca no cambie
+    return respuesta_cacheada(("libros", q, campo, orden, limite, desde), generar)
 
 # ========== BÚSQUEDA DINÁMICA DE LIBROS (AJAX) ==========
 # Esta ruta se usa para búsquedas en tiempo real sin recargar la página
 @app.route("/buscar_libros")
 def buscar_libros():
     # Obtenemos los parámetros de búsqueda de la URL
-    q = request.args.get("q", "").lower()
+    q = normalizar(request.args.get("q", ""))
     campo = request.args.get("campo", "titulo")
     orden = request.args.get("orden", "Ascendente")
 
-    # Filtramos según el texto de búsqueda
-    if q:
-        # Si hay búsqueda, filtramos por el campo especificado
-        libros_filtrados = [l for l in biblioteca.libros if q in getattr(l, campo).lower()]
-    else:
-        # Si no hay búsqueda, copiamos todos los libros
-        libros_filtrados = biblioteca.libros.copy()
+    # Parámetros opcionales de paginación (limit y cursor); un campo desconocido también es un 400
+    try:
+        limite, desde = leer_paginacion()
+        validar_campo_libros(campo)
+    except (ValueError, ErrorBiblioteca) as error:
+        return jsonify({"ok": False, "msg": str(error)}), 400
 
     # Determinamos la dirección del ordenamiento
     reverse = True if orden == "Descendente" else False
-    # Ordenamos los resultados
-    libros_filtrados.sort(key=lambda l: getattr(l, campo).lower(), reverse=reverse)
-
-    # Devolvemos los resultados en formato JSON para que JavaScript los procese
-    return jsonify([
-        {
-            "id_libro": l.id_libro,
-            "titulo": l.titulo,
-            "autor": l.autor,
-            "genero": l.genero,
-            "stock": l.stock,
-            "prestados": l.prestados
-        }
-        for l in libros_filtrados
-    ])
+
+    def generar():
+        # La biblioteca filtra por el texto de búsqueda, ordena por el campo y corta la página,
+        # empezando después del cursor si se pidió una página siguiente
+        # (pedimos un registro de más para saber si hay otra página)
+        total, resultados = biblioteca.consultar_libros(
+            q, campo, reverse, desde, limite + 1 if limite else None
+        )
+
+        # Devolvemos los resultados en formato JSON (o NDJSON) para que JavaScript los procese
+        return responder_resultados(
+            resultados,
+            total,
+            libro_a_dict,
+            lambda l: biblioteca.cursor_libro(l, campo),
+            limite
+        )
+
+    # Cada tecla en el buscador repite consultas: las iguales se responden desde la caché
+    clave = ("buscar_libros", q, campo, reverse, limite, desde, request.args.get("formato"))
+    return respuesta_cacheada(clave, generar)
 
 
 # ========== EDITAR LIBRO ==========
 # Esta ruta maneja tanto GET (mostrar formulario) como POST (guardar cambios)
 @app.route("/editar/<int:id_libro>", methods=["GET", "POST"])
 def editar(id_libro):
-    # Buscamos el libro por su ID en la lista de libros
-    # next() devuelve el primer elemento que cumple la condición, o None si no encuentra
-    libro = next((l for l in biblioteca.libros if l.id_libro == id_libro), None)
+    # Buscamos el libro por su ID en el índice de la biblioteca
+    # obtener_libro() devuelve el libro, o None si no lo encuentra
+    libro = biblioteca.obtener_libro(id_libro)
     
     # Si no encontramos el libro, devolvemos error 404
     if not libro:
@@ -155,21 +676,18 @@ def editar(id_libro):
 
     # Si la petición es POST, guardamos los cambios
     if request.method == "POST":
-        # Actualizamos los campos básicos del libro
-        libro.titulo = request.form["titulo"]
-        libro.autor = request.form["autor"]
-        libro.genero = request.form["genero"]
-        
-        # Procesamos el stock de manera especial
-        nuevo_stock = int(request.form["stock"])
-        # Solo permitimos AUMENTAR el stock, no reducirlo
-        if nuevo_stock > libro.stock:
-            diferencia = nuevo_stock - libro.stock
-            libro.stock += diferencia  # Aumentamos el stock
-        else:
-            # Si intentan poner menos stock, lo mantenemos igual (no hacemos nada)
-            pass
-        
+        # Actualizamos los campos del libro a través de la biblioteca
+        # para que el índice de búsqueda quede al día.
+        # Solo se permite AUMENTAR el stock: si intentan poner menos,
+        # la biblioteca mantiene el actual (lo compara de forma atómica)
+        biblioteca.editar_libro(
+            libro,
+            request.form["titulo"],
+            request.form["autor"],
+            request.form["genero"],
+            int(request.form["stock"])
+        )
+
         # Redirigimos a la lista de libros
         return redirect(url_for("libros"))
 
@@ -181,7 +699,7 @@ def editar(id_libro):
 @app.route('/devolver_libro/<int:id_usuario>', methods=['GET'])
 def devolver_libro(id_usuario):
     # Buscamos el usuario por su ID
-    usuario = next((u for u in biblioteca.users if u.id_usuario == id_usuario), None)
+    usuario = biblioteca.obtener_usuario(id_usuario)
     
     # Si no existe el usuario, devolvemos error 404
     if not usuario:
@@ -194,48 +712,30 @@ def devolver_libro(id_usuario):
 # Procesa la devolución de un libro específico
 @app.route('/confirmar_devolucion/<int:id_usuario>/<int:id_libro>', methods=['POST'])
 def confirmar_devolucion(id_usuario, id_libro):
-    # Buscamos el usuario y el libro por sus IDs
-    usuario = next((u for u in biblioteca.users if u.id_usuario == id_usuario), None)
-    libro = next((l for l in biblioteca.libros if l.id_libro == id_libro), None)
-
-    # Si no encontramos el usuario o el libro, devolvemos error
-    if not usuario or not libro:
-        return jsonify({"ok": False, "msg": "Usuario o libro no encontrado"}), 404
-
-    # Verificamos que el usuario realmente tenga este libro prestado
-    if libro in usuario.libros:
-        # Removemos el libro de la lista de libros del usuario
-        usuario.libros.remove(libro)
-        # Llamamos al método devolver() del libro para actualizar su stock
-        libro.devolver()
-        # Devolvemos respuesta exitosa en JSON
-        return jsonify({"ok": True, "msg": f"El libro '{libro.titulo}' fue devuelto correctamente."})
-    else:
-        # Si el usuario no tiene este libro, devolvemos error
-        return jsonify({"ok": False, "msg": "El usuario no tiene este libro prestado."})
+    # La biblioteca verifica que existan el usuario y el libro y que el usuario
+    # realmente tenga este libro prestado, y hace la devolución en un solo paso
+    # (así dos devoluciones simultáneas no pueden devolver dos veces el mismo ejemplar)
+    try:
+        usuario, libro = biblioteca.devolver(id_usuario, id_libro)
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+
+    # Devolvemos respuesta exitosa en JSON
+    return jsonify({"ok": True, "msg": f"El libro '{libro.titulo}' fue devuelto correctamente."})
 
 
 # ========== ELIMINAR LIBRO ==========
 # Elimina un libro de la biblioteca (con validaciones)
 @app.route("/eliminar/<int:id_libro>", methods=["POST"])
 def eliminar(id_libro):
-    # Buscamos el libro por su ID
-    libro = next((l for l in biblioteca.libros if l.id_libro == id_libro), None)
-    
-    # Si no existe el libro, devolvemos error
-    if not libro:
-        return jsonify({"ok": False, "msg": "Libro no encontrado"}), 404
-    
-    # VALIDACIÓN IMPORTANTE: No se puede eliminar un libro si está prestado
-    if libro.prestados > 0:
-        # Devolvemos un mensaje de error indicando cuántos ejemplares están prestados
-        return jsonify({
-            "ok": False, 
-            "msg": f"No se puede eliminar el libro '{libro.titulo}' porque tiene {libro.prestados} ejemplar(es) prestado(s)."
-        }), 400
-    
-    # Si el libro no está prestado, lo eliminamos de la lista
-    biblioteca.libros = [l for l in biblioteca.libros if l.id_libro != id_libro]
+    # VALIDACIÓN IMPORTANTE: No se puede eliminar un libro si está prestado.
+    # La biblioteca lo verifica y lo elimina en un solo paso; si no se puede,
+    # devolvemos el mensaje de error (libro inexistente o ejemplares prestados)
+    try:
+        biblioteca.eliminar(id_libro)
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+
     # Redirigimos a la lista de libros
     return redirect(url_for("libros"))
 
@@ -255,13 +755,9 @@ def usuarios():
         direccion = request.form.get("direccion", "").strip()
         nro_direccion = request.form.get("nro_direccion", "").strip()
 
-        nuevo_id = max([usuario.id_usuario for usuario in biblioteca.users]) + 1
-
-
-        # Creamos un nuevo objeto Usuario
-        # El ID se calcula como la cantidad actual de usuarios + 1
+        # Creamos un nuevo objeto Usuario, sin ID: como en /libros, lo asigna la biblioteca
         nuevo = Usuario(
-            nuevo_id,
+            None,
             nombre,
             apellido,
             dni,
@@ -270,113 +766,122 @@ def usuarios():
             nro_direccion
         )
         # Agregamos el usuario a la biblioteca
-        biblioteca.agregar_usuario(nuevo)
+        biblioteca.agregar_usuarios([nuevo])
         # Redirigimos a la página de usuarios
         return redirect(url_for("usuarios"))
 
     # Si la petición es GET, mostramos la lista de usuarios con filtros
     # Obtenemos los parámetros de búsqueda de la URL
-    q = request.args.get("q", "").lower()
+    q = normalizar(request.args.get("q", ""))
     campo = request.args.get("campo", "nombre")  # Por defecto filtramos por nombre
     orden = request.args.get("orden", "Ascendente")
 
-    # Creamos una copia de la lista de usuarios
-    users = biblioteca.users.copy()
-
-    # Aplicamos el filtro de búsqueda
-    if q:
-        users = [
-            u for u in users
-            # Buscamos en el campo especificado
-            if q in getattr(u, campo).lower()
-            # O si el campo es "libros", buscamos en los títulos de los libros del usuario
-            or (campo == "libros" and any(q in l.titulo.lower() for l in u.libros))
-        ]
-
-    # Ordenamos los usuarios
+    # Determinamos la dirección del ordenamiento
     reverse = orden == "Descendente"
-    # La función lambda maneja tanto strings como otros tipos de datos
-    users.sort(key=lambda u: getattr(u, campo).lower() if isinstance(getattr(u, campo), str) else str(getattr(u, campo)), reverse=reverse)
 
-    # Renderizamos la plantilla con los usuarios filtrados y ordenados
-    return render_template(
-        "usuarios.html",
-        users=users,
-        q=q,
-        campo=campo,
-        orden=orden,
-        active_page="usuarios"
-    )
+    # Igual que en /libros, se muestra una sola página de la tabla
+    try:
+        limite, desde = leer_paginacion()
+    except ValueError as error:
+        return str(error), 400
+    limite = limite or TAMANIO_PAGINA_HTML
+
+    def generar():
+        # La biblioteca filtra por el campo especificado (nombre, apellido, DNI o
+        # títulos de los libros prestados) y ordena usando sus índices de orden
+        total, users = biblioteca.consultar_usuarios(q, campo, reverse, desde, limite + 1)
+        users, siguiente = cortar_pagina(users, limite, lambda u: biblioteca.cursor_usuario(u, campo))
+
+        # Renderizamos la plantilla con las filas de la página
+        return render_template(
+            "usuarios.html",
+            filas=[fila_usuario(u) for u in users],
+            total=total,
+            siguiente_cursor=siguiente,
+            q=q,
+            campo=campo,
+            orden=orden,
+            active_page="usuarios"
+        )
+
+    return respuesta_cacheada(("usuarios", q, campo, orden, limite, desde), generar)
 
 # ========== BÚSQUEDA DINÁMICA DE USUARIOS (AJAX) ==========
 # Esta ruta se usa para búsquedas en tiempo real sin recargar la página
 @app.route('/buscar_usuarios')
 def buscar_usuarios():
     # Obtenemos los parámetros de búsqueda
-    q = request.args.get('q', '').lower()
+    q = normalizar(request.args.get('q', ''))
     campo = request.args.get('campo', 'nombre')
     orden = request.args.get('orden', 'Ascendente')
 
-    # Obtenemos todos los usuarios
-    users = biblioteca.users
-    filtrados = []
-
-    # Filtramos según el campo seleccionado
-    for u in users:
-        # Si buscamos por nombre
-        if campo == "nombre" and q in u.nombre.lower():
-            filtrados.append(u)
-        # Si buscamos por apellido
-        elif campo == "apellido" and q in u.apellido.lower():
-            filtrados.append(u)
-        # Si buscamos por DNI (convertimos a string para buscar)
-        elif campo == "dni" and q in str(u.dni):
-            filtrados.append(u)
-        # Si buscamos por libros, buscamos en los títulos de los libros del usuario
-        elif campo == "libros" and any(q in l.titulo.lower() for l in u.libros):
-            filtrados.append(u)
+    # Parámetros opcionales de paginación (limit y cursor)
+    try:
+        limite, desde = leer_paginacion()
+    except ValueError as error:
+        return jsonify({"ok": False, "msg": str(error)}), 400
 
     # Determinamos la dirección del ordenamiento
     reverse = orden == "Descendente"
 
-    # Ordenamos los resultados filtrados
-    # Si el campo es nombre, apellido o dni lo usamos, sino ordenamos por nombre
-    filtrados.sort(key=lambda x: getattr(x, campo if campo in ["nombre", "apellido", "dni"] else "nombre"), reverse=reverse)
-
-    # Devolvemos los resultados en formato JSON
-    return jsonify([
-        {
-            "id_usuario": u.id_usuario,
-            "nombre": u.nombre,
-            "apellido": u.apellido,
-            "dni": u.dni,
-            "telefono": u.telefono,
-            "direccion": u.direccion,
-            "nro_direccion": u.nro_direccion,
-            # Incluimos la lista de libros que tiene el usuario (título y autor de cada uno)
-            "libros": [{"titulo": l.titulo, "autor": l.autor} for l in u.libros]
-        } for u in filtrados
-    ])
+    def generar():
+        # La biblioteca filtra según el campo seleccionado:
+        # nombre, apellido, DNI o títulos de los libros que tiene prestados
+        # Si el campo es nombre, apellido o dni ordenamos por él, sino por nombre
+        total, resultados = biblioteca.consultar_usuarios(
+            q, campo, reverse, desde, limite + 1 if limite else None
+        )
+
+        # Devolvemos los resultados en formato JSON (o NDJSON)
+        return responder_resultados(
+            resultados,
+            total,
+            usuario_a_dict,
+            lambda u: biblioteca.cursor_usuario(u, campo),
+            limite
+        )
+
+    clave = ("buscar_usuarios", q, campo, reverse, limite, desde, request.args.get("formato"))
+    return respuesta_cacheada(clave, generar)
+
+# ========== AUTOCOMPLETAR (AJAX) ==========
+# Sugerencias para los buscadores: textos del campo que empiezan con lo escrito,
+# de los más prestados a los menos. No pasa por la caché de respuestas porque
+# el índice de prefijos ya responde en menos de un milisegundo
+@app.route('/autocompletar')
+def autocompletar():
+    q = request.args.get('q', '')
+    campo = request.args.get('campo', 'titulo')
+    try:
+        limite = int(request.args.get('limit', 10))
+        sugerencias = biblioteca.autocompletar(q, campo, limite)
+    except ValueError:
+        return jsonify({"ok": False, "msg": "El límite debe ser un número entero."}), 400
+    except ErrorBiblioteca as e:
+        return jsonify({"ok": False, "msg": str(e)}), e.codigo
+    return jsonify({"q": q, "campo": campo, "sugerencias": sugerencias})
 
 # ========== PRESTAR LIBRO - PASO 1: SELECCIONAR LIBRO ==========
 # Muestra la lista de libros disponibles para prestar a un usuario específico
 @app.route('/prestar_libro_usuario/<int:id_usuario>', methods=['GET'])
 def seleccionar_libro_prestamo(id_usuario):
     # Buscamos el usuario por su ID
-    usuario = next((u for u in biblioteca.users if u.id_usuario == id_usuario), None)
+    usuario = biblioteca.obtener_usuario(id_usuario)
     
     # Si no existe el usuario, devolvemos error 404
     if not usuario:
         return "Usuario no encontrado", 404
 
     # Filtramos solo los libros que tienen stock disponible (stock > 0)
-    libros_disponibles = [libro for libro in biblioteca.libros if libro.stock > 0]
+    libros_disponibles = biblioteca.libros_disponibles()
 
-    # Renderizamos la página con el usuario y los libros disponibles
+    # Renderizamos la página con el usuario y los libros disponibles;
+    # con los ids de los libros que ya tiene se marca "Ya prestado" sin recorrer su lista
     return render_template(
         'libros_disponibles.html',
         usuario=usuario,
-        libros=libros_disponibles
+        libros=libros_disponibles,
+        prestados=biblioteca.ids_libros_prestados(id_usuario)
     )
 
 
@@ -384,46 +889,142 @@ def seleccionar_libro_prestamo(id_usuario):
 # Procesa el préstamo de un libro a un usuario
 @app.route('/confirmar_prestamo/<int:id_usuario>/<int:id_libro>', methods=['POST'])
 def confirmar_prestamo(id_usuario, id_libro):
-    # Buscamos el usuario y el libro por sus IDs
-    usuario = next((u for u in biblioteca.users if u.id_usuario == id_usuario), None)
-    libro = next((l for l in biblioteca.libros if l.id_libro == id_libro), None)
-
-    # Si no encontramos el usuario o el libro, devolvemos error
-    if not usuario or not libro:
-        return jsonify({"ok": False, "msg": "Usuario o libro no encontrado."}), 404
-
-    # VALIDACIÓN 1: Verificar que el usuario no tenga ya este libro
-    if any(l.id_libro == id_libro for l in usuario.libros):
-        return jsonify({
-            "ok": False,
-            "msg": f"El usuario {usuario.nombre} ya tiene el libro '{libro.titulo}'."
-        }), 400
-
-    # VALIDACIÓN 2: Verificar que haya stock disponible
-    if libro.stock <= 0:
-        return jsonify({
-            "ok": False,
-            "msg": f"No hay ejemplares disponibles de '{libro.titulo}'."
-        }), 400
-
-    # Si todas las validaciones pasan, registramos el préstamo
-    # Agregamos el libro a la lista de libros del usuario
-    usuario.libros.append(libro)
-    # Llamamos al método prestar() del libro para actualizar su stock
-    libro.prestar()
-    
+    # La biblioteca hace las validaciones y el préstamo en un solo paso:
+    # - que existan el usuario y el libro
+    # - VALIDACIÓN 1: que el usuario no tenga ya este libro
+    # - VALIDACIÓN 2: que haya stock disponible
+    # Si alguna falla, devolvemos su mensaje de error
+    try:
+        usuario, libro = biblioteca.prestar(id_usuario, id_libro)
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+
     # Devolvemos respuesta exitosa
     return jsonify({
         "ok": True,
         "msg": f"Libro '{libro.titulo}' prestado correctamente a {usuario.nombre}."
     })
 
+# ========== PRÉSTAMOS Y DEVOLUCIONES EN LOTE (JSON) ==========
+# Para el mostrador de circulación y los buzones de devolución: muchos pares
+# (usuario, libro) en una sola petición, validados y aplicados en una pasada.
+# Ejemplo:
+#   curl -X POST localhost:5000/prestamos/lote -H "Content-Type: application/json" \
+#        -d '{"pares": [[1, 2], [1, 3]], "todo_o_nada": true}'
+@app.route('/prestamos/lote', methods=['POST'])
+def prestamos_lote():
+    try:
+        pares, todo_o_nada = leer_lote(request.get_json(silent=True))
+        aplicado, resultados = biblioteca.prestar_lote(pares, todo_o_nada)
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+    datos, estado = respuesta_lote(pares, aplicado, resultados, mensaje_prestamo)
+    return jsonify(datos), estado
+
+
+@app.route('/devoluciones/lote', methods=['POST'])
+def devoluciones_lote():
+    try:
+        pares, todo_o_nada = leer_lote(request.get_json(silent=True))
+        aplicado, resultados = biblioteca.devolver_lote(pares, todo_o_nada)
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+    datos, estado = respuesta_lote(pares, aplicado, resultados, mensaje_devolucion)
+    return jsonify(datos), estado
+
+# ========== QUIÉN TIENE UN LIBRO (JSON) ==========
+# Usuarios que tienen prestado un ejemplar del libro, con la fecha de cada préstamo.
+# Se responde con el índice libro -> usuarios, sin revisar los préstamos de todos
+@app.route('/prestatarios/<int:id_libro>')
+def prestatarios(id_libro):
+    libro = biblioteca.obtener_libro(id_libro)
+    if not libro:
+        return jsonify({"ok": False, "msg": "Libro no encontrado"}), 404
+
+    usuarios = []
+    for usuario in biblioteca.prestatarios(id_libro):
+        prestamo = biblioteca.prestamo(usuario.id_usuario, id_libro)
+        usuarios.append({
+            "id_usuario": usuario.id_usuario,
+            "nombre": usuario.nombre,
+            "apellido": usuario.apellido,
+            "fecha": prestamo.fecha.isoformat() if prestamo and prestamo.fecha else None,
+            "vence": prestamo.vence.isoformat() if prestamo and prestamo.vence else None,
+        })
+    return jsonify({"libro": libro_a_dict(libro), "usuarios": usuarios})
+
+# ========== PRÉSTAMOS VENCIDOS (JSON) ==========
+# Préstamos vigentes que vencen hasta "hasta" (fecha ISO; por defecto, ahora), del
+# más atrasado al menos. La biblioteca los tiene ordenados por vencimiento, así que
+# la consulta solo revisa los vencidos y no los préstamos de todos los usuarios.
+# Con "limit" se entregan solo los más atrasados; con "formato=ndjson", uno por línea.
+# Ejemplo (el informe de cada noche):
+#   curl "localhost:5000/prestamos/vencidos?formato=ndjson"
+@app.route('/prestamos/vencidos')
+def prestamos_vencidos():
+    try:
+        hasta = datetime.fromisoformat(request.args["hasta"]) if request.args.get("hasta") else datetime.now()
+    except ValueError:
+        return jsonify({"ok": False, "msg": "'hasta' debe ser una fecha ISO (ej: 2026-11-01)."}), 400
+    if hasta.tzinfo is not None:
+        # Las fechas de los préstamos están en la hora local, sin zona
+        hasta = hasta.astimezone().replace(tzinfo=None)
+    limite = request.args.get("limit", type=int)
+    vencidos = biblioteca.vencidos(hasta, max(limite, 1) if limite is not None else None)
+    return responder_resultados(iter(vencidos), len(vencidos), lambda p: vencido_a_dict(p, hasta), None, None)
+
+# ========== RESERVAS ==========
+# Un libro sin ejemplares disponibles se puede reservar: el usuario queda al final
+# de la fila de espera y, cuando se devuelve un ejemplar, se le presta enseguida
+# al primero de la fila (dentro de la misma devolución)
+@app.route('/reservar/<int:id_usuario>/<int:id_libro>', methods=['POST'])
+def reservar(id_usuario, id_libro):
+    try:
+        usuario, libro, lugar = biblioteca.reservar(id_usuario, id_libro)
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+    return jsonify({
+        "ok": True,
+        "lugar": lugar,
+        "msg": f"{usuario.nombre} reservó '{libro.titulo}' (lugar {lugar} en la fila)."
+    })
+
+
+@app.route('/cancelar_reserva/<int:id_usuario>/<int:id_libro>', methods=['POST'])
+def cancelar_reserva(id_usuario, id_libro):
+    try:
+        biblioteca.cancelar_reserva(id_usuario, id_libro)
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+    return jsonify({"ok": True, "msg": "La reserva fue cancelada."})
+
+
+# Fila de espera de un libro, del primero al último
+@app.route('/reservas/<int:id_libro>')
+def reservas_libro(id_libro):
+    libro = biblioteca.obtener_libro(id_libro)
+    if not libro:
+        return jsonify({"ok": False, "msg": "Libro no encontrado"}), 404
+    reservas = [
+        {"lugar": lugar, **reserva_a_dict(r)} for lugar, r in enumerate(biblioteca.reservas_de_libro(id_libro), 1)
+    ]
+    return jsonify({"libro": libro_a_dict(libro), "reservas": reservas})
+
+
+# Libros que espera un usuario
+@app.route('/reservas/usuario/<int:id_usuario>')
+def reservas_usuario(id_usuario):
+    if not biblioteca.obtener_usuario(id_usuario):
+        return jsonify({"ok": False, "msg": "Usuario no encontrado"}), 404
+    reservas = [reserva_a_dict(r) for r in biblioteca.reservas_de(id_usuario)]
+    return jsonify({"id_usuario": id_usuario, "reservas": reservas})
+
 # ========== EDITAR USUARIO - PASO 1: MOSTRAR FORMULARIO ==========
 # Muestra el formulario de edición con los datos actuales del usuario
 @app.route('/editar_usuario/<int:id_usuario>', methods=['GET'])
 def editar_usuario(id_usuario):
     # Buscamos el usuario por su ID
-    usuario = next((u for u in biblioteca.users if u.id_usuario == id_usuario), None)
+    usuario = biblioteca.obtener_usuario(id_usuario)
     
     # Si no existe el usuario, devolvemos error 404
     if not usuario:
@@ -437,18 +1038,22 @@ def editar_usuario(id_usuario):
 @app.route('/actualizar_usuario/<int:id_usuario>', methods=['POST'])
 def actualizar_usuario(id_usuario):
     # Buscamos el usuario por su ID
-    usuario = next((u for u in biblioteca.users if u.id_usuario == id_usuario), None)
+    usuario = biblioteca.obtener_usuario(id_usuario)
     
     # Si no existe el usuario, devolvemos error 404
     if not usuario:
         return "Usuario no encontrado", 404
 
-    # Actualizamos solo los campos editables
-    usuario.nombre = request.form['nombre']
-    usuario.apellido = request.form['apellido']
-    usuario.telefono = request.form['telefono']
-    usuario.direccion = request.form['direccion']
-    usuario.nro_direccion = request.form['nro_direccion']
+    # Actualizamos solo los campos editables (a través de la biblioteca,
+    # para que los índices de orden queden al día)
+    biblioteca.editar_usuario(
+        usuario,
+        request.form['nombre'],
+        request.form['apellido'],
+        request.form['telefono'],
+        request.form['direccion'],
+        request.form['nro_direccion']
+    )
 
     # NOTA: No se permite editar el DNI ni los libros prestados directamente
     # El DNI es único e inmutable, y los libros se manejan con préstamos/devoluciones
@@ -461,29 +1066,82 @@ def actualizar_usuario(id_usuario):
 # Elimina un usuario de la biblioteca (con validaciones)
 @app.route("/eliminar_usuario/<int:id_usuario>", methods=["POST"])
 def eliminar_usuario(id_usuario):
-    # Buscamos el usuario por su ID
-    usuario = next((u for u in biblioteca.users if u.id_usuario == id_usuario), None)
-    
-    # Si no existe el usuario, devolvemos error
-    if not usuario:
-        return jsonify({"ok": False, "msg": "Usuario no encontrado"}), 404
-    
-    # VALIDACIÓN IMPORTANTE: No se puede eliminar un usuario si tiene libros prestados
-    if len(usuario.libros) > 0:
-        # Creamos una lista con los títulos de los libros prestados
-        titulos = ", ".join([l.titulo for l in usuario.libros])
-        # Devolvemos un mensaje de error con los libros que debe devolver
-        return jsonify({
-            "ok": False,
-            "msg": f"No se puede eliminar al usuario {usuario.nombre} {usuario.apellido} porque tiene libro(s) prestado(s): {titulos}"
-        }), 400
-    
-    # Si el usuario no tiene libros prestados, lo eliminamos
-    biblioteca.eliminar_usuario(id_usuario)
+    # VALIDACIÓN IMPORTANTE: No se puede eliminar un usuario si tiene libros prestados.
+    # La biblioteca lo verifica y lo elimina en un solo paso; si no se puede,
+    # el mensaje de error incluye los libros que debe devolver
+    try:
+        biblioteca.eliminar_usuario(id_usuario)
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+
     # Redirigimos a la lista de usuarios
     return redirect(url_for("usuarios"))
 
 
+# ========== IMPORTACIÓN MASIVA ==========
+# Recibe un archivo CSV o JSONL con libros o usuarios y los agrega en lotes.
+# El archivo puede venir como campo "archivo" de un formulario o como cuerpo de la petición;
+# el formato se toma del parámetro "formato" o de la extensión del archivo.
+# Ejemplo: curl -F archivo=@libros.csv "http://localhost:5000/importar?tipo=libros"
+@app.route("/importar", methods=["POST"])
+def importar_registros():
+    tipo = request.values.get("tipo", "libros")
+    archivo = request.files.get("archivo")
+    try:
+        formato = formato_de(archivo.filename if archivo else None, request.values.get("formato"))
+        # Se lee el archivo a medida que se procesa, sin cargarlo entero en memoria
+        texto = io.TextIOWrapper(archivo.stream if archivo else request.stream, encoding="utf-8-sig", newline="")
+        resultado = importar(biblioteca, texto, tipo, formato)
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+    except UnicodeDecodeError:
+        return jsonify({"ok": False, "msg": "El archivo debe estar codificado en UTF-8."}), 400
+    return jsonify({"ok": True, **resultado})
+
+
+# ========== EXPORTACIÓN MASIVA ==========
+# Descarga todos los libros o usuarios en CSV o JSONL; la respuesta se arma
+# mientras se envía, así exportar un catálogo grande no lo copia entero en memoria
+@app.route("/exportar")
+def exportar_registros():
+    tipo = request.args.get("tipo", "libros")
+    try:
+        formato = formato_de(None, request.args.get("formato", "csv"))
+        bloques = exportar(biblioteca, tipo, formato)
+        # Pedimos el primer bloque ya, para responder con error si el tipo es inválido
+        primero = next(bloques, "")
+    except ErrorBiblioteca as error:
+        return jsonify({"ok": False, "msg": str(error)}), error.codigo
+
+    def generar():
+        yield primero
+        yield from bloques
+
+    return Response(
+        generar(),
+        mimetype="text/csv" if formato == "csv" else "application/x-ndjson",
+        headers={"Content-Disposition": f"attachment; filename={tipo}.{formato}"},
+    )
+
+
+# Lo mismo desde la línea de comandos, con el almacenamiento configurado por entorno:
+#   flask --app app importar libros catalogo.csv
+@app.cli.command("importar")
+@click.argument("tipo", type=click.Choice(["libros", "usuarios"]))
+@click.argument("ruta", type=click.Path(exists=True, dir_okay=False))
+@click.option("--formato", type=click.Choice(["csv", "jsonl"]), help="Por defecto, según la extensión.")
+def importar_comando(tipo, ruta, formato):
+    try:
+        formato = formato_de(ruta, formato)
+    except ErrorBiblioteca as error:
+        raise click.UsageError(str(error))
+    with open(ruta, encoding="utf-8-sig", newline="") as archivo:
+        resultado = importar(biblioteca, archivo, tipo, formato)
+    click.echo(f"{resultado['importados']} {tipo} importados, {resultado['errores']} filas con errores")
+    for error in resultado["detalle_errores"]:
+        click.echo(f"  línea {error['linea']}: {error['error']}")
+
+
 # ========== INICIAR LA APLICACIÓN ==========
 # Este bloque solo se ejecuta si el archivo se ejecuta directamente (no si se importa)
 if __name__ == "__main__":
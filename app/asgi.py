@@ -0,0 +1,602 @@
+# Punto de entrada ASGI de la biblioteca.
+# Las rutas JSON que usan los buscadores en vivo, los botones de préstamo,
+# devolución y baja, y los préstamos y devoluciones en lote, se atienden acá
+# con manejadores async, sin pasar por Flask.
+# El resto (páginas HTML, importar, exportar, etc.) se delega a la aplicación
+# Flask de app.py, que corre en un hilo aparte. Las dos partes comparten la
+# misma biblioteca, la caché de respuestas y las métricas.
+#
+# Uso:
+#   uvicorn asgi:app                     (si uvicorn está instalado)
+#   python asgi.py [host] [puerto]       (usa uvicorn si está; si no, el servidor incluido)
+# El servidor incluido es HTTP/1.1 con conexiones persistentes sobre asyncio:
+# un solo proceso atiende miles de clientes conectados a la vez.
+import asyncio
+import io
+import json
+import re
+import sys
+import time
+import traceback
+import zlib
+from http import HTTPStatus
+from itertools import chain, islice
+from urllib.parse import parse_qsl, unquote
+
+import app as aplicacion
+from models.biblioteca import ErrorBiblioteca, validar_campo_libros
+from models.biblioteca_sqlite import BibliotecaSQLite
+from models.texto import normalizar
+from utils.cache import RespuestaCacheada
+
+
+# ---------- Petición y respuesta ----------
+
+class Peticion:
+    __slots__ = ("metodo", "ruta", "args", "headers", "cuerpo")
+
+    def __init__(self, scope, cuerpo):
+        self.metodo = scope["method"]
+        self.ruta = scope["path"]
+        self.args = dict(parse_qsl(scope.get("query_string", b"").decode("latin-1")))
+        self.headers = {k.decode("latin-1").lower(): v.decode("latin-1") for k, v in scope.get("headers", ())}
+        self.cuerpo = cuerpo
+
+    def entero(self, nombre):
+        # Igual que request.args.get(nombre, type=int) en Flask: None si falta o no es un número
+        try:
+            return int(self.args[nombre])
+        except (KeyError, ValueError):
+            return None
+
+    def etags(self):
+        # Valores de If-None-Match, sin comillas ni prefijo W/
+        valor = self.headers.get("if-none-match", "")
+        return {e.strip().removeprefix("W/").strip('"') for e in valor.split(",") if e.strip()}
+
+
+def respuesta_json(datos, estado=200, headers=()):
+    cuerpo = json.dumps(datos, ensure_ascii=False, separators=(",", ":")).encode()
+    return estado, [("content-type", "application/json"), *headers], cuerpo
+
+
+def redireccion(destino):
+    return 302, [("location", destino), ("content-type", "text/plain")], b""
+
+
+# ---------- Acceso a la biblioteca ----------
+
+async def ejecutar(funcion, *args):
+    # Todas las operaciones van a un hilo, también en memoria: aunque tardan
+    # microsegundos, las búsquedas y los ordenamientos esperan el lock de escritura,
+    # que /importar (carga_masiva) y compactar() retienen durante segundos.
+    # Con SQLite (disco) o con el estado compartido (socket al servidor de estado)
+    # además cada llamada puede esperar E/S
+    return await asyncio.to_thread(funcion, *args)
+
+
+async def cacheada(peticion, clave, generar):
+    # Igual que respuesta_cacheada() en app.py: ETag por generación y caché de
+    # respuestas compartida (con claves propias, porque el JSON se serializa distinto)
+    biblioteca = aplicacion.biblioteca
+    generacion = biblioteca.generacion
+    etag = f"{aplicacion.PREFIJO_ETAG}-{generacion:x}-{zlib.crc32(repr(clave).encode()):08x}"
+    header_etag = ("etag", f'"{etag}"')
+    if etag in peticion.etags():
+        aplicacion.cache.contar_no_modificado()
+        return 304, [header_etag], b""
+
+    entrada = aplicacion.cache.obtener(clave, generacion)
+    if entrada is not None:
+        headers = [("content-type", entrada.mimetype), *entrada.headers.items(), header_etag]
+        return 200, headers, entrada.cuerpo
+
+    estado, headers, cuerpo = await ejecutar(generar)
+    headers.append(header_etag)
+    if estado == 200 and isinstance(cuerpo, bytes):
+        tipo = next(v for k, v in headers if k == "content-type")
+        extra = {k: v for k, v in headers if k.startswith("x-")}
+        aplicacion.cache.guardar(clave, generacion, RespuestaCacheada(cuerpo, tipo, extra))
+    return estado, headers, cuerpo
+
+
+def leer_paginacion(peticion):
+    # Igual que leer_paginacion() en app.py
+    limite = peticion.entero("limit")
+    if limite is not None:
+        limite = min(max(limite, 1), aplicacion.LIMITE_MAXIMO)
+    cursor = peticion.args.get("cursor")
+    if not cursor:
+        return limite, None
+    desde = aplicacion.decodificar_cursor(cursor)
+    if desde is None:
+        raise ValueError("Cursor inválido.")
+    return limite, desde
+
+
+def responder_resultados(registros, total, a_dict, cursor_de, limite, formato):
+    # Igual que responder_resultados() en app.py. Se llama en un hilo (ver ejecutar());
+    # con SQLite el NDJSON se arma completo ahí en lugar de leerse desde el bucle
+    headers = [("x-total-count", str(total))]
+    if limite:
+        pagina = list(islice(registros, limite))
+        if len(pagina) == limite and next(registros, None) is not None:
+            headers.append(("x-siguiente-cursor", aplicacion.codificar_cursor(cursor_de(pagina[-1]))))
+        registros = iter(pagina)
+
+    if formato == "ndjson":
+        lineas = (json.dumps(a_dict(r), ensure_ascii=False) + "\n" for r in registros)
+        if isinstance(aplicacion.biblioteca, BibliotecaSQLite):
+            lineas = list(lineas)
+        else:
+            # En memoria el resto se lee desde el bucle; la primera línea se arma acá
+            # porque ordenar el resultado de una búsqueda toma el lock de escritura
+            primera = next(lineas, None)
+            lineas = chain(() if primera is None else (primera,), lineas)
+        return 200, [("content-type", "application/x-ndjson"), *headers], lineas
+    return respuesta_json([a_dict(r) for r in registros], headers=headers)
+
+
+# ---------- Manejadores ----------
+
+async def buscar_libros(peticion):
+    q = normalizar(peticion.args.get("q", ""))
+    campo = peticion.args.get("campo", "titulo")
+    reverse = peticion.args.get("orden", "Ascendente") == "Descendente"
+    try:
+        limite, desde = leer_paginacion(peticion)
+        validar_campo_libros(campo)
+    except (ValueError, ErrorBiblioteca) as error:
+        return respuesta_json({"ok": False, "msg": str(error)}, 400)
+    formato = peticion.args.get("formato")
+
+    def generar():
+        biblioteca = aplicacion.biblioteca
+        total, resultados = biblioteca.consultar_libros(q, campo, reverse, desde, limite + 1 if limite else None)
+        return responder_resultados(
+            resultados, total, aplicacion.libro_a_dict, lambda l: biblioteca.cursor_libro(l, campo), limite, formato
+        )
+
+    return await cacheada(peticion, ("asgi", "buscar_libros", q, campo, reverse, limite, desde, formato), generar)
+
+
+async def buscar_usuarios(peticion):
+    q = normalizar(peticion.args.get("q", ""))
+    campo = peticion.args.get("campo", "nombre")
+    reverse = peticion.args.get("orden", "Ascendente") == "Descendente"
+    try:
+        limite, desde = leer_paginacion(peticion)
+    except ValueError as error:
+        return respuesta_json({"ok": False, "msg": str(error)}, 400)
+    formato = peticion.args.get("formato")
+
+    def generar():
+        biblioteca = aplicacion.biblioteca
+        total, resultados = biblioteca.consultar_usuarios(q, campo, reverse, desde, limite + 1 if limite else None)
+        return responder_resultados(
+            resultados, total, aplicacion.usuario_a_dict, lambda u: biblioteca.cursor_usuario(u, campo), limite, formato
+        )
+
+    return await cacheada(peticion, ("asgi", "buscar_usuarios", q, campo, reverse, limite, desde, formato), generar)
+
+
+async def autocompletar(peticion):
+    q = peticion.args.get("q", "")
+    campo = peticion.args.get("campo", "titulo")
+    try:
+        limite = int(peticion.args.get("limit", 10))
+        sugerencias = await ejecutar(aplicacion.biblioteca.autocompletar, q, campo, limite)
+    except ValueError:
+        return respuesta_json({"ok": False, "msg": "El límite debe ser un número entero."}, 400)
+    except ErrorBiblioteca as error:
+        return respuesta_json({"ok": False, "msg": str(error)}, error.codigo)
+    return respuesta_json({"q": q, "campo": campo, "sugerencias": sugerencias})
+
+
+async def estadisticas(peticion):
+    return respuesta_json(await ejecutar(aplicacion.biblioteca.estadisticas))
+
+
+async def confirmar_prestamo(peticion, id_usuario, id_libro):
+    try:
+        usuario, libro = await ejecutar(aplicacion.biblioteca.prestar, id_usuario, id_libro)
+    except ErrorBiblioteca as error:
+        return respuesta_json({"ok": False, "msg": str(error)}, error.codigo)
+    return respuesta_json({"ok": True, "msg": f"Libro '{libro.titulo}' prestado correctamente a {usuario.nombre}."})
+
+
+async def confirmar_devolucion(peticion, id_usuario, id_libro):
+    try:
+        usuario, libro = await ejecutar(aplicacion.biblioteca.devolver, id_usuario, id_libro)
+    except ErrorBiblioteca as error:
+        return respuesta_json({"ok": False, "msg": str(error)}, error.codigo)
+    return respuesta_json({"ok": True, "msg": f"El libro '{libro.titulo}' fue devuelto correctamente."})
+
+
+async def lote(peticion, operacion, mensaje):
+    # Como /prestamos/lote y /devoluciones/lote en app.py
+    try:
+        datos = json.loads(peticion.cuerpo)
+    except ValueError:
+        datos = None
+    try:
+        pares, todo_o_nada = aplicacion.leer_lote(datos)
+        aplicado, resultados = await ejecutar(getattr(aplicacion.biblioteca, operacion), pares, todo_o_nada)
+    except ErrorBiblioteca as error:
+        return respuesta_json({"ok": False, "msg": str(error)}, error.codigo)
+    return respuesta_json(*aplicacion.respuesta_lote(pares, aplicado, resultados, mensaje))
+
+
+async def prestamos_lote(peticion):
+    return await lote(peticion, "prestar_lote", aplicacion.mensaje_prestamo)
+
+
+async def devoluciones_lote(peticion):
+    return await lote(peticion, "devolver_lote", aplicacion.mensaje_devolucion)
+
+
+async def eventos(peticion):
+    # Como /eventos en app.py, pero esperando en el bucle de eventos: miles de
+    # clientes conectados no ocupan un hilo cada uno. La biblioteca publica desde
+    # otros hilos, así que el aviso llega con call_soon_threadsafe. Si el cliente
+    # lee más lento de lo que se publica, drain() frena el envío, su cola se llena
+    # y recibe "reiniciar" en vez de acumular eventos en memoria
+    try:
+        tipos, desde = aplicacion.leer_suscripcion(peticion.args.get("tipos"), peticion.headers.get("last-event-id"))
+    except ErrorBiblioteca as error:
+        return respuesta_json({"ok": False, "msg": str(error)}, error.codigo)
+    bucle = asyncio.get_running_loop()
+    hay = asyncio.Event()
+
+    def avisar():
+        try:
+            bucle.call_soon_threadsafe(hay.set)
+        except RuntimeError:
+            # El bucle ya se cerró (el servidor se está deteniendo)
+            pass
+
+    suscripcion = aplicacion.canal.suscribir(tipos, desde, avisar)
+    if suscripcion is None:
+        return respuesta_json({"ok": False, "msg": "Hay demasiados clientes conectados."}, 503)
+
+    async def generar():
+        try:
+            yield aplicacion.INICIO_EVENTOS
+            while True:
+                try:
+                    await asyncio.wait_for(hay.wait(), aplicacion.ESPERA_EVENTOS)
+                except asyncio.TimeoutError:
+                    pass
+                hay.clear()
+                yield suscripcion.texto(*suscripcion.tomar()) or ": ping\n\n"
+        finally:
+            aplicacion.canal.cancelar(suscripcion)
+
+    headers = [("content-type", "text/event-stream; charset=utf-8"), *aplicacion.HEADERS_EVENTOS.items()]
+    return 200, headers, generar()
+
+
+async def eliminar(peticion, id_libro):
+    # Como en app.py: si se pudo eliminar se vuelve al listado (el formulario sigue la redirección)
+    try:
+        await ejecutar(aplicacion.biblioteca.eliminar, id_libro)
+    except ErrorBiblioteca as error:
+        return respuesta_json({"ok": False, "msg": str(error)}, error.codigo)
+    return redireccion("/libros")
+
+
+async def eliminar_usuario(peticion, id_usuario):
+    try:
+        await ejecutar(aplicacion.biblioteca.eliminar_usuario, id_usuario)
+    except ErrorBiblioteca as error:
+        return respuesta_json({"ok": False, "msg": str(error)}, error.codigo)
+    return redireccion("/usuarios")
+
+
+# (método, expresión de la ruta, regla como la escribe Flask para las métricas, manejador).
+# Los grupos numéricos de la expresión se pasan al manejador como enteros
+RUTAS = [
+    ("GET", re.compile(r"/buscar_libros"), "/buscar_libros", buscar_libros),
+    ("GET", re.compile(r"/buscar_usuarios"), "/buscar_usuarios", buscar_usuarios),
+    ("GET", re.compile(r"/autocompletar"), "/autocompletar", autocompletar),
+    ("GET", re.compile(r"/estadisticas"), "/estadisticas", estadisticas),
+    ("GET", re.compile(r"/eventos"), "/eventos", eventos),
+    ("POST", re.compile(r"/confirmar_prestamo/(\d+)/(\d+)"),
+     "/confirmar_prestamo/<int:id_usuario>/<int:id_libro>", confirmar_prestamo),
+    ("POST", re.compile(r"/confirmar_devolucion/(\d+)/(\d+)"),
+     "/confirmar_devolucion/<int:id_usuario>/<int:id_libro>", confirmar_devolucion),
+    ("POST", re.compile(r"/prestamos/lote"), "/prestamos/lote", prestamos_lote),
+    ("POST", re.compile(r"/devoluciones/lote"), "/devoluciones/lote", devoluciones_lote),
+    ("POST", re.compile(r"/eliminar/(\d+)"), "/eliminar/<int:id_libro>", eliminar),
+    ("POST", re.compile(r"/eliminar_usuario/(\d+)"), "/eliminar_usuario/<int:id_usuario>", eliminar_usuario),
+]
+
+
+def buscar_ruta(metodo, ruta):
+    for metodo_ruta, expresion, regla, manejador in RUTAS:
+        if metodo_ruta == metodo:
+            coincidencia = expresion.fullmatch(ruta)
+            if coincidencia:
+                return regla, manejador, [int(g) for g in coincidencia.groups()]
+    return None, None, None
+
+
+# ---------- Aplicación ASGI ----------
+
+async def leer_cuerpo(receive):
+    partes = []
+    while True:
+        mensaje = await receive()
+        if mensaje["type"] == "http.disconnect":
+            break
+        partes.append(mensaje.get("body", b""))
+        if not mensaje.get("more_body"):
+            break
+    return b"".join(partes)
+
+
+async def enviar(send, estado, headers, cuerpo, receive):
+    await send({
+        "type": "http.response.start",
+        "status": estado,
+        "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in headers],
+    })
+    if isinstance(cuerpo, bytes):
+        await send({"type": "http.response.body", "body": cuerpo})
+        return
+    if hasattr(cuerpo, "__aiter__"):
+        await enviar_flujo(send, receive, cuerpo)
+        return
+    # Respuesta en partes (NDJSON): cada línea se envía apenas está lista
+    for parte in cuerpo:
+        await send({"type": "http.response.body", "body": parte.encode(), "more_body": True})
+    await send({"type": "http.response.body", "body": b""})
+
+
+async def enviar_flujo(send, receive, cuerpo):
+    # Flujo sin fin (/eventos): se corta cuando el servidor avisa que el cliente se
+    # desconectó (http.disconnect) o cuando send falla al escribirle
+    async def copiar():
+        async for parte in cuerpo:
+            await send({"type": "http.response.body", "body": parte.encode(), "more_body": True})
+
+    copia = asyncio.ensure_future(copiar())
+    desconexion = asyncio.ensure_future(receive())
+    try:
+        await asyncio.wait({copia, desconexion}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        copia.cancel()
+        desconexion.cancel()
+        await cuerpo.aclose()
+    if copia.done() and not copia.cancelled() and copia.exception() is not None:
+        raise copia.exception()
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        while True:
+            mensaje = await receive()
+            if mensaje["type"] == "lifespan.startup":
+                await send({"type": "lifespan.startup.complete"})
+            elif mensaje["type"] == "lifespan.shutdown":
+                await send({"type": "lifespan.shutdown.complete"})
+                return
+    if scope["type"] != "http":
+        return
+
+    regla, manejador, parametros = buscar_ruta(scope["method"], scope["path"])
+    cuerpo = await leer_cuerpo(receive)
+    if manejador is None:
+        await delegar_a_flask(scope, cuerpo, send)
+        return
+
+    inicio = time.perf_counter()
+    try:
+        estado, headers, contenido = await manejador(Peticion(scope, cuerpo), *parametros)
+    except Exception:
+        traceback.print_exc()
+        estado, headers, contenido = respuesta_json({"ok": False, "msg": "Error interno del servidor."}, 500)
+    await enviar(send, estado, headers, contenido, receive)
+    metricas = aplicacion.metricas
+    if metricas is not None:
+        etiquetas = (("ruta", regla), ("metodo", scope["method"]))
+        duracion = time.perf_counter() - inicio
+        metricas.observar("biblioteca_peticion_segundos", duracion, etiquetas)
+        metricas.observar("biblioteca_manejador_segundos", duracion, etiquetas)
+        metricas.contar("biblioteca_peticiones_total", etiquetas + (("estado", estado),))
+
+
+# ---------- Rutas de Flask ----------
+
+def entorno_wsgi(scope, cuerpo):
+    servidor = scope.get("server") or ("localhost", 80)
+    entorno = {
+        "REQUEST_METHOD": scope["method"],
+        "SCRIPT_NAME": scope.get("root_path", ""),
+        "PATH_INFO": scope["path"],
+        "QUERY_STRING": scope.get("query_string", b"").decode("latin-1"),
+        "SERVER_NAME": servidor[0],
+        "SERVER_PORT": str(servidor[1]),
+        "SERVER_PROTOCOL": f"HTTP/{scope.get('http_version', '1.1')}",
+        "REMOTE_ADDR": (scope.get("client") or ("", 0))[0],
+        "wsgi.version": (1, 0),
+        "wsgi.url_scheme": scope.get("scheme", "http"),
+        "wsgi.input": io.BytesIO(cuerpo),
+        "wsgi.errors": sys.stderr,
+        "wsgi.multithread": True,
+        "wsgi.multiprocess": False,
+        "wsgi.run_once": False,
+        "CONTENT_LENGTH": str(len(cuerpo)),
+    }
+    for nombre, valor in scope.get("headers", ()):
+        nombre = nombre.decode("latin-1").upper().replace("-", "_")
+        valor = valor.decode("latin-1")
+        if nombre == "CONTENT_TYPE":
+            entorno["CONTENT_TYPE"] = valor
+        elif nombre != "CONTENT_LENGTH":
+            clave = f"HTTP_{nombre}"
+            entorno[clave] = f"{entorno[clave]},{valor}" if clave in entorno else valor
+    return entorno
+
+
+async def delegar_a_flask(scope, cuerpo, send):
+    # La aplicación WSGI corre en el pool de hilos; su respuesta se reenvía por
+    # partes, así una exportación grande no se arma entera en memoria
+    bucle = asyncio.get_running_loop()
+    inicio = {}
+
+    def start_response(estado, headers, exc_info=None):
+        inicio["estado"] = int(estado.split(" ", 1)[0])
+        inicio["headers"] = headers
+
+    resultado = await bucle.run_in_executor(None, aplicacion.app, entorno_wsgi(scope, cuerpo), start_response)
+    iterador = iter(resultado)
+    try:
+        parte = await bucle.run_in_executor(None, next, iterador, None)
+        await send({
+            "type": "http.response.start",
+            "status": inicio["estado"],
+            "headers": [(k.lower().encode("latin-1"), v.encode("latin-1")) for k, v in inicio["headers"]],
+        })
+        while parte is not None:
+            if parte:
+                await send({"type": "http.response.body", "body": parte, "more_body": True})
+            parte = await bucle.run_in_executor(None, next, iterador, None)
+        await send({"type": "http.response.body", "body": b""})
+    finally:
+        if hasattr(resultado, "close"):
+            await bucle.run_in_executor(None, resultado.close)
+
+
+# ---------- Servidor incluido ----------
+
+class ConexionHTTP:
+    # Atiende una conexión HTTP/1.1: lee peticiones una tras otra sobre el mismo
+    # socket (keep-alive) y pasa cada una a la aplicación ASGI
+    def __init__(self, aplicacion_asgi, lector, escritor):
+        self.aplicacion_asgi = aplicacion_asgi
+        self.lector = lector
+        self.escritor = escritor
+
+    async def atender(self):
+        try:
+            while await self.atender_peticion():
+                pass
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            self.escritor.close()
+
+    async def atender_peticion(self):
+        linea = await self.lector.readline()
+        if not linea.strip():
+            return False
+        try:
+            metodo, objetivo, version = linea.decode("latin-1").split()
+        except ValueError:
+            return False
+        headers = []
+        while True:
+            linea = await self.lector.readline()
+            if linea in (b"\r\n", b"\n", b""):
+                break
+            nombre, _, valor = linea.decode("latin-1").partition(":")
+            headers.append((nombre.strip().lower().encode("latin-1"), valor.strip().encode("latin-1")))
+        valores = dict(headers)
+        largo = int(valores.get(b"content-length", 0) or 0)
+        cuerpo = await self.lector.readexactly(largo) if largo else b""
+        conexion = valores.get(b"connection", b"").lower()
+        seguir = conexion != b"close" if version == "HTTP/1.1" else conexion == b"keep-alive"
+
+        ruta, _, consulta = objetivo.partition("?")
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": version.removeprefix("HTTP/"),
+            "method": metodo.upper(),
+            "scheme": "http",
+            "path": unquote(ruta),
+            "raw_path": ruta.encode("latin-1"),
+            "query_string": consulta.encode("latin-1"),
+            "root_path": "",
+            "headers": headers,
+            "client": self.escritor.get_extra_info("peername"),
+            "server": self.escritor.get_extra_info("sockname"),
+        }
+        recibido = False
+        # Como pide ASGI, después del cuerpo receive() espera hasta que termine la respuesta.
+        # Una desconexión del cliente se detecta cuando falla la escritura
+        terminada = asyncio.Event()
+
+        async def receive():
+            nonlocal recibido
+            if not recibido:
+                recibido = True
+                return {"type": "http.request", "body": cuerpo, "more_body": False}
+            await terminada.wait()
+            return {"type": "http.disconnect"}
+
+        respuesta = {"en_partes": False}
+
+        async def send(mensaje):
+            if mensaje["type"] == "http.response.start":
+                respuesta["inicio"] = mensaje
+                return
+            cuerpo_parte = mensaje.get("body", b"")
+            if "inicio" in respuesta:
+                inicio = respuesta.pop("inicio")
+                nombres = {k.lower() for k, _ in inicio["headers"]}
+                lineas = [f"HTTP/1.1 {inicio['status']} {razon(inicio['status'])}".encode()]
+                lineas += [k + b": " + v for k, v in inicio["headers"]]
+                if b"content-length" not in nombres:
+                    if mensaje.get("more_body"):
+                        respuesta["en_partes"] = True
+                        lineas.append(b"transfer-encoding: chunked")
+                    else:
+                        lineas.append(b"content-length: " + str(len(cuerpo_parte)).encode())
+                lineas.append(b"connection: keep-alive" if seguir else b"connection: close")
+                self.escritor.write(b"\r\n".join(lineas) + b"\r\n\r\n")
+            if respuesta["en_partes"]:
+                if cuerpo_parte:
+                    self.escritor.write(f"{len(cuerpo_parte):x}\r\n".encode() + cuerpo_parte + b"\r\n")
+                if not mensaje.get("more_body"):
+                    self.escritor.write(b"0\r\n\r\n")
+            elif cuerpo_parte:
+                self.escritor.write(cuerpo_parte)
+            if not mensaje.get("more_body"):
+                terminada.set()
+            await self.escritor.drain()
+
+        await self.aplicacion_asgi(scope, receive, send)
+        return seguir
+
+
+def razon(estado):
+    try:
+        return HTTPStatus(estado).phrase
+    except ValueError:
+        return ""
+
+
+async def servir(aplicacion_asgi=app, host="127.0.0.1", puerto=8000, listo=None):
+    # listo: función opcional que recibe el puerto (útil con puerto=0)
+    async def atender(lector, escritor):
+        await ConexionHTTP(aplicacion_asgi, lector, escritor).atender()
+
+    servidor = await asyncio.start_server(atender, host, puerto, backlog=4096)
+    if listo is not None:
+        listo(servidor.sockets[0].getsockname()[1])
+    async with servidor:
+        await servidor.serve_forever()
+
+
+if __name__ == "__main__":
+    host = sys.argv[1] if len(sys.argv) > 1 else "127.0.0.1"
+    puerto = int(sys.argv[2]) if len(sys.argv) > 2 else 8000
+    try:
+        import uvicorn
+    except ImportError:
+        print(f"Sirviendo en http://{host}:{puerto} (servidor incluido; instalar uvicorn para producción)")
+        asyncio.run(servir(app, host, puerto))
+    else:
+        uvicorn.run(app, host=host, port=puerto)
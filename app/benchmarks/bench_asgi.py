@@ -0,0 +1,213 @@
+# Compara el servidor WSGI (werkzeug con un hilo por conexión, como app.run)
+# contra el punto de entrada ASGI (asgi.py con su servidor asyncio) cuando muchos
+# clientes mantienen la conexión abierta y buscan en vivo, como los buscadores
+# de libros.html y usuarios.html.
+# Cada servidor corre en su propio proceso con la misma biblioteca sintética;
+# los clientes son corrutinas de este proceso, cada una con su conexión keep-alive.
+# Como los clientes también son Python, con muchas conexiones parte del límite
+# puede ser el propio generador de carga: conviene mirar sobre todo las latencias.
+# Uso (desde la carpeta app):
+#   python -m benchmarks.bench_asgi [--libros 10000] [--clientes 100 1000] [--segundos 5] [--salida r.json]
+import argparse
+import asyncio
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+from benchmarks.bench_rutas import commit_actual, percentil
+from benchmarks.datos import PALABRAS
+
+SERVIDORES = ("wsgi", "asgi")
+
+
+# ---------- Servidor (proceso hijo) ----------
+
+def servir(tipo, libros, usuarios):
+    # Prepara la biblioteca, informa el puerto por la salida estándar y atiende hasta que lo terminen
+    from benchmarks.bench_rutas import aplicacion, preparar
+
+    preparar("memoria", libros, usuarios, usuarios, None)
+    if tipo == "wsgi":
+        import logging
+
+        from werkzeug.serving import make_server
+
+        logging.getLogger("werkzeug").setLevel(logging.ERROR)
+        servidor = make_server("127.0.0.1", 0, aplicacion.app, threaded=True)
+        print(f"PUERTO {servidor.server_address[1]}", flush=True)
+        servidor.serve_forever()
+    else:
+        import asgi
+
+        asyncio.run(asgi.servir(asgi.app, "127.0.0.1", 0, lambda puerto: print(f"PUERTO {puerto}", flush=True)))
+
+
+def iniciar_servidor(tipo, libros, usuarios):
+    proceso = subprocess.Popen(
+        [sys.executable, "-m", "benchmarks.bench_asgi", "--servir", tipo, "--libros", str(libros),
+         "--usuarios", str(usuarios)],
+        stdout=subprocess.PIPE,
+        text=True,
+    )
+    for linea in proceso.stdout:
+        if linea.startswith("PUERTO "):
+            return proceso, int(linea.split()[1])
+    raise RuntimeError(f"El servidor {tipo} terminó sin informar el puerto")
+
+
+# ---------- Clientes ----------
+
+def generar_rutas(cantidad, semilla=0):
+    # Lo que mandan los buscadores mientras se escribe: prefijos de una palabra,
+    # con página de 50 resultados, y las sugerencias de autocompletado
+    azar = random.Random(semilla)
+    rutas = []
+    for _ in range(cantidad):
+        palabra = azar.choice(PALABRAS)
+        q = palabra[:azar.randint(2, len(palabra))]
+        if azar.random() < 0.2:
+            rutas.append(f"/autocompletar?{urlencode({'q': q})}")
+        elif azar.random() < 0.8:
+            rutas.append(f"/buscar_libros?{urlencode({'q': q, 'limit': 50})}")
+        else:
+            rutas.append(f"/buscar_usuarios?{urlencode({'q': q[:2], 'limit': 50})}")
+    return rutas
+
+
+async def leer_respuesta(lector):
+    # Devuelve (estado, si el servidor mantiene la conexión)
+    linea = await lector.readline()
+    if not linea:
+        raise ConnectionError("conexión cerrada")
+    estado = int(linea.split()[1])
+    headers = {}
+    while True:
+        linea = await lector.readline()
+        if linea in (b"\r\n", b"\n", b""):
+            break
+        nombre, _, valor = linea.decode("latin-1").partition(":")
+        headers[nombre.strip().lower()] = valor.strip()
+    if headers.get("transfer-encoding") == "chunked":
+        while True:
+            largo = int((await lector.readline()).strip(), 16)
+            await lector.readexactly(largo + 2)
+            if largo == 0:
+                break
+    else:
+        await lector.readexactly(int(headers.get("content-length", 0)))
+    return estado, headers.get("connection", "").lower() != "close"
+
+
+async def cliente(puerto, rutas, semilla, fin, latencias, contadores):
+    azar = random.Random(semilla)
+    conexion = None
+    while time.perf_counter() < fin:
+        try:
+            if conexion is None:
+                conexion = await asyncio.open_connection("127.0.0.1", puerto)
+            lector, escritor = conexion
+            antes = time.perf_counter()
+            escritor.write(f"GET {azar.choice(rutas)} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode())
+            estado, sigue = await leer_respuesta(lector)
+            latencias.append(time.perf_counter() - antes)
+            contadores["respuestas"] += 1
+            if estado >= 400:
+                contadores["errores"] += 1
+            if not sigue:
+                escritor.close()
+                conexion = None
+        except (ConnectionError, OSError, asyncio.IncompleteReadError, ValueError):
+            contadores["fallas_conexion"] += 1
+            conexion = None
+            await asyncio.sleep(0.01)
+    if conexion is not None:
+        conexion[1].close()
+
+
+async def cargar(puerto, clientes, segundos, rutas):
+    latencias = []
+    contadores = {"respuestas": 0, "errores": 0, "fallas_conexion": 0}
+    inicio = time.perf_counter()
+    fin = inicio + segundos
+    await asyncio.gather(*(cliente(puerto, rutas, i, fin, latencias, contadores) for i in range(clientes)))
+    duracion = time.perf_counter() - inicio
+    ordenadas = sorted(latencias)
+    return {
+        "clientes": clientes,
+        "segundos": round(duracion, 2),
+        "respuestas": contadores["respuestas"],
+        "errores": contadores["errores"],
+        "fallas_conexion": contadores["fallas_conexion"],
+        "rps": round(contadores["respuestas"] / duracion, 1),
+        "p50_ms": round(percentil(ordenadas, 50) * 1000, 3),
+        "p95_ms": round(percentil(ordenadas, 95) * 1000, 3),
+        "p99_ms": round(percentil(ordenadas, 99) * 1000, 3),
+    }
+
+
+# ---------- Programa ----------
+
+def argumentos(lista=None):
+    parser = argparse.ArgumentParser(description="WSGI contra ASGI con muchos clientes keep-alive.")
+    parser.add_argument("--libros", type=int, default=10_000)
+    parser.add_argument("--usuarios", type=int, help="Por defecto, un décimo de los libros.")
+    parser.add_argument("--clientes", type=int, nargs="+", default=[100, 1000])
+    parser.add_argument("--segundos", type=float, default=5.0, help="Duración de cada medición.")
+    parser.add_argument("--servidores", nargs="+", choices=SERVIDORES, default=list(SERVIDORES))
+    parser.add_argument("--salida", help="Archivo JSON donde guardar el resultado.")
+    parser.add_argument("--servir", choices=SERVIDORES, help=argparse.SUPPRESS)
+    return parser.parse_args(lista)
+
+
+def main(lista=None):
+    opciones = argumentos(lista)
+    usuarios = opciones.usuarios if opciones.usuarios is not None else max(1, opciones.libros // 10)
+    if opciones.servir:
+        servir(opciones.servir, opciones.libros, usuarios)
+        return 0
+
+    rutas = generar_rutas(1000)
+    resultados = []
+    print(f"{opciones.libros} libros, {usuarios} usuarios, {opciones.segundos:.0f} s por medición")
+    print(f"  {'servidor':<8} {'clientes':>8} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'errores':>8} {'fallas':>7}")
+    for tipo in opciones.servidores:
+        proceso, puerto = iniciar_servidor(tipo, opciones.libros, usuarios)
+        try:
+            # Una pasada corta para que los dos servidores arranquen con la caché caliente
+            asyncio.run(cargar(puerto, 10, 0.5, rutas))
+            for clientes in opciones.clientes:
+                resultado = {"servidor": tipo, "libros": opciones.libros, **asyncio.run(
+                    cargar(puerto, clientes, opciones.segundos, rutas)
+                )}
+                resultados.append(resultado)
+                print(
+                    f"  {tipo:<8} {clientes:>8} {resultado['rps']:>9,.1f} {resultado['p50_ms']:>9.2f} "
+                    f"{resultado['p95_ms']:>9.2f} {resultado['p99_ms']:>9.2f} "
+                    f"{resultado['errores']:>8} {resultado['fallas_conexion']:>7}"
+                )
+        finally:
+            proceso.terminate()
+            proceso.wait()
+
+    if opciones.salida:
+        informe = {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit_actual(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "configuracion": {"segundos": opciones.segundos, "usuarios": usuarios},
+            "resultados": resultados,
+        }
+        with open(opciones.salida, "w", encoding="utf-8") as archivo:
+            json.dump(informe, archivo, ensure_ascii=False, indent=2)
+        print(f"\nResultado guardado en {opciones.salida}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
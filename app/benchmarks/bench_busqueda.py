@@ -0,0 +1,42 @@
+# Compara la búsqueda por subcadena con el índice de n-gramas contra el
+# recorrido completo que hacía /buscar_libros.
+# Uso (desde la carpeta app): python -m benchmarks.bench_busqueda [cantidades...]
+import sys
+import time
+
+from benchmarks.datos import generar_biblioteca
+from models.texto import normalizar
+
+CONSULTAS = [("titulo", "la"), ("titulo", "sol"), ("titulo", "laberinto"), ("autor", "cortázar"), ("genero", "poes")]
+
+
+def recorrido(biblioteca, q, campo):
+    q = normalizar(q)
+    return [l for l in biblioteca.libros if q in normalizar(getattr(l, campo))]
+
+
+def medir(funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+def main(cantidades):
+    for cantidad in cantidades:
+        inicio = time.perf_counter()
+        biblioteca = generar_biblioteca(cantidad)
+        print(f"\n{cantidad} libros (carga + indexado: {time.perf_counter() - inicio:.1f} s)")
+        repeticiones = max(1, 100_000 // cantidad)
+        for campo, q in CONSULTAS:
+            ms_scan, esperado = medir(lambda: recorrido(biblioteca, q, campo), repeticiones)
+            ms_indice, obtenido = medir(lambda: biblioteca.buscar_libros(q, campo), repeticiones)
+            assert {l.id_libro for l in esperado} == {l.id_libro for l in obtenido}
+            print(
+                f"  {campo:>7} {q!r:<12} {len(obtenido):>8} resultados  "
+                f"recorrido {ms_scan:9.2f} ms  índice {ms_indice:9.2f} ms  x{ms_scan / ms_indice:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(c) for c in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,112 @@
+# Prueba de carga de préstamos y devoluciones simultáneos.
+# Varios hilos piden préstamos de pocos libros con poco stock (para forzar la
+# competencia por el último ejemplar) y al final se verifica que el stock sea
+# consistente. Se corre contra la biblioteca en memoria y contra SQLite.
+# Uso (desde la carpeta app): python -m benchmarks.bench_concurrencia [hilos] [operaciones_por_hilo]
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+from models.biblioteca import Biblioteca, ErrorBiblioteca
+from models.biblioteca_sqlite import BibliotecaSQLite
+from models.libro import Libro
+from models.usuario import Usuario
+
+CANTIDAD_LIBROS = 20
+STOCK_INICIAL = 3
+CANTIDAD_USUARIOS = 200
+
+
+def preparar(biblioteca):
+    with biblioteca.carga_masiva():
+        for id_libro in range(1, CANTIDAD_LIBROS + 1):
+            biblioteca.agregar_libro(Libro(id_libro, f"Libro {id_libro}", "Autor", "Género", STOCK_INICIAL))
+        for id_usuario in range(1, CANTIDAD_USUARIOS + 1):
+            biblioteca.agregar_usuario(Usuario(id_usuario, "Nombre", "Apellido", id_usuario, "", "", 0))
+
+
+def trabajar(biblioteca, semilla, operaciones, contadores, barrera):
+    # Cada hilo devuelve solo préstamos que consiguió él, así las devoluciones
+    # compiten por los mismos libros que los préstamos de los demás hilos
+    azar = random.Random(semilla)
+    exitos = rechazos = 0
+    propios = []
+    barrera.wait()
+    for _ in range(operaciones):
+        try:
+            if propios and azar.random() < 0.5:
+                biblioteca.devolver(*propios.pop(azar.randrange(len(propios))))
+            else:
+                prestamo = (azar.randint(1, CANTIDAD_USUARIOS), azar.randint(1, CANTIDAD_LIBROS))
+                biblioteca.prestar(*prestamo)
+                propios.append(prestamo)
+            exitos += 1
+        except ErrorBiblioteca:
+            rechazos += 1
+    contadores.append((exitos, rechazos))
+
+
+def verificar(biblioteca):
+    # Cada ejemplar está en el estante o prestado a exactamente un usuario
+    errores = []
+    en_manos = {}
+    for usuario in biblioteca.users:
+        ids = [l.id_libro for l in usuario.libros]
+        if len(ids) != len(set(ids)):
+            errores.append(f"el usuario {usuario.id_usuario} tiene un libro repetido")
+        for id_libro in ids:
+            en_manos[id_libro] = en_manos.get(id_libro, 0) + 1
+    for libro in biblioteca.libros:
+        if libro.stock < 0:
+            errores.append(f"stock negativo en el libro {libro.id_libro}")
+        if libro.stock + libro.prestados != STOCK_INICIAL:
+            errores.append(f"el libro {libro.id_libro} tiene {libro.stock + libro.prestados} ejemplares")
+        if en_manos.get(libro.id_libro, 0) != libro.prestados:
+            errores.append(f"el libro {libro.id_libro} figura prestado {libro.prestados} veces")
+    return errores
+
+
+def medir(nombre, biblioteca, hilos, operaciones):
+    preparar(biblioteca)
+    contadores = []
+    barrera = threading.Barrier(hilos + 1)
+    trabajadores = [
+        threading.Thread(target=trabajar, args=(biblioteca, semilla, operaciones, contadores, barrera))
+        for semilla in range(hilos)
+    ]
+    for hilo in trabajadores:
+        hilo.start()
+    barrera.wait()
+    inicio = time.perf_counter()
+    for hilo in trabajadores:
+        hilo.join()
+    segundos = time.perf_counter() - inicio
+
+    total = hilos * operaciones
+    exitos = sum(e for e, _ in contadores)
+    errores = verificar(biblioteca)
+    print(
+        f"{nombre:<8} {total} operaciones en {hilos} hilos: {segundos:.2f} s "
+        f"({total / segundos:,.0f} op/s, {exitos} aceptadas, {total - exitos} rechazadas) "
+        + ("OK" if not errores else "INCONSISTENTE")
+    )
+    for error in errores[:10]:
+        print("   ", error)
+    return not errores
+
+
+def main(hilos=16, operaciones=1000):
+    correcto = medir("memoria", Biblioteca(), hilos, operaciones)
+    with tempfile.TemporaryDirectory() as directorio:
+        biblioteca = BibliotecaSQLite(os.path.join(directorio, "bench.db"))
+        correcto = medir("sqlite", biblioteca, hilos, operaciones) and correcto
+        biblioteca.cerrar()
+    return 0 if correcto else 1
+
+
+if __name__ == "__main__":
+    argumentos = [int(a) for a in sys.argv[1:]]
+    sys.exit(main(*argumentos))
@@ -0,0 +1,51 @@
+# Mide la importación masiva de un CSV de libros (en memoria y en SQLite)
+# y la exportación del catálogo resultante.
+# Uso (desde la carpeta app): python -m benchmarks.bench_importacion [libros]
+import csv
+import os
+import sys
+import tempfile
+import time
+
+from benchmarks.datos import generar_libros
+from models.biblioteca import Biblioteca
+from models.biblioteca_sqlite import BibliotecaSQLite
+from models.importacion import exportar, importar
+
+
+def escribir_csv(ruta, cantidad_libros):
+    with open(ruta, "w", encoding="utf-8", newline="") as archivo:
+        escritor = csv.writer(archivo)
+        escritor.writerow(["titulo", "autor", "genero", "stock"])
+        for libro in generar_libros(cantidad_libros):
+            escritor.writerow([libro.titulo, libro.autor, libro.genero, libro.stock])
+
+
+def medir(nombre, biblioteca, ruta, cantidad_libros):
+    inicio = time.perf_counter()
+    with open(ruta, encoding="utf-8", newline="") as archivo:
+        resultado = importar(biblioteca, archivo, "libros", "csv")
+    segundos = time.perf_counter() - inicio
+    print(
+        f"{nombre:<8} importación: {segundos:.1f} s ({cantidad_libros / segundos:,.0f} libros/s, "
+        f"{resultado['importados']} importados, {resultado['errores']} errores)"
+    )
+
+    inicio = time.perf_counter()
+    bytes_exportados = sum(len(bloque) for bloque in exportar(biblioteca, "libros", "csv"))
+    segundos = time.perf_counter() - inicio
+    print(f"{nombre:<8} exportación: {segundos:.1f} s ({bytes_exportados / 2**20:.0f} MiB)")
+
+
+def main(cantidad_libros=1_000_000):
+    with tempfile.TemporaryDirectory() as directorio:
+        ruta = os.path.join(directorio, "libros.csv")
+        escribir_csv(ruta, cantidad_libros)
+        medir("memoria", Biblioteca(), ruta, cantidad_libros)
+        biblioteca = BibliotecaSQLite(os.path.join(directorio, "bench.db"))
+        medir("sqlite", biblioteca, ruta, cantidad_libros)
+        biblioteca.cerrar()
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,61 @@
+# Mide con tracemalloc cuánta memoria ocupa el catálogo:
+# - solo los objetos Libro, con __slots__ y con un __dict__ por instancia (como antes),
+#   y con autor y género internados
+# - la biblioteca completa, con sus índices de búsqueda y de orden
+# Uso (desde la carpeta app): python -m benchmarks.bench_memoria [libros]
+import gc
+import sys
+import time
+import tracemalloc
+
+from benchmarks.datos import generar_biblioteca, generar_libros
+from models.libro import Libro
+
+
+class LibroConDict(Libro):
+    # Al no declarar __slots__, la subclase vuelve a tener __dict__ por instancia
+    pass
+
+
+def medir(descripcion, construir, cantidad):
+    gc.collect()
+    tracemalloc.start()
+    inicio = time.perf_counter()
+    resultado = construir()
+    segundos = time.perf_counter() - inicio
+    actual, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(
+        f"{descripcion:<40} {actual / 2**20:8.1f} MiB  "
+        f"{actual / cantidad:6.0f} bytes/libro  ({segundos:.1f} s)"
+    )
+    del resultado
+    gc.collect()
+
+
+def internados(cantidad_libros):
+    # Lo mismo que hace Biblioteca.agregar_libro con autor y género (y sus claves)
+    libros = []
+    for libro in generar_libros(cantidad_libros):
+        libro.autor = sys.intern(libro.autor)
+        libro.genero = sys.intern(libro.genero)
+        libro.autor_n = sys.intern(libro.autor_n)
+        libro.genero_n = sys.intern(libro.genero_n)
+        libros.append(libro)
+    return libros
+
+
+def main(cantidad_libros=1_000_000):
+    print(f"{cantidad_libros} libros")
+    medir(
+        "Libro con __dict__",
+        lambda: [LibroConDict(l.id_libro, l.titulo, l.autor, l.genero, l.stock) for l in generar_libros(cantidad_libros)],
+        cantidad_libros,
+    )
+    medir("Libro con __slots__", lambda: list(generar_libros(cantidad_libros)), cantidad_libros)
+    medir("Libro con __slots__ y textos internados", lambda: internados(cantidad_libros), cantidad_libros)
+    medir("Biblioteca (libros + índices)", lambda: generar_biblioteca(cantidad_libros), cantidad_libros)
+
+
+if __name__ == "__main__":
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,67 @@
+# Mide cuánto cuesta registrar operaciones en disco y cuánto tarda en
+# reconstruirse la biblioteca al reiniciar (desde el registro y desde la instantánea).
+# Uso (desde la carpeta app): python -m benchmarks.bench_persistencia [libros] [prestamos]
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+from benchmarks.datos import generar_libros
+from models.biblioteca import Biblioteca
+from models.persistencia import Persistencia
+from models.usuario import Usuario
+
+
+def abrir(directorio):
+    biblioteca = Biblioteca()
+    persistencia = Persistencia(directorio, operaciones_por_instantanea=float("inf"))
+    persistencia.cargar(biblioteca)
+    return biblioteca, persistencia
+
+
+def main(cantidad_libros, cantidad_prestamos):
+    directorio = tempfile.mkdtemp(prefix="bench_persistencia_")
+    try:
+        biblioteca, persistencia = abrir(directorio)
+        cantidad_usuarios = max(1, cantidad_libros // 10)
+
+        inicio = time.perf_counter()
+        for libro in generar_libros(cantidad_libros):
+            libro.stock = 1_000_000
+            biblioteca.agregar_libro(libro)
+        for id_usuario in range(1, cantidad_usuarios + 1):
+            biblioteca.agregar_usuario(Usuario(id_usuario, "Nombre", "Apellido", id_usuario, "", "", 0))
+        print(f"alta de {cantidad_libros} libros y {cantidad_usuarios} usuarios: {time.perf_counter() - inicio:.1f} s")
+
+        azar = random.Random(0)
+        inicio = time.perf_counter()
+        for _ in range(cantidad_prestamos // 2):
+            id_usuario = azar.randint(1, cantidad_usuarios)
+            id_libro = azar.randint(1, cantidad_libros)
+            biblioteca.prestar(id_usuario, id_libro)
+            biblioteca.devolver(id_usuario, id_libro)
+        segundos = time.perf_counter() - inicio
+        print(f"{cantidad_prestamos} préstamos/devoluciones: {segundos:.1f} s ({cantidad_prestamos / segundos:,.0f} op/s)")
+        persistencia.cerrar()
+
+        inicio = time.perf_counter()
+        biblioteca, persistencia = abrir(directorio)
+        print(f"reinicio desde el registro de operaciones: {time.perf_counter() - inicio:.1f} s")
+
+        inicio = time.perf_counter()
+        biblioteca.compactar()
+        persistencia.cerrar()
+        print(f"copia del estado para la instantánea: {time.perf_counter() - inicio:.1f} s")
+
+        inicio = time.perf_counter()
+        biblioteca, persistencia = abrir(directorio)
+        print(f"reinicio desde la instantánea: {time.perf_counter() - inicio:.1f} s")
+        persistencia.cerrar()
+    finally:
+        shutil.rmtree(directorio)
+
+
+if __name__ == "__main__":
+    argumentos = [int(a) for a in sys.argv[1:]]
+    main(*(argumentos + [1_000_000, 5_000_000][len(argumentos):]))
@@ -0,0 +1,413 @@
+# Mide latencia (p50/p95/p99) y peticiones por segundo de cada ruta de app.py
+# sobre bibliotecas sintéticas de distintos tamaños. Dos modos:
+# - "cliente": el cliente de pruebas de Flask, una petición tras otra, sin red
+# - "wsgi": un servidor WSGI real (werkzeug, un hilo por conexión) y varios
+#   clientes HTTP simultáneos
+# Con --salida el resultado se guarda en JSON; con --comparar se compara contra
+# un JSON anterior y el programa termina con código 1 si alguna ruta empeoró,
+# así se pueden comparar commits de forma automática.
+# Uso (desde la carpeta app):
+#   python -m benchmarks.bench_rutas [--libros 1000 10000] [--modo cliente wsgi]
+#       [--backend memoria sqlite] [--peticiones 200] [--clientes 8]
+#       [--salida resultado.json] [--comparar anterior.json]
+import argparse
+import http.client
+import json
+import logging
+import math
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+# La aplicación se importa con el almacenamiento en memoria y sin carpeta de datos:
+# cada medición reemplaza la biblioteca por una sintética
+os.environ["BIBLIOTECA_BACKEND"] = "memoria"
+os.environ.pop("BIBLIOTECA_DATOS", None)
+
+import app as aplicacion  # noqa: E402
+from benchmarks.datos import PALABRAS, poblar  # noqa: E402
+from models.biblioteca import Biblioteca  # noqa: E402
+from models.biblioteca_sqlite import BibliotecaSQLite  # noqa: E402
+from utils.cache import CacheRespuestas  # noqa: E402
+
+# Diferencia relativa a partir de la cual --comparar informa una regresión
+TOLERANCIA = 0.20
+# Pares por petición en los escenarios de préstamos y devoluciones en lote
+TAMANIO_LOTE = 500
+
+
+class Contexto:
+    # Estado compartido por los escenarios de una medición: tamaños del catálogo,
+    # préstamos hechos (para devolverlos después) y los ids que asignan las altas
+    def __init__(self, libros, usuarios):
+        self.libros = libros
+        self.usuarios = usuarios
+        self.prestados = []
+        self.lotes = []
+        self.siguiente_baja_libro = libros + 1
+        self.siguiente_baja_usuario = usuarios + 1
+        self._lock = threading.Lock()
+
+    def libro(self, azar):
+        return azar.randint(1, self.libros)
+
+    def usuario(self, azar):
+        return azar.randint(1, self.usuarios)
+
+    def baja_libro(self):
+        with self._lock:
+            self.siguiente_baja_libro += 1
+            return self.siguiente_baja_libro - 1
+
+    def baja_usuario(self):
+        with self._lock:
+            self.siguiente_baja_usuario += 1
+            return self.siguiente_baja_usuario - 1
+
+
+def _palabra(azar):
+    return azar.choice(PALABRAS)
+
+
+def _prestamo(azar, contexto):
+    return "POST", f"/confirmar_prestamo/{contexto.usuario(azar)}/{contexto.libro(azar)}", None
+
+
+def _devolucion(azar, contexto):
+    # Devuelve un préstamo hecho por el escenario anterior; si no quedan, uno al azar (rechazado)
+    try:
+        id_usuario, id_libro = contexto.prestados.pop()
+    except IndexError:
+        id_usuario, id_libro = contexto.usuario(azar), contexto.libro(azar)
+    return "POST", f"/confirmar_devolucion/{id_usuario}/{id_libro}", None
+
+
+def _prestamos_lote(azar, contexto):
+    # Un lote como los del mostrador al empezar el cuatrimestre; lo devuelve el escenario siguiente
+    pares = [[contexto.usuario(azar), contexto.libro(azar)] for _ in range(TAMANIO_LOTE)]
+    contexto.lotes.append(pares)
+    return "POST", "/prestamos/lote", {"pares": pares}
+
+
+def _devoluciones_lote(azar, contexto):
+    try:
+        pares = contexto.lotes.pop()
+    except IndexError:
+        pares = [[contexto.usuario(azar), contexto.libro(azar)] for _ in range(TAMANIO_LOTE)]
+    return "POST", "/devoluciones/lote", {"pares": pares}
+
+
+def _importacion(azar, contexto):
+    filas = ["titulo,autor,genero,stock"]
+    filas += [f"{_palabra(azar)} {i},Autor importado,Ensayo,2" for i in range(100)]
+    return "POST", "/importar?tipo=libros&formato=csv", ("\n".join(filas) + "\n").encode()
+
+
+# (nombre, fracción de las peticiones, función (azar, contexto) -> (método, ruta, cuerpo)).
+# El cuerpo es un diccionario (formulario; JSON en las rutas /lote), bytes (CSV) o None.
+# El orden importa: las devoluciones usan los préstamos anteriores y las bajas
+# eliminan lo que crearon las altas
+ESCENARIOS = [
+    ("GET /", 1, lambda a, c: ("GET", "/", None)),
+    ("GET /estadisticas", 1, lambda a, c: ("GET", "/estadisticas", None)),
+    ("GET /estadisticas/cache", 1, lambda a, c: ("GET", "/estadisticas/cache", None)),
+    ("GET /libros?q", 0.25, lambda a, c: ("GET", f"/libros?{urlencode({'q': _palabra(a)})}", None)),
+    ("GET /buscar_libros", 1, lambda a, c: (
+        "GET", f"/buscar_libros?{urlencode({'q': _palabra(a), 'limit': 50})}", None)),
+    ("GET /buscar_libros (autor)", 1, lambda a, c: (
+        "GET", f"/buscar_libros?{urlencode({'q': _palabra(a)[:3], 'campo': 'autor', 'limit': 50})}", None)),
+    ("GET /autocompletar", 1, lambda a, c: (
+        "GET", f"/autocompletar?{urlencode({'q': _palabra(a)[:2]})}", None)),
+    ("GET /usuarios?q", 0.25, lambda a, c: ("GET", f"/usuarios?{urlencode({'q': _palabra(a)[:2]})}", None)),
+    ("GET /buscar_usuarios", 1, lambda a, c: (
+        "GET", f"/buscar_usuarios?{urlencode({'q': _palabra(a)[:2], 'limit': 50})}", None)),
+    ("GET /editar/<id>", 1, lambda a, c: ("GET", f"/editar/{c.libro(a)}", None)),
+    ("GET /editar_usuario/<id>", 1, lambda a, c: ("GET", f"/editar_usuario/{c.usuario(a)}", None)),
+    ("GET /devolver_libro/<id>", 1, lambda a, c: ("GET", f"/devolver_libro/{c.usuario(a)}", None)),
+    ("GET /prestar_libro_usuario/<id>", 0.1, lambda a, c: ("GET", f"/prestar_libro_usuario/{c.usuario(a)}", None)),
+    ("GET /prestatarios/<id>", 1, lambda a, c: ("GET", f"/prestatarios/{c.libro(a)}", None)),
+    ("POST /confirmar_prestamo", 1, _prestamo),
+    ("POST /confirmar_devolucion", 1, _devolucion),
+    ("POST /prestamos/lote", 0.05, _prestamos_lote),
+    ("POST /devoluciones/lote", 0.05, _devoluciones_lote),
+    ("POST /editar/<id>", 0.5, lambda a, c: ("POST", f"/editar/{c.libro(a)}", {
+        "titulo": f"{_palabra(a)} {_palabra(a)}".capitalize(), "autor": "Autor editado",
+        "genero": "Drama", "stock": 1})),
+    ("POST /actualizar_usuario/<id>", 0.5, lambda a, c: ("POST", f"/actualizar_usuario/{c.usuario(a)}", {
+        "nombre": _palabra(a).capitalize(), "apellido": "Editado", "telefono": "2284-000000",
+        "direccion": "Piedras", "nro_direccion": 100})),
+    ("POST /libros", 0.5, lambda a, c: ("POST", "/libros", {
+        "titulo": f"Alta {_palabra(a)}", "autor": "Autor nuevo", "genero": "Poesía", "stock": 2})),
+    ("POST /eliminar/<id>", 0.5, lambda a, c: ("POST", f"/eliminar/{c.baja_libro()}", None)),
+    ("POST /usuarios", 0.5, lambda a, c: ("POST", "/usuarios", {
+        "nombre": "Nuevo", "apellido": "Usuario", "dni": a.randint(10**7, 10**8), "telefono": "",
+        "direccion": "", "nro_direccion": ""})),
+    ("POST /eliminar_usuario/<id>", 0.5, lambda a, c: ("POST", f"/eliminar_usuario/{c.baja_usuario()}", None)),
+    ("POST /importar", 0.05, _importacion),
+    ("GET /exportar", 0.05, lambda a, c: ("GET", "/exportar?tipo=libros&formato=csv", None)),
+]
+
+
+# ---------- Preparación ----------
+
+def preparar(backend, libros, usuarios, prestamos, ruta_sqlite):
+    # Arma la biblioteca sintética y la instala en la aplicación, con la caché vacía
+    if backend == "sqlite":
+        biblioteca = BibliotecaSQLite(ruta_sqlite)
+    else:
+        biblioteca = Biblioteca()
+    poblar(biblioteca, libros, usuarios, prestamos)
+    if aplicacion.metricas is not None:
+        biblioteca.activar_contadores()
+    aplicacion.biblioteca = biblioteca
+    aplicacion.cache = CacheRespuestas(aplicacion.app.config["CACHE_ENTRADAS"], aplicacion.app.config["CACHE_BYTES"])
+    return biblioteca
+
+
+def _cuerpo(cuerpo):
+    # Devuelve (bytes, Content-Type) listos para enviar
+    if cuerpo is None:
+        return None, None
+    if isinstance(cuerpo, bytes):
+        return cuerpo, "text/csv"
+    if "pares" in cuerpo:
+        return json.dumps(cuerpo).encode(), "application/json"
+    return urlencode(cuerpo).encode(), "application/x-www-form-urlencoded"
+
+
+def _anotar(contexto, ruta, estado):
+    # Los préstamos aceptados quedan para el escenario de devoluciones
+    if estado == 200 and ruta.startswith("/confirmar_prestamo/"):
+        _, _, id_usuario, id_libro = ruta.split("/")
+        contexto.prestados.append((int(id_usuario), int(id_libro)))
+
+
+# ---------- Modos de medición ----------
+
+def medir_cliente(escenario, contexto, peticiones, azar):
+    # Una petición tras otra con el cliente de pruebas de Flask
+    _, _, generar = escenario
+    cliente = aplicacion.app.test_client()
+    latencias, estados = [], []
+    inicio = time.perf_counter()
+    for _ in range(peticiones):
+        metodo, ruta, cuerpo = generar(azar, contexto)
+        datos, tipo = _cuerpo(cuerpo)
+        antes = time.perf_counter()
+        respuesta = cliente.open(ruta, method=metodo, data=datos, content_type=tipo)
+        respuesta.get_data()
+        latencias.append(time.perf_counter() - antes)
+        estados.append(respuesta.status_code)
+        _anotar(contexto, ruta, respuesta.status_code)
+    return latencias, estados, time.perf_counter() - inicio
+
+
+def medir_wsgi(escenario, contexto, peticiones, azar, servidor, clientes):
+    # Varios hilos cliente contra el servidor real; cada uno abre una conexión por
+    # petición (el servidor de desarrollo de werkzeug no mantiene conexiones abiertas)
+    _, _, generar = escenario
+    host, puerto = servidor.server_address[:2]
+    latencias, estados = [], []
+    barrera = threading.Barrier(clientes + 1)
+    semillas = [azar.random() for _ in range(clientes)]
+    cantidades = [peticiones // clientes + (i < peticiones % clientes) for i in range(clientes)]
+
+    def trabajar(semilla, cantidad):
+        azar_hilo = random.Random(semilla)
+        propias_latencias, propios_estados = [], []
+        barrera.wait()
+        for _ in range(cantidad):
+            metodo, ruta, cuerpo = generar(azar_hilo, contexto)
+            datos, tipo = _cuerpo(cuerpo)
+            antes = time.perf_counter()
+            conexion = http.client.HTTPConnection(host, puerto, timeout=60)
+            conexion.request(metodo, ruta, body=datos, headers={"Content-Type": tipo} if tipo else {})
+            respuesta = conexion.getresponse()
+            respuesta.read()
+            conexion.close()
+            propias_latencias.append(time.perf_counter() - antes)
+            propios_estados.append(respuesta.status)
+            _anotar(contexto, ruta, respuesta.status)
+        latencias.extend(propias_latencias)
+        estados.extend(propios_estados)
+
+    hilos = [threading.Thread(target=trabajar, args=args) for args in zip(semillas, cantidades)]
+    for hilo in hilos:
+        hilo.start()
+    barrera.wait()
+    inicio = time.perf_counter()
+    for hilo in hilos:
+        hilo.join()
+    return latencias, estados, time.perf_counter() - inicio
+
+
+def iniciar_servidor():
+    from werkzeug.serving import make_server
+
+    logging.getLogger("werkzeug").setLevel(logging.ERROR)
+    servidor = make_server("127.0.0.1", 0, aplicacion.app, threaded=True)
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    return servidor
+
+
+# ---------- Resultados ----------
+
+def percentil(ordenadas, p):
+    # Percentil por rango más cercano sobre una lista ya ordenada
+    if not ordenadas:
+        return 0.0
+    return ordenadas[max(0, math.ceil(p / 100 * len(ordenadas)) - 1)]
+
+
+def resumir(latencias, estados, segundos):
+    ordenadas = sorted(latencias)
+    return {
+        "peticiones": len(latencias),
+        "rechazadas": sum(1 for e in estados if 400 <= e < 500),
+        "errores": sum(1 for e in estados if e >= 500),
+        "rps": round(len(latencias) / segundos, 1) if segundos else 0.0,
+        "media_ms": round(sum(latencias) / len(latencias) * 1000, 3) if latencias else 0.0,
+        "p50_ms": round(percentil(ordenadas, 50) * 1000, 3),
+        "p95_ms": round(percentil(ordenadas, 95) * 1000, 3),
+        "p99_ms": round(percentil(ordenadas, 99) * 1000, 3),
+    }
+
+
+def commit_actual():
+    try:
+        salida = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        )
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return salida.stdout.strip()
+
+
+def clave_resultado(r):
+    return (r["modo"], r["backend"], r["libros"], r["ruta"])
+
+
+def comparar(resultados, ruta_anterior, tolerancia):
+    # Compara p95 y peticiones por segundo contra otra corrida; devuelve las regresiones
+    with open(ruta_anterior, encoding="utf-8") as archivo:
+        anteriores = {clave_resultado(r): r for r in json.load(archivo)["resultados"]}
+    regresiones = []
+    print(f"\nComparación contra {ruta_anterior} (tolerancia {tolerancia:.0%})")
+    for r in resultados:
+        anterior = anteriores.get(clave_resultado(r))
+        if anterior is None or not anterior["p95_ms"] or not anterior["rps"]:
+            continue
+        cambio_p95 = r["p95_ms"] / anterior["p95_ms"] - 1
+        cambio_rps = r["rps"] / anterior["rps"] - 1
+        peor = cambio_p95 > tolerancia or cambio_rps < -tolerancia
+        if peor:
+            regresiones.append(r)
+        print(
+            f"  {'REGRESIÓN' if peor else 'ok':<9} {r['modo']:<7} {r['backend']:<7} {r['libros']:>8} "
+            f"{r['ruta']:<32} p95 {cambio_p95:+7.1%}  rps {cambio_rps:+7.1%}"
+        )
+    return regresiones
+
+
+# ---------- Programa ----------
+
+def argumentos(lista=None):
+    parser = argparse.ArgumentParser(description="Benchmark de las rutas de la aplicación.")
+    parser.add_argument("--libros", type=int, nargs="+", default=[1_000, 10_000], help="Tamaños de catálogo.")
+    parser.add_argument("--usuarios", type=int, help="Usuarios (por defecto, un décimo de los libros).")
+    parser.add_argument("--prestamos", type=int, help="Préstamos iniciales (por defecto, uno por usuario).")
+    parser.add_argument("--modo", nargs="+", choices=["cliente", "wsgi"], default=["cliente", "wsgi"])
+    parser.add_argument("--backend", nargs="+", choices=["memoria", "sqlite"], default=["memoria"])
+    parser.add_argument("--peticiones", type=int, default=200, help="Peticiones por ruta (antes de la fracción).")
+    parser.add_argument("--clientes", type=int, default=8, help="Clientes simultáneos en el modo wsgi.")
+    parser.add_argument("--rutas", nargs="+", help="Medir solo las rutas que contienen alguno de estos textos.")
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--salida", help="Archivo JSON donde guardar el resultado.")
+    parser.add_argument("--comparar", help="Resultado JSON anterior contra el que comparar.")
+    parser.add_argument("--tolerancia", type=float, default=TOLERANCIA)
+    return parser.parse_args(lista)
+
+
+def main(lista=None):
+    opciones = argumentos(lista)
+    escenarios = [
+        e for e in ESCENARIOS if not opciones.rutas or any(texto in e[0] for texto in opciones.rutas)
+    ]
+    servidor = iniciar_servidor() if "wsgi" in opciones.modo else None
+    resultados = []
+    with tempfile.TemporaryDirectory(prefix="bench_rutas_") as directorio:
+        for backend in opciones.backend:
+            for libros in opciones.libros:
+                usuarios = opciones.usuarios if opciones.usuarios is not None else max(1, libros // 10)
+                prestamos = opciones.prestamos if opciones.prestamos is not None else usuarios
+                for modo in opciones.modo:
+                    # Cada modo empieza con una biblioteca recién generada
+                    inicio = time.perf_counter()
+                    biblioteca = preparar(
+                        backend, libros, usuarios, prestamos, os.path.join(directorio, f"{modo}_{libros}.db")
+                    )
+                    print(
+                        f"\n[{modo} / {backend}] {libros} libros, {usuarios} usuarios "
+                        f"(preparación: {time.perf_counter() - inicio:.1f} s)"
+                    )
+                    print(f"  {'ruta':<32} {'pet.':>5} {'rps':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}  4xx  5xx")
+                    contexto = Contexto(libros, usuarios)
+                    # Secuencia propia de los escenarios: con la misma semilla que poblar()
+                    # los préstamos repetirían los pares ya prestados al generar los datos
+                    azar = random.Random(f"escenarios-{opciones.semilla}")
+                    for escenario in escenarios:
+                        nombre, fraccion, _ = escenario
+                        peticiones = max(1, int(opciones.peticiones * fraccion))
+                        if modo == "cliente":
+                            medicion = medir_cliente(escenario, contexto, peticiones, azar)
+                        else:
+                            medicion = medir_wsgi(escenario, contexto, peticiones, azar, servidor, opciones.clientes)
+                        resumen = resumir(*medicion)
+                        print(
+                            f"  {nombre:<32} {resumen['peticiones']:>5} {resumen['rps']:>9,.1f} "
+                            f"{resumen['p50_ms']:>9.2f} {resumen['p95_ms']:>9.2f} {resumen['p99_ms']:>9.2f} "
+                            f"{resumen['rechazadas']:>4} {resumen['errores']:>4}"
+                        )
+                        resultados.append({
+                            "modo": modo, "backend": backend, "libros": libros, "usuarios": usuarios,
+                            "ruta": nombre, **resumen,
+                        })
+                    if backend == "sqlite":
+                        biblioteca.cerrar()
+    if servidor is not None:
+        servidor.shutdown()
+
+    if opciones.salida:
+        informe = {
+            "fecha": datetime.now().isoformat(timespec="seconds"),
+            "commit": commit_actual(),
+            "python": platform.python_version(),
+            "plataforma": platform.platform(),
+            "configuracion": {
+                "peticiones": opciones.peticiones,
+                "clientes": opciones.clientes,
+                "semilla": opciones.semilla,
+            },
+            "resultados": resultados,
+        }
+        with open(opciones.salida, "w", encoding="utf-8") as archivo:
+            json.dump(informe, archivo, ensure_ascii=False, indent=2)
+        print(f"\nResultado guardado en {opciones.salida}")
+
+    if opciones.comparar:
+        regresiones = comparar(resultados, opciones.comparar, opciones.tolerancia)
+        if regresiones:
+            print(f"{len(regresiones)} ruta(s) empeoraron más de {opciones.tolerancia:.0%}")
+            return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,74 @@
+# Compara el listado de préstamos vencidos con el índice de vencimientos contra
+# el recorrido de los préstamos de todos los usuarios que hacía el informe nocturno.
+# Los préstamos tienen fechas al azar en los últimos DIAS_ATRAS días; se mide con
+# distintas proporciones de vencidos.
+# Uso (desde la carpeta app): python -m benchmarks.bench_vencimientos [cantidades de préstamos...]
+import random
+import sys
+import time
+from datetime import timedelta
+
+from benchmarks.datos import generar_libros, generar_usuarios
+from models.biblioteca import Biblioteca, ErrorBiblioteca
+from models.prestamo import ahora
+
+DIAS_ATRAS = 60
+PROPORCIONES = [0.001, 0.01, 0.1, 0.5]
+
+
+def recorrido(biblioteca, hasta):
+    vencidos = [
+        p for u in biblioteca.users for p in biblioteca.prestamos_de(u.id_usuario) if p.vence <= hasta
+    ]
+    vencidos.sort(key=lambda p: p.vence)
+    return vencidos
+
+
+def medir(funcion, repeticiones):
+    inicio = time.perf_counter()
+    for _ in range(repeticiones):
+        resultado = funcion()
+    return (time.perf_counter() - inicio) / repeticiones * 1000, resultado
+
+
+def generar(cantidad, semilla=0):
+    # Un préstamo por par (usuario, libro): 10 préstamos por usuario en promedio
+    biblioteca = Biblioteca()
+    cantidad_usuarios = max(1, cantidad // 10)
+    cantidad_libros = max(1, cantidad // 5)
+    with biblioteca.carga_masiva():
+        biblioteca.agregar_libros(list(generar_libros(cantidad_libros, semilla)))
+        biblioteca.agregar_usuarios(list(generar_usuarios(cantidad_usuarios, semilla)))
+        for libro in biblioteca.libros:
+            biblioteca.editar_libro(libro, libro.titulo, libro.autor, libro.genero, 100)
+        azar = random.Random(semilla)
+        momento = ahora()
+        while biblioteca.prestados() < cantidad:
+            fecha = momento - timedelta(seconds=azar.randrange(DIAS_ATRAS * 86400))
+            try:
+                biblioteca.prestar(azar.randint(1, cantidad_usuarios), azar.randint(1, cantidad_libros), fecha)
+            except ErrorBiblioteca:
+                pass
+    return biblioteca
+
+
+def main(cantidades):
+    for cantidad in cantidades:
+        inicio = time.perf_counter()
+        biblioteca = generar(cantidad)
+        print(f"\n{cantidad} préstamos (carga: {time.perf_counter() - inicio:.1f} s)")
+        vencimientos = sorted(p.vence for u in biblioteca.users for p in biblioteca.prestamos_de(u.id_usuario))
+        repeticiones = max(1, 100_000 // cantidad)
+        for proporcion in PROPORCIONES:
+            hasta = vencimientos[int(len(vencimientos) * proporcion)]
+            ms_scan, esperado = medir(lambda: recorrido(biblioteca, hasta), repeticiones)
+            ms_indice, obtenido = medir(lambda: biblioteca.vencidos(hasta), repeticiones)
+            assert [p.vence for p in esperado] == [p.vence for p in obtenido]
+            print(
+                f"  {proporcion:>6.1%} vencidos {len(obtenido):>8}  "
+                f"recorrido {ms_scan:9.2f} ms  índice {ms_indice:9.2f} ms  x{ms_scan / ms_indice:.1f}"
+            )
+
+
+if __name__ == "__main__":
+    main([int(c) for c in sys.argv[1:]] or [10_000, 100_000, 1_000_000])
@@ -0,0 +1,61 @@
+# Generación de bibliotecas sintéticas para los benchmarks
+import random
+
+from models.biblioteca import Biblioteca, ErrorBiblioteca
+from models.libro import Libro
+from models.usuario import Usuario
+
+NOMBRES = ["Gabriel", "Julio", "Jorge", "Alfonsina", "Silvina", "Adolfo", "Ernesto", "Olga", "María", "Elena"]
+APELLIDOS = ["García Márquez", "Cortázar", "Borges", "Storni", "Ocampo", "Bioy Casares", "Sábato", "Orozco", "Walsh", "Garro"]
+GENEROS = ["Drama", "Ficción", "Realismo mágico", "Poesía", "Ensayo", "Cuentos", "Novela policial", "Ciencia ficción"]
+PALABRAS = [
+    "sombra", "jardín", "senderos", "laberinto", "ciudad", "noche", "años", "soledad", "túnel", "invención",
+    "mar", "cielo", "tiempo", "memoria", "río", "casa", "tomada", "espejo", "aleph", "rayuela", "héroes",
+    "tumbas", "perros", "hambre", "piedra", "viento", "luz", "fuego", "silencio", "camino",
+]
+
+
+def generar_libros(cantidad, semilla=0):
+    azar = random.Random(semilla)
+    for id_libro in range(1, cantidad + 1):
+        titulo = " ".join(azar.choice(PALABRAS) for _ in range(azar.randint(1, 4))).capitalize()
+        autor = f"{azar.choice(NOMBRES)} {azar.choice(APELLIDOS)}"
+        yield Libro(id_libro, titulo, autor, azar.choice(GENEROS), azar.randint(1, 5))
+
+
+def generar_usuarios(cantidad, semilla=0):
+    azar = random.Random(semilla)
+    for id_usuario in range(1, cantidad + 1):
+        yield Usuario(
+            id_usuario,
+            azar.choice(NOMBRES),
+            azar.choice(APELLIDOS).split()[0],
+            20_000_000 + id_usuario,
+            f"2284-{azar.randint(100000, 999999)}",
+            azar.choice(PALABRAS).capitalize(),
+            azar.randint(1, 3000),
+        )
+
+
+def poblar(biblioteca, cantidad_libros, cantidad_usuarios=0, cantidad_prestamos=0, semilla=0):
+    # Sirve para cualquiera de los dos almacenamientos (memoria o SQLite).
+    # Los préstamos se piden al azar: los rechazados (sin stock o repetidos) no se cuentan
+    with biblioteca.carga_masiva():
+        biblioteca.agregar_libros(list(generar_libros(cantidad_libros, semilla)))
+        biblioteca.agregar_usuarios(list(generar_usuarios(cantidad_usuarios, semilla)))
+    azar = random.Random(semilla)
+    prestamos = 0
+    if cantidad_usuarios and cantidad_libros:
+        for _ in range(cantidad_prestamos):
+            try:
+                biblioteca.prestar(azar.randint(1, cantidad_usuarios), azar.randint(1, cantidad_libros))
+                prestamos += 1
+            except ErrorBiblioteca:
+                pass
+    return prestamos
+
+
+def generar_biblioteca(cantidad_libros, semilla=0, cantidad_usuarios=0, cantidad_prestamos=0):
+    biblioteca = Biblioteca()
+    poblar(biblioteca, cantidad_libros, cantidad_usuarios, cantidad_prestamos, semilla)
+    return biblioteca
@@ -0,0 +1,48 @@
+# Servidor de estado para correr varios procesos de la aplicación a la vez.
+# Tiene la única copia de la biblioteca que se modifica; cada proceso de la
+# aplicación (BIBLIOTECA_BACKEND=compartido) responde las consultas con una
+# réplica local y le manda las escrituras por el socket Unix (ver models/compartida.py).
+#
+# Uso:
+#   python estado.py [--socket biblioteca.sock] [--datos carpeta]
+#   BIBLIOTECA_BACKEND=compartido gunicorn -w 4 app:app
+# Con --datos (o BIBLIOTECA_DATOS) el estado se guarda en disco igual que con
+# el almacenamiento en memoria de un solo proceso.
+import argparse
+import os
+import signal
+import sys
+
+from models.biblioteca import Biblioteca
+from models.compartida import ServidorEstado
+from models.persistencia import Persistencia
+
+
+def main(lista=None):
+    parser = argparse.ArgumentParser(description="Servidor de estado compartido de la biblioteca.")
+    parser.add_argument("--socket", default=os.environ.get("BIBLIOTECA_ESTADO", "biblioteca.sock"))
+    parser.add_argument("--datos", default=os.environ.get("BIBLIOTECA_DATOS"))
+    opciones = parser.parse_args(lista)
+    clave = os.environ.get("BIBLIOTECA_ESTADO_CLAVE", "biblioteca").encode()
+
+    biblioteca = Biblioteca()
+    persistencia = None
+    if opciones.datos:
+        persistencia = Persistencia(opciones.datos)
+        persistencia.cargar(biblioteca)
+
+    servidor = ServidorEstado(biblioteca, opciones.socket, clave)
+    # SIGTERM (ej: al detener el servicio) termina igual que Ctrl+C, cerrando el registro en disco
+    signal.signal(signal.SIGTERM, lambda *_: sys.exit(0))
+    print(f"Estado de la biblioteca en {opciones.socket}", flush=True)
+    try:
+        servidor.servir()
+    finally:
+        servidor.cerrar()
+        if persistencia is not None:
+            persistencia.cerrar()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
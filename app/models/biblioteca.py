@@ -1,41 +1,978 @@
+import sys
+import threading
+from collections import Counter, defaultdict
+from contextlib import ExitStack, contextmanager
+from itertools import islice
+
+from models.eventos import evento_baja_libro, evento_baja_usuario, evento_libro, evento_prestamo, evento_usuario
+from models.indices import IndiceNgramas, IndiceOrdenado, IndicePrefijos, IndiceVencimientos
+from models.persistencia import registro_libro, registro_prestamo, registro_reserva, registro_usuario
+from models.prestamo import Prestamo, Reserva, ahora
+from models.texto import normalizar
+from models.versiones import siguiente_version
+
+
+# Campos de Libro que se pueden buscar por subcadena usando el índice de n-gramas
+CAMPOS_BUSQUEDA_LIBROS = ("titulo", "autor", "genero")
+
+# Campos por los que se pueden ordenar los listados de libros y usuarios
+CAMPOS_ORDEN_LIBROS = ("titulo", "autor", "genero")
+CAMPOS_ORDEN_USUARIOS = ("nombre", "apellido", "dni")
+
+# Campos de Libro con muchos valores repetidos: se internan para que todos
+# los libros (y los índices) compartan una única copia de cada texto
+CAMPOS_INTERNADOS_LIBROS = ("autor", "genero")
+
+# Campos con sugerencias de autocompletado (ordenadas por cantidad de préstamos)
+CAMPOS_AUTOCOMPLETAR_LIBROS = ("titulo", "autor", "genero")
+CAMPOS_AUTOCOMPLETAR_USUARIOS = ("nombre", "apellido")
+
+
+# Cantidad de locks entre los que se reparten los libros y los usuarios
+# (cada id usa siempre el mismo lock: id % CANTIDAD_LOCKS)
+CANTIDAD_LOCKS = 64
+
+
+def clave_orden(valor):
+    # Los textos se ordenan por su clave normalizada; el resto (ej: DNI) como texto.
+    # Libro y Usuario ya la tienen calculada en sus atributos *_n
+    return normalizar(valor) if isinstance(valor, str) else str(valor)
+
+
+class ErrorBiblioteca(Exception):
+    # Operación rechazada por una validación; el mensaje se muestra tal cual al usuario
+    codigo = 400
+
+
+class NoEncontrado(ErrorBiblioteca):
+    codigo = 404
+
+
+def validar_campo_libros(campo):
+    # Los dos almacenamientos (y las rutas, con un 400) rechazan igual un campo desconocido
+    if campo not in CAMPOS_BUSQUEDA_LIBROS:
+        raise ErrorBiblioteca(f"No se puede buscar libros por el campo '{campo}'.")
+
+
 class Biblioteca:
     def __init__(self, users=None):
-        self.libros = []
-        self.users = users if users is not None else []
+        # Índices por id: el diccionario conserva el orden de inserción,
+        # así que también sirve como lista ordenada de libros y usuarios
+        self._libros = {}
+        self._users = {}
+        self._indice_libros = {
+            campo: IndiceNgramas(internar=campo in CAMPOS_INTERNADOS_LIBROS) for campo in CAMPOS_BUSQUEDA_LIBROS
+        }
+        self._orden_libros = {
+            campo: IndiceOrdenado(internar=campo in CAMPOS_INTERNADOS_LIBROS) for campo in CAMPOS_ORDEN_LIBROS
+        }
+        self._orden_users = {campo: IndiceOrdenado() for campo in CAMPOS_ORDEN_USUARIOS}
+        self._prefijos_libros = {
+            campo: IndicePrefijos(internar=campo in CAMPOS_INTERNADOS_LIBROS) for campo in CAMPOS_AUTOCOMPLETAR_LIBROS
+        }
+        self._prefijos_users = {campo: IndicePrefijos() for campo in CAMPOS_AUTOCOMPLETAR_USUARIOS}
+        # Registro de préstamos vigentes, en las dos direcciones:
+        # id_usuario -> {id_libro: Prestamo} e id_libro -> {ids de usuarios que lo tienen}.
+        # usuario.libros se mantiene para mostrar los libros en orden de préstamo
+        self._prestamos_usuario = {}
+        self._prestatarios = {}
+        # Préstamos vigentes ordenados por vencimiento, para listar los vencidos
+        # sin revisar todos
+        self._vencimientos = IndiceVencimientos()
+        # Filas de espera de los libros sin ejemplares disponibles, en las dos
+        # direcciones: id_libro -> {id_usuario: Reserva} (en orden de llegada) e
+        # id_usuario -> {id_libro: Reserva}. Las protege _lock_reservas, que se
+        # toma siempre último (después de los del usuario y del libro)
+        self._reservas = {}
+        self._reservas_usuario = {}
+        self._lock_reservas = threading.Lock()
+        # Si un ejemplar devuelto se presta enseguida al primero de la fila de reservas.
+        # En False al reconstruir desde un registro (ver models/persistencia.py y
+        # models/compartida.py): esos préstamos ya vienen anotados en el registro
+        self.asignar_reservas = True
+        # Modelo de concurrencia:
+        # - _escritura serializa los cambios de estructura (altas, ediciones, bajas)
+        #   y las lecturas que recorren los índices
+        # - préstamos y devoluciones solo toman el lock del usuario y el del libro
+        #   (siempre en ese orden), así operaciones sobre libros distintos no se esperan
+        # - compactar() toma todos los locks para copiar un estado consistente
+        self._escritura = threading.RLock()
+        self._locks_users = [threading.Lock() for _ in range(CANTIDAD_LOCKS)]
+        self._locks_libros = [threading.Lock() for _ in range(CANTIDAD_LOCKS)]
+        # Totales que se actualizan con cada operación, para que el tablero
+        # y /estadisticas no recorran el catálogo en cada consulta
+        self._lock_totales = threading.Lock()
+        self._stock_total = 0
+        self._prestados_total = 0
+        self._usuarios_con_prestamos = 0
+        self._libros_por_genero = Counter()
+        # Generación: aumenta después de cada cambio. Quien guarda resultados
+        # calculados (ej: la caché de respuestas) los descarta cuando cambia
+        self.generacion = 0
+        # Últimos ids asignados: crecen siempre, aunque se eliminen registros,
+        # así pedir un id nuevo no recorre la colección
+        self._ultimo_id_libro = 0
+        self._ultimo_id_usuario = 0
+        # Contadores de operaciones para /metrics: en None no cuestan nada,
+        # se crean con activar_contadores() solo si las métricas están activas
+        self._operaciones = None
+        self._revisados = None
+        self._lock_contadores = threading.Lock()
+        self.persistencia = None
+        # Registro de cambios para réplicas en otros procesos (ver models/compartida.py)
+        self.cambios = None
+        # Canal de /eventos (ver models/eventos.py), con activar_eventos()
+        self.eventos = None
+        for usuario in users if users is not None else []:
+            self.agregar_usuario(usuario)
+
+    @property
+    def libros(self):
+        return list(self._libros.values())
+
+    @property
+    def users(self):
+        return list(self._users.values())
+
+    def _registrar(self, operacion):
+        # Todas las modificaciones pasan por acá una vez aplicadas
+        if self.persistencia is not None:
+            self.persistencia.registrar(operacion)
+        if self.cambios is not None:
+            self.cambios.registrar(operacion)
+        with self._lock_totales:
+            self.generacion += 1
+        if self.eventos is not None:
+            evento = self._evento(operacion)
+            if evento is not None:
+                self.eventos.publicar(*evento)
+
+    def _evento(self, operacion):
+        # El cambio ya está aplicado: el evento lleva el estado nuevo del libro o usuario.
+        # Las reservas no cambian lo que muestran las páginas: no tienen evento
+        tipo = operacion[0]
+        if tipo in ("reservar", "cancelar_reserva"):
+            return None
+        if tipo in ("libro", "editar_libro"):
+            return evento_libro(self._libros[operacion[1]])
+        if tipo == "eliminar_libro":
+            return evento_baja_libro(operacion[1])
+        if tipo in ("usuario", "editar_usuario"):
+            return evento_usuario(self._users[operacion[1]])
+        if tipo == "eliminar_usuario":
+            return evento_baja_usuario(operacion[1])
+        usuario, libro = self._users[operacion[1]], self._libros[operacion[2]]
+        return evento_prestamo("prestamo" if tipo == "prestar" else "devolucion", usuario, libro)
+
+    def activar_eventos(self, canal):
+        self.eventos = canal
+
+    def activar_contadores(self):
+        with self._lock_contadores:
+            if self._operaciones is None:
+                self._operaciones = Counter()
+                self._revisados = Counter()
+
+    def _contar(self, operacion, revisados=0):
+        # Cuenta una operación y los registros que tuvo que mirar
+        if self._operaciones is None:
+            return
+        with self._lock_contadores:
+            self._operaciones[operacion] += 1
+            if revisados:
+                self._revisados[operacion] += revisados
+
+    def contadores(self):
+        # (operaciones, registros revisados por operación), acumulados desde la activación
+        with self._lock_contadores:
+            if self._operaciones is None:
+                return {}, {}
+            return dict(self._operaciones), dict(self._revisados)
+
+    def _lock_libro(self, id_libro):
+        return self._locks_libros[hash(id_libro) % CANTIDAD_LOCKS]
+
+    def _lock_usuario(self, id_usuario):
+        return self._locks_users[hash(id_usuario) % CANTIDAD_LOCKS]
+
+    def _sumar_libro(self, libro, signo=1):
+        # Suma (o resta, con signo=-1) un libro a los totales
+        with self._lock_totales:
+            self._stock_total += signo * libro.stock
+            self._prestados_total += signo * libro.prestados
+            self._libros_por_genero[libro.genero] += signo
+            if self._libros_por_genero[libro.genero] <= 0:
+                del self._libros_por_genero[libro.genero]
+
+    def _sumar_prestamo(self, usuario, signo=1, con_stock=True):
+        # Se llama después de anotar o quitar el préstamo en el registro
+        cantidad = len(self._prestamos_usuario.get(usuario.id_usuario, ()))
+        with self._lock_totales:
+            if con_stock:
+                self._stock_total -= signo
+                self._prestados_total += signo
+            if cantidad == (1 if signo > 0 else 0):
+                self._usuarios_con_prestamos += signo
+
+    def _anotar_prestamo(self, usuario, libro, fecha=None, vence=None):
+        # Con los locks del usuario y del libro tomados
+        prestamo = Prestamo(usuario.id_usuario, libro.id_libro, fecha, vence)
+        self._prestamos_usuario.setdefault(usuario.id_usuario, {})[libro.id_libro] = prestamo
+        self._prestatarios.setdefault(libro.id_libro, set()).add(usuario.id_usuario)
+        self._vencimientos.agregar(usuario.id_usuario, libro.id_libro, prestamo.vence)
+        return prestamo
+
+    def _sumar_popularidad(self, id_usuario, id_libro, cantidad):
+        # La popularidad de un libro es libro.prestados; la de un usuario,
+        # la cantidad de libros que tiene prestados
+        for indice in self._prefijos_libros.values():
+            indice.sumar_popularidad(id_libro, cantidad)
+        for indice in self._prefijos_users.values():
+            indice.sumar_popularidad(id_usuario, cantidad)
+
+    def _quitar_prestamo(self, usuario, libro):
+        prestamos = self._prestamos_usuario[usuario.id_usuario]
+        del prestamos[libro.id_libro]
+        if not prestamos:
+            del self._prestamos_usuario[usuario.id_usuario]
+        prestatarios = self._prestatarios[libro.id_libro]
+        prestatarios.discard(usuario.id_usuario)
+        if not prestatarios:
+            del self._prestatarios[libro.id_libro]
+        self._vencimientos.quitar(usuario.id_usuario, libro.id_libro)
 
     def agregar_libro(self, libro):
-        self.libros.append(libro)
+        # Con el lock del libro: un préstamo simultáneo del libro recién agregado
+        # no puede quedar en el registro antes que el alta
+        with self._escritura, self._lock_libro(libro.id_libro):
+            anterior = self._libros.get(libro.id_libro)
+            if anterior is not None:
+                self._sumar_libro(anterior, -1)
+            self._internar(libro)
+            self._libros[libro.id_libro] = libro
+            self._ultimo_id_libro = max(self._ultimo_id_libro, libro.id_libro)
+            self._sumar_libro(libro)
+            self._indexar_libro(libro)
+            self._registrar(registro_libro(libro))
+
+    def editar_libro(self, libro, titulo, autor, genero, stock):
+        # Solo se permite AUMENTAR el stock: si el nuevo es menor se mantiene el actual.
+        # Se compara con el lock del libro tomado para no pisar un préstamo simultáneo
+        with self._escritura, self._lock_libro(libro.id_libro):
+            stock = max(stock, libro.stock)
+            self._sumar_libro(libro, -1)
+            libro.titulo = titulo
+            libro.autor = autor
+            libro.genero = genero
+            libro.stock = stock
+            libro.actualizar_claves()
+            self._internar(libro)
+            libro.version = siguiente_version()
+            self._sumar_libro(libro)
+            self._indexar_libro(libro)
+            self._registrar(["editar_libro", libro.id_libro, titulo, autor, genero, stock])
+        # Los ejemplares nuevos son primero para los que esperan el libro
+        self._atender_reservas(libro.id_libro)
+
+    def _internar(self, libro):
+        # Autor y género se repiten en muchos libros: una sola copia de cada texto
+        libro.autor = sys.intern(libro.autor)
+        libro.genero = sys.intern(libro.genero)
+        libro.autor_n = sys.intern(libro.autor_n)
+        libro.genero_n = sys.intern(libro.genero_n)
+
+    def _indexar_libro(self, libro):
+        # Los índices guardan las mismas claves normalizadas del libro, sin copiarlas
+        for campo, indice in self._indice_libros.items():
+            indice.agregar(libro.id_libro, getattr(libro, campo + "_n"))
+        for campo, indice in self._orden_libros.items():
+            indice.agregar(libro.id_libro, getattr(libro, campo + "_n"))
+        for campo, indice in self._prefijos_libros.items():
+            indice.agregar(libro.id_libro, getattr(libro, campo), libro.prestados, getattr(libro, campo + "_n"))
+
+    def buscar_libros(self, q, campo="titulo"):
+        # Sin distinguir mayúsculas ni tildes; una búsqueda vacía devuelve todo el catálogo
+        validar_campo_libros(campo)
+        q = normalizar(q)
+        if not q:
+            return self.libros
+        indice = self._indice_libros[campo]
+        with self._escritura:
+            revisados = indice.revisados
+            ids = indice.buscar(q)
+            self._contar("busqueda_libros", indice.revisados - revisados)
+            return [self._libros[i] for i in ids]
+
+    def consultar_libros(self, q="", campo="titulo", descendente=False, desde=None, limite=None):
+        # Búsqueda completa usada por las rutas: filtra, ordena y pagina.
+        # Devuelve (total de coincidencias, iterador con los libros de la página)
+        validar_campo_libros(campo)
+        if q:
+            libros = self.buscar_libros(q, campo)
+            total = len(libros)
+        else:
+            # Sin búsqueda recorremos directamente el índice, sin copiar el catálogo
+            libros = None
+            total = len(self._libros)
+        return total, islice(self.recorrer_libros(libros, campo, descendente, desde), limite)
+
+    def libros_disponibles(self):
+        self._contar("recorrido_libros", len(self._libros))
+        return [l for l in self.libros if l.stock > 0]
+
+    def siguiente_id_libro(self):
+        # Reserva y devuelve un id nuevo (dos peticiones simultáneas nunca reciben el mismo)
+        with self._escritura:
+            self._ultimo_id_libro += 1
+            return self._ultimo_id_libro
+
+    def agregar_libros(self, libros):
+        # Alta de un lote (importación): los libros sin id reciben uno nuevo
+        with self._escritura:
+            for libro in libros:
+                if libro.id_libro is None:
+                    libro.id_libro = self.siguiente_id_libro()
+                self.agregar_libro(libro)
+
+    def ordenar_libros(self, libros, campo="titulo", descendente=False):
+        return list(self.recorrer_libros(libros, campo, descendente))
+
+    def recorrer_libros(self, libros=None, campo="titulo", descendente=False, desde=None):
+        # Generador de libros en orden; libros=None recorre todo el catálogo.
+        # desde es un cursor devuelto por cursor_libro() para continuar la página siguiente
+        indice = self._orden_libros[self._campo_orden_libros(campo)]
+        if libros is None:
+            self._contar("listado_libros")
+            ids = indice.recorrer(descendente, desde)
+        else:
+            self._contar("ordenamiento_libros", len(libros))
+            with self._escritura:
+                ids = indice.ordenar([l.id_libro for l in libros], descendente, desde)
+        for id_libro in ids:
+            # Un libro eliminado mientras se recorre la página simplemente se saltea
+            libro = self._libros.get(id_libro)
+            if libro is not None:
+                yield libro
+
+    def cursor_libro(self, libro, campo="titulo"):
+        campo = self._campo_orden_libros(campo)
+        return (getattr(libro, campo + "_n"), libro.id_libro)
+
+    def _campo_orden_libros(self, campo):
+        # Si el campo no tiene índice de orden, ordenamos por título
+        return campo if campo in self._orden_libros else "titulo"
+
+    def obtener_libro(self, id_libro):
+        self._contar("consulta_id_libro")
+        return self._libros.get(id_libro)
 
     def obtener_libro_por_titulo(self, titulo):
+        self._contar("recorrido_libros", len(self._libros))
+        titulo = normalizar(titulo)
         for libro in self.libros:
-            if libro.titulo.lower() == titulo.lower():
+            if libro.titulo_n == titulo:
                 return libro
         return None
 
     def total_libros(self):
-        return len(self.libros)
+        return len(self._libros)
 
     def disponibles(self):
-        return sum(l.stock for l in self.libros)
+        return self._stock_total
 
     def prestados(self):
-        return sum(l.prestados for l in self.libros)
+        return self._prestados_total
 
-    def eliminar(self, titulo):
-        for libro in self.libros:
-            if libro.titulo == titulo:
-                self.libros.remove(libro)
-                break
+    def estadisticas(self):
+        # Resumen para el tablero: no recorre el catálogo, lee los totales acumulados
+        with self._lock_totales:
+            return {
+                "libros": len(self._libros),
+                "usuarios": len(self._users),
+                "disponibles": self._stock_total,
+                "prestados": self._prestados_total,
+                "usuarios_con_prestamos": self._usuarios_con_prestamos,
+                "libros_por_genero": dict(self._libros_por_genero),
+            }
+
+    def eliminar(self, id_libro):
+        # No se puede eliminar un libro que tiene ejemplares prestados;
+        # la validación y la baja se hacen con el lock del libro tomado
+        with self._escritura, self._lock_libro(id_libro):
+            libro = self._libros.get(id_libro)
+            if libro is None:
+                raise NoEncontrado("Libro no encontrado")
+            if libro.prestados > 0:
+                raise ErrorBiblioteca(
+                    f"No se puede eliminar el libro '{libro.titulo}' porque tiene "
+                    f"{libro.prestados} ejemplar(es) prestado(s)."
+                )
+            del self._libros[id_libro]
+            self._sumar_libro(libro, -1)
+            for indice in self._indice_libros.values():
+                indice.quitar(id_libro)
+            for indice in self._orden_libros.values():
+                indice.quitar(id_libro)
+            for indice in self._prefijos_libros.values():
+                indice.quitar(id_libro)
+            # Las reservas del libro se descartan con él
+            with self._lock_reservas:
+                for id_usuario in self._reservas.pop(id_libro, {}):
+                    self._quitar_de(self._reservas_usuario, id_usuario, id_libro)
+            self._registrar(["eliminar_libro", id_libro])
+            return libro
+
+    def prestar(self, id_usuario, id_libro, fecha=None, vence=None):
+        # Préstamo atómico: las validaciones y el cambio de stock se hacen con los
+        # locks del usuario y del libro tomados, así dos préstamos simultáneos
+        # no pueden llevarse el último ejemplar.
+        # fecha y vence solo se indican al reconstruir desde el registro de operaciones
+        with self._lock_usuario(id_usuario), self._lock_libro(id_libro):
+            usuario = self._users.get(id_usuario)
+            libro = self._libros.get(id_libro)
+            self._validar_prestamo(usuario, libro)
+            return self._prestar(usuario, libro, fecha, vence)
+
+    def _validar_prestamo(self, usuario, libro, atendidos=()):
+        # atendidos: usuarios que se llevan el libro en pares anteriores del mismo lote.
+        # El resultado es el mismo que si esos préstamos ya se hubieran hecho
+        if usuario is None or libro is None:
+            raise NoEncontrado("Usuario o libro no encontrado.")
+        if usuario.id_usuario in atendidos or self.tiene_libro(usuario.id_usuario, libro.id_libro):
+            raise ErrorBiblioteca(f"El usuario {usuario.nombre} ya tiene el libro '{libro.titulo}'.")
+        disponibles = libro.stock - len(atendidos)
+        if disponibles <= 0:
+            raise ErrorBiblioteca(f"No hay ejemplares disponibles de '{libro.titulo}'.")
+        # Con reservas pendientes, los ejemplares disponibles son primero de los de la fila
+        # (sin los que ya se lo llevan en el lote: su reserva queda cumplida); solo
+        # los que sobran pueden ir a otro usuario
+        with self._lock_reservas:
+            fila = self._reservas.get(libro.id_libro)
+            if fila:
+                primeros = list(islice((u for u in fila if u not in atendidos), disponibles))
+                if len(primeros) == disponibles and usuario.id_usuario not in primeros:
+                    raise ErrorBiblioteca(f"Los ejemplares de '{libro.titulo}' están reservados por otros usuarios.")
+
+    def _prestar(self, usuario, libro, fecha=None, vence=None):
+        # Con los locks del usuario y del libro tomados y el préstamo ya validado.
+        # Si el usuario tenía el libro reservado, la reserva queda cumplida
+        self._contar("prestamo")
+        with self._lock_reservas:
+            self._quitar_reserva(usuario.id_usuario, libro.id_libro)
+        prestamo = self._anotar_prestamo(usuario, libro, fecha, vence)
+        usuario.libros.append(libro)
+        usuario.version = siguiente_version()
+        libro.prestar()
+        self._sumar_prestamo(usuario)
+        self._sumar_popularidad(usuario.id_usuario, libro.id_libro, 1)
+        self._registrar(registro_prestamo("prestar", prestamo))
+        return usuario, libro
+
+    def devolver(self, id_usuario, id_libro):
+        # Si el libro tiene reservas, el ejemplar devuelto se le presta enseguida
+        # al primero de la fila (ver _atender_reservas)
+        with self._lock_usuario(id_usuario), self._lock_libro(id_libro):
+            usuario = self._users.get(id_usuario)
+            libro = self._libros.get(id_libro)
+            self._validar_devolucion(usuario, libro)
+            resultado = self._devolver(usuario, libro)
+        self._atender_reservas(id_libro)
+        return resultado
+
+    def _validar_devolucion(self, usuario, libro, en_lote=False):
+        # en_lote: la misma devolución ya está antes en el lote
+        if usuario is None or libro is None:
+            raise NoEncontrado("Usuario o libro no encontrado")
+        if en_lote or not self.tiene_libro(usuario.id_usuario, libro.id_libro):
+            raise ErrorBiblioteca("El usuario no tiene este libro prestado.")
+
+    def _devolver(self, usuario, libro):
+        self._contar("devolucion")
+        self._quitar_prestamo(usuario, libro)
+        usuario.libros.remove(libro)
+        usuario.version = siguiente_version()
+        libro.devolver()
+        self._sumar_prestamo(usuario, -1)
+        self._sumar_popularidad(usuario.id_usuario, libro.id_libro, -1)
+        self._registrar(["devolver", usuario.id_usuario, libro.id_libro])
+        return usuario, libro
+
+    # ---------- Préstamos y devoluciones en lote ----------
+
+    @contextmanager
+    def _locks_lote(self, pares):
+        # Locks de todos los usuarios y libros del lote, en el mismo orden que una
+        # operación suelta (usuarios antes que libros) y cada grupo por posición:
+        # dos lotes, o un lote y un préstamo, nunca se esperan entre sí en círculo
+        posiciones_users = sorted({hash(id_usuario) % CANTIDAD_LOCKS for id_usuario, _ in pares})
+        posiciones_libros = sorted({hash(id_libro) % CANTIDAD_LOCKS for _, id_libro in pares})
+        with ExitStack() as locks:
+            for posicion in posiciones_users:
+                locks.enter_context(self._locks_users[posicion])
+            for posicion in posiciones_libros:
+                locks.enter_context(self._locks_libros[posicion])
+            yield
+
+    def prestar_lote(self, pares, todo_o_nada=False):
+        # Presta cada par (id_usuario, id_libro) de la lista en una sola pasada.
+        # Devuelve (aplicado, resultados), con un resultado por par en el mismo orden:
+        # (usuario, libro) o el ErrorBiblioteca que lo rechazó. Primero se valida todo
+        # el lote contando lo que ya tomaron los pares anteriores; con todo_o_nada,
+        # si algún par falla no se presta ninguno (y aplicado es False)
+        pares = list(pares)
+        with self._locks_lote(pares):
+            resultados = []
+            # id_libro -> usuarios que se lo llevan en los pares ya validados
+            atendidos = defaultdict(set)
+            for id_usuario, id_libro in pares:
+                usuario = self._users.get(id_usuario)
+                libro = self._libros.get(id_libro)
+                try:
+                    self._validar_prestamo(usuario, libro, atendidos[id_libro])
+                except ErrorBiblioteca as error:
+                    resultados.append(error)
+                    continue
+                atendidos[id_libro].add(id_usuario)
+                resultados.append((usuario, libro))
+            return self._aplicar_lote(resultados, todo_o_nada, self._prestar)
+
+    def devolver_lote(self, pares, todo_o_nada=False):
+        # Igual que prestar_lote(), para las devoluciones
+        pares = list(pares)
+        with self._locks_lote(pares):
+            resultados = []
+            vistos = set()
+            for id_usuario, id_libro in pares:
+                usuario = self._users.get(id_usuario)
+                libro = self._libros.get(id_libro)
+                try:
+                    self._validar_devolucion(usuario, libro, (id_usuario, id_libro) in vistos)
+                except ErrorBiblioteca as error:
+                    resultados.append(error)
+                    continue
+                vistos.add((id_usuario, id_libro))
+                resultados.append((usuario, libro))
+            aplicado, resultados = self._aplicar_lote(resultados, todo_o_nada, self._devolver)
+        if aplicado:
+            for id_libro in {r[1].id_libro for r in resultados if not isinstance(r, ErrorBiblioteca)}:
+                self._atender_reservas(id_libro)
+        return aplicado, resultados
+
+    def _aplicar_lote(self, resultados, todo_o_nada, operacion):
+        if todo_o_nada and any(isinstance(r, ErrorBiblioteca) for r in resultados):
+            return False, resultados
+        for resultado in resultados:
+            if not isinstance(resultado, ErrorBiblioteca):
+                operacion(*resultado)
+        return True, resultados
+
+    def restaurar_prestamo(self, id_usuario, id_libro, fecha=None, vence=None):
+        # Usado al cargar una instantánea: el stock del libro ya refleja el préstamo,
+        # solo falta asociarlo al usuario
+        with self._lock_usuario(id_usuario), self._lock_libro(id_libro):
+            usuario = self._users[id_usuario]
+            libro = self._libros[id_libro]
+            self._anotar_prestamo(usuario, libro, fecha, vence)
+            usuario.libros.append(libro)
+            usuario.version = siguiente_version()
+            self._sumar_prestamo(usuario, con_stock=False)
+            # libro.prestados ya contaba este préstamo: solo cambia el usuario
+            for indice in self._prefijos_users.values():
+                indice.sumar_popularidad(id_usuario, 1)
+
+    # ---------- Reservas ----------
+
+    def reservar(self, id_usuario, id_libro, fecha=None):
+        # Anota al usuario al final de la fila de espera del libro. Solo se reserva
+        # un libro sin ejemplares libres: si hay alguno, se presta directamente.
+        # Devuelve (usuario, libro, lugar en la fila)
+        with self._lock_usuario(id_usuario), self._lock_libro(id_libro):
+            usuario = self._users.get(id_usuario)
+            libro = self._libros.get(id_libro)
+            if usuario is None or libro is None:
+                raise NoEncontrado("Usuario o libro no encontrado.")
+            if self.tiene_libro(id_usuario, id_libro):
+                raise ErrorBiblioteca(f"El usuario {usuario.nombre} ya tiene el libro '{libro.titulo}'.")
+            with self._lock_reservas:
+                fila = self._reservas.get(id_libro, {})
+                if id_usuario in fila:
+                    raise ErrorBiblioteca(f"El usuario {usuario.nombre} ya reservó el libro '{libro.titulo}'.")
+                # Los ejemplares disponibles que no esperan a nadie de la fila se pueden prestar
+                if libro.stock > len(fila):
+                    raise ErrorBiblioteca(
+                        f"Hay ejemplares disponibles de '{libro.titulo}': se puede prestar directamente."
+                    )
+                reserva = self._anotar_reserva(id_usuario, id_libro, fecha)
+                lugar = len(self._reservas[id_libro])
+            self._registrar(registro_reserva("reservar", reserva))
+            return usuario, libro, lugar
+
+    def cancelar_reserva(self, id_usuario, id_libro):
+        with self._lock_usuario(id_usuario), self._lock_libro(id_libro):
+            with self._lock_reservas:
+                reserva = self._quitar_reserva(id_usuario, id_libro)
+            if reserva is None:
+                raise ErrorBiblioteca("El usuario no tiene reservado este libro.")
+            self._registrar(["cancelar_reserva", id_usuario, id_libro])
+        # Si había un ejemplar esperándolo, pasa al siguiente de la fila
+        self._atender_reservas(id_libro)
+
+    def restaurar_reserva(self, id_usuario, id_libro, fecha=None):
+        # Usado al cargar una instantánea, que trae las filas ya en orden
+        with self._lock_reservas:
+            self._anotar_reserva(id_usuario, id_libro, fecha)
+
+    def _anotar_reserva(self, id_usuario, id_libro, fecha=None):
+        # Con _lock_reservas tomado
+        reserva = Reserva(id_usuario, id_libro, fecha)
+        self._reservas.setdefault(id_libro, {})[id_usuario] = reserva
+        self._reservas_usuario.setdefault(id_usuario, {})[id_libro] = reserva
+        return reserva
+
+    def _quitar_reserva(self, id_usuario, id_libro):
+        # Con _lock_reservas tomado. Devuelve la reserva quitada, o None si no había
+        reserva = self._quitar_de(self._reservas, id_libro, id_usuario)
+        if reserva is not None:
+            self._quitar_de(self._reservas_usuario, id_usuario, id_libro)
+        return reserva
+
+    def _quitar_de(self, reservas, clave, id_registro):
+        grupo = reservas.get(clave)
+        if grupo is None:
+            return None
+        reserva = grupo.pop(id_registro, None)
+        if not grupo:
+            del reservas[clave]
+        return reserva
+
+    def _atender_reservas(self, id_libro):
+        # Presta los ejemplares disponibles del libro a los primeros de su fila.
+        # Se llama sin locks tomados: se toman los del primero de la fila y, si
+        # mientras tanto la fila cambió, se vuelve a mirar quién es el primero
+        if not self.asignar_reservas:
+            return
+        while True:
+            with self._lock_reservas:
+                fila = self._reservas.get(id_libro)
+                if not fila:
+                    return
+                id_usuario = next(iter(fila))
+            with self._lock_usuario(id_usuario), self._lock_libro(id_libro):
+                libro = self._libros.get(id_libro)
+                if libro is None or libro.stock <= 0:
+                    return
+                with self._lock_reservas:
+                    primero = next(iter(self._reservas.get(id_libro, ())), None)
+                if primero == id_usuario:
+                    self._prestar(self._users[id_usuario], libro)
+
+    def reservas_de_libro(self, id_libro):
+        # Fila de espera del libro, del primero al último
+        with self._lock_reservas:
+            return list(self._reservas.get(id_libro, {}).values())
+
+    def reservas_de(self, id_usuario):
+        # Libros que el usuario está esperando, en el orden en que los reservó
+        with self._lock_reservas:
+            return list(self._reservas_usuario.get(id_usuario, {}).values())
+
+    def reservas(self):
+        # Todas las filas de espera (para la instantánea), cada una en orden
+        with self._lock_reservas:
+            return [reserva for fila in self._reservas.values() for reserva in fila.values()]
+
+    # ---------- Consultas de préstamos ----------
+
+    def tiene_libro(self, id_usuario, id_libro):
+        return id_libro in self._prestamos_usuario.get(id_usuario, ())
+
+    def ids_libros_prestados(self, id_usuario):
+        return set(self._prestamos_usuario.get(id_usuario, ()))
+
+    def prestamo(self, id_usuario, id_libro):
+        return self._prestamos_usuario.get(id_usuario, {}).get(id_libro)
+
+    def prestamos_de(self, id_usuario):
+        # Préstamos vigentes del usuario, en el orden en que se hicieron
+        return list(self._prestamos_usuario.get(id_usuario, {}).values())
+
+    def vencidos(self, hasta=None, limite=None):
+        # Préstamos vigentes que vencen hasta "hasta" (por defecto, ahora), del más
+        # atrasado al menos. Solo se revisan los vencidos (ver IndiceVencimientos)
+        claves = self._vencimientos.vencidos(hasta or ahora(), limite)
+        self._contar("vencidos", len(claves))
+        prestamos = self._prestamos_usuario
+        resultado = []
+        for id_usuario, id_libro in claves:
+            # Un préstamo devuelto mientras tanto simplemente no aparece
+            prestamo = prestamos.get(id_usuario, {}).get(id_libro)
+            if prestamo is not None:
+                resultado.append(prestamo)
+        return resultado
+
+    def prestatarios(self, id_libro):
+        # Usuarios que tienen actualmente un ejemplar del libro
+        ids = list(self._prestatarios.get(id_libro, ()))
+        return [self._users[i] for i in ids if i in self._users]
 
     def total_usuarios(self):
-        return len(self.users)
+        return len(self._users)
 
     def agregar_usuario(self, usuario):
-        self.users.append(usuario)
+        # Si el usuario ya trae libros en usuario.libros, se anotan como préstamos
+        # (el stock de esos libros ya debe reflejarlo, como en una instantánea)
+        with self._escritura, self._lock_usuario(usuario.id_usuario):
+            if usuario.id_usuario in self._users:
+                raise ErrorBiblioteca(f"Ya existe un usuario con id {usuario.id_usuario}.")
+            self._users[usuario.id_usuario] = usuario
+            self._ultimo_id_usuario = max(self._ultimo_id_usuario, usuario.id_usuario)
+            for libro in usuario.libros:
+                with self._lock_libro(libro.id_libro):
+                    self._anotar_prestamo(usuario, libro)
+            if usuario.libros:
+                self._sumar_prestamo(usuario, con_stock=False)
+            self._indexar_usuario(usuario)
+            self._registrar(registro_usuario(usuario))
+
+    def editar_usuario(self, usuario, nombre, apellido, telefono, direccion, nro_direccion):
+        with self._escritura, self._lock_usuario(usuario.id_usuario):
+            usuario.nombre = nombre
+            usuario.apellido = apellido
+            usuario.telefono = telefono
+            usuario.direccion = direccion
+            usuario.nro_direccion = nro_direccion
+            usuario.actualizar_claves()
+            usuario.version = siguiente_version()
+            self._indexar_usuario(usuario)
+            self._registrar(
+                ["editar_usuario", usuario.id_usuario, nombre, apellido, telefono, direccion, nro_direccion]
+            )
+
+    def _indexar_usuario(self, usuario):
+        for campo, indice in self._orden_users.items():
+            indice.agregar(usuario.id_usuario, getattr(usuario, campo + "_n"))
+        prestamos = len(self._prestamos_usuario.get(usuario.id_usuario, ()))
+        for campo, indice in self._prefijos_users.items():
+            indice.agregar(usuario.id_usuario, getattr(usuario, campo), prestamos, getattr(usuario, campo + "_n"))
+
+    def obtener_usuario(self, id_usuario):
+        self._contar("consulta_id_usuario")
+        return self._users.get(id_usuario)
+
+    def buscar_usuarios(self, texto, campo="nombre"):
+        # Busca por nombre, apellido, DNI o por el título de algún libro prestado,
+        # sin distinguir mayúsculas ni tildes (compara con las claves ya normalizadas)
+        texto = normalizar(texto)
+        users = self.users
+        if not texto:
+            return users
+        if campo == "nombre":
+            self._contar("recorrido_usuarios", len(users))
+            return [u for u in users if texto in u.nombre_n]
+        if campo == "apellido":
+            self._contar("recorrido_usuarios", len(users))
+            return [u for u in users if texto in u.apellido_n]
+        if campo == "dni":
+            self._contar("recorrido_usuarios", len(users))
+            return [u for u in users if texto in u.dni_n]
+        if campo == "libros":
+            # Libros cuyo título coincide (índice de n-gramas) -> quiénes los tienen
+            with self._escritura:
+                indice = self._indice_libros["titulo"]
+                revisados = indice.revisados
+                ids_libros = indice.buscar(texto)
+                self._contar("busqueda_usuarios_por_libro", indice.revisados - revisados)
+            ids = set()
+            for id_libro in ids_libros:
+                ids.update(self._prestatarios.get(id_libro, ()))
+            return [self._users[i] for i in ids if i in self._users]
+        return []
+
+    def consultar_usuarios(self, q="", campo="nombre", descendente=False, desde=None, limite=None):
+        # Igual que consultar_libros(): devuelve (total, iterador de la página)
+        if q:
+            users = self.buscar_usuarios(q, campo)
+            total = len(users)
+        else:
+            users = None
+            total = len(self._users)
+        return total, islice(self.recorrer_usuarios(users, campo, descendente, desde), limite)
+
+    def siguiente_id_usuario(self):
+        with self._escritura:
+            self._ultimo_id_usuario += 1
+            return self._ultimo_id_usuario
 
-    def buscar_usuarios(self, nombre):
-        texto = nombre.lower()
-        return [user for user in self.users if texto in user.nombre.lower()]
+    def agregar_usuarios(self, users):
+        with self._escritura:
+            for usuario in users:
+                if usuario.id_usuario is None:
+                    usuario.id_usuario = self.siguiente_id_usuario()
+                self.agregar_usuario(usuario)
+
+    def agregar_si_vacia(self, libros, users):
+        # Datos iniciales: se agregan solo si no hay libros ni usuarios.
+        # La verificación y las altas se hacen con el lock de escritura tomado,
+        # así varios procesos que arrancan a la vez no los cargan dos veces
+        with self._escritura:
+            if self._libros or self._users:
+                return False
+            for libro in libros:
+                self.agregar_libro(libro)
+            for usuario in users:
+                self.agregar_usuario(usuario)
+            return True
+
+    def ordenar_usuarios(self, users, campo="nombre", descendente=False):
+        return list(self.recorrer_usuarios(users, campo, descendente))
+
+    def recorrer_usuarios(self, users=None, campo="nombre", descendente=False, desde=None):
+        indice = self._orden_users[self._campo_orden_usuarios(campo)]
+        if users is None:
+            self._contar("listado_usuarios")
+            ids = indice.recorrer(descendente, desde)
+        else:
+            self._contar("ordenamiento_usuarios", len(users))
+            with self._escritura:
+                ids = indice.ordenar([u.id_usuario for u in users], descendente, desde)
+        for id_usuario in ids:
+            usuario = self._users.get(id_usuario)
+            if usuario is not None:
+                yield usuario
+
+    def cursor_usuario(self, usuario, campo="nombre"):
+        campo = self._campo_orden_usuarios(campo)
+        return (getattr(usuario, campo + "_n"), usuario.id_usuario)
+
+    def _campo_orden_usuarios(self, campo):
+        # Si el campo no tiene índice de orden (ej: "libros"), ordenamos por nombre
+        return campo if campo in self._orden_users else "nombre"
 
     def eliminar_usuario(self, id_usuario):
-        self.users = [user for user in self.users if user.id_usuario != id_usuario]
+        # No se puede eliminar un usuario que tiene libros prestados
+        with self._escritura, self._lock_usuario(id_usuario):
+            usuario = self._users.get(id_usuario)
+            if usuario is None:
+                raise NoEncontrado("Usuario no encontrado")
+            if usuario.libros:
+                titulos = ", ".join([l.titulo for l in usuario.libros])
+                raise ErrorBiblioteca(
+                    f"No se puede eliminar al usuario {usuario.nombre} {usuario.apellido} "
+                    f"porque tiene libro(s) prestado(s): {titulos}"
+                )
+            del self._users[id_usuario]
+            for indice in self._orden_users.values():
+                indice.quitar(id_usuario)
+            for indice in self._prefijos_users.values():
+                indice.quitar(id_usuario)
+            # Sus reservas se descartan: si alguna tenía un ejemplar esperándolo,
+            # pasa al siguiente de la fila
+            with self._lock_reservas:
+                reservados = list(self._reservas_usuario.pop(id_usuario, {}))
+                for id_libro in reservados:
+                    self._quitar_de(self._reservas, id_libro, id_usuario)
+            self._registrar(["eliminar_usuario", id_usuario])
+        for id_libro in reservados:
+            self._atender_reservas(id_libro)
+        return usuario
+
+    def autocompletar(self, q, campo="titulo", limite=10):
+        # Sugerencias de textos que empiezan con q, de los más prestados a los menos.
+        # No toma el lock de escritura: cada índice de prefijos tiene el suyo
+        indice = self._prefijos_libros.get(campo) or self._prefijos_users.get(campo)
+        self._contar("autocompletado")
+        if indice is None:
+            raise ErrorBiblioteca(f"No hay sugerencias para el campo '{campo}'.")
+        return [{"texto": texto, "popularidad": popularidad} for texto, popularidad in indice.sugerir(q, limite)]
+
+    @contextmanager
+    def carga_masiva(self):
+        # Mientras dure el bloque, los índices se arman al final: los de orden
+        # con un único ordenamiento en vez de una inserción ordenada por alta,
+        # y los de n-gramas agrupando los registros que comparten texto.
+        # Tampoco se publican eventos: los clientes reciben un solo "reiniciar"
+        with self._escritura:
+            indices = (
+                list(self._indice_libros.values())
+                + list(self._orden_libros.values())
+                + list(self._orden_users.values())
+                + list(self._prefijos_libros.values())
+                + list(self._prefijos_users.values())
+                + [self._vencimientos]
+            )
+            for indice in indices:
+                indice.diferir()
+            eventos, self.eventos = self.eventos, None
+            try:
+                yield self
+            finally:
+                for indice in indices:
+                    indice.reanudar()
+                self.eventos = eventos
+                if eventos is not None:
+                    eventos.reiniciar()
+
+    def restaurar(self, libros, users, prestamos, reservas):
+        # Carga una instantánea (ver Persistencia.cargar) en una biblioteca vacía en
+        # una sola pasada: llena los diccionarios y arma cada índice de una vez
+        # (armar()), sin un agregar_libro / restaurar_prestamo por registro con sus
+        # locks, totales y popularidad de a uno. El stock de los libros ya refleja
+        # los préstamos, y usuario.libros queda en el orden de la instantánea
+        with self._escritura:
+            if self._libros or self._users:
+                raise ErrorBiblioteca("Solo se puede restaurar una instantánea en una biblioteca vacía.")
+            for libro in libros:
+                self._internar(libro)
+                self._libros[libro.id_libro] = libro
+            for usuario in users:
+                self._users[usuario.id_usuario] = usuario
+            for prestamo in prestamos:
+                usuario = self._users[prestamo.id_usuario]
+                libro = self._libros[prestamo.id_libro]
+                self._prestamos_usuario.setdefault(usuario.id_usuario, {})[libro.id_libro] = prestamo
+                self._prestatarios.setdefault(libro.id_libro, set()).add(usuario.id_usuario)
+                usuario.libros.append(libro)
+            with self._lock_reservas:
+                for reserva in reservas:
+                    self._reservas.setdefault(reserva.id_libro, {})[reserva.id_usuario] = reserva
+                    self._reservas_usuario.setdefault(reserva.id_usuario, {})[reserva.id_libro] = reserva
+
+            for campo, indice in self._indice_libros.items():
+                indice.armar((l.id_libro, getattr(l, campo + "_n")) for l in libros)
+            for campo, indice in self._orden_libros.items():
+                indice.armar((l.id_libro, getattr(l, campo + "_n")) for l in libros)
+            for campo, indice in self._prefijos_libros.items():
+                indice.armar(
+                    (l.id_libro, getattr(l, campo), l.prestados, getattr(l, campo + "_n")) for l in libros
+                )
+            for campo, indice in self._orden_users.items():
+                indice.armar((u.id_usuario, getattr(u, campo + "_n")) for u in users)
+            for campo, indice in self._prefijos_users.items():
+                indice.armar(
+                    (u.id_usuario, getattr(u, campo), len(u.libros), getattr(u, campo + "_n")) for u in users
+                )
+            self._vencimientos.armar((p.id_usuario, p.id_libro, p.vence) for p in prestamos)
+
+            with self._lock_totales:
+                self._stock_total = sum(libro.stock for libro in libros)
+                self._prestados_total = sum(libro.prestados for libro in libros)
+                self._libros_por_genero = Counter(libro.genero for libro in libros)
+                self._usuarios_con_prestamos = len(self._prestamos_usuario)
+                self.generacion += 1
+            self._ultimo_id_libro = max(self._libros, default=0)
+            self._ultimo_id_usuario = max(self._users, default=0)
+
+    @contextmanager
+    def exclusiva(self):
+        # Toma todos los locks: mientras dure el bloque no hay ninguna operación
+        # a medio registrar y el estado se puede copiar de forma consistente
+        with self._escritura, ExitStack() as locks:
+            for lock in self._locks_users + self._locks_libros:
+                locks.enter_context(lock)
+            yield self
+
+    def compactar(self):
+        # Escribe una instantánea del estado actual y descarta el registro ya incluido
+        with self.exclusiva():
+            if self.persistencia is not None:
+                self.persistencia.compactar(self)
@@ -0,0 +1,993 @@
+import itertools
+import sqlite3
+import threading
+from contextlib import contextmanager
+from datetime import datetime
+
+from models.biblioteca import (
+    CAMPOS_AUTOCOMPLETAR_LIBROS,
+    CAMPOS_AUTOCOMPLETAR_USUARIOS,
+    ErrorBiblioteca,
+    NoEncontrado,
+    clave_orden,
+    validar_campo_libros,
+)
+from models.eventos import evento_baja_libro, evento_baja_usuario, evento_libro, evento_prestamo, evento_usuario
+from models.libro import Libro
+from models.prestamo import DIAS_PRESTAMO, Prestamo, Reserva, ahora
+from models.texto import normalizar
+from models.usuario import Usuario
+
+
+# Las columnas *_n guardan las claves normalizadas (sin mayúsculas ni acentos, el DNI
+# como texto, ver models/texto.py)
+# calculadas en Python, así la búsqueda y el orden dan lo mismo que en memoria
+ESQUEMA = """
+-- AUTOINCREMENT: los ids de libros y usuarios no se reutilizan después de una baja,
+-- igual que en la versión en memoria
+CREATE TABLE IF NOT EXISTS libros (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    titulo TEXT NOT NULL,
+    autor TEXT NOT NULL,
+    genero TEXT NOT NULL,
+    stock INTEGER NOT NULL,
+    prestados INTEGER NOT NULL DEFAULT 0,
+    titulo_n TEXT NOT NULL,
+    autor_n TEXT NOT NULL,
+    genero_n TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS libros_titulo ON libros (titulo_n, id);
+CREATE INDEX IF NOT EXISTS libros_autor ON libros (autor_n, id);
+CREATE INDEX IF NOT EXISTS libros_genero ON libros (genero_n, id);
+
+CREATE TABLE IF NOT EXISTS usuarios (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    nombre TEXT NOT NULL,
+    apellido TEXT NOT NULL,
+    dni,
+    telefono,
+    direccion,
+    nro_direccion,
+    nombre_n TEXT NOT NULL,
+    apellido_n TEXT NOT NULL,
+    dni_n TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS usuarios_nombre ON usuarios (nombre_n, id);
+CREATE INDEX IF NOT EXISTS usuarios_apellido ON usuarios (apellido_n, id);
+CREATE INDEX IF NOT EXISTS usuarios_dni ON usuarios (dni_n, id);
+
+-- Reemplaza a Usuario.libros: un registro por cada libro prestado a un usuario
+CREATE TABLE IF NOT EXISTS prestamos (
+    id INTEGER PRIMARY KEY,
+    id_usuario INTEGER NOT NULL REFERENCES usuarios (id),
+    id_libro INTEGER NOT NULL REFERENCES libros (id),
+    fecha TEXT,
+    vence TEXT,
+    UNIQUE (id_usuario, id_libro)
+);
+CREATE INDEX IF NOT EXISTS prestamos_libro ON prestamos (id_libro);
+
+-- Filas de espera de los libros sin ejemplares disponibles: el orden es el del id
+CREATE TABLE IF NOT EXISTS reservas (
+    id INTEGER PRIMARY KEY,
+    id_usuario INTEGER NOT NULL REFERENCES usuarios (id),
+    id_libro INTEGER NOT NULL REFERENCES libros (id),
+    fecha TEXT,
+    UNIQUE (id_usuario, id_libro)
+);
+CREATE INDEX IF NOT EXISTS reservas_libro ON reservas (id_libro, id);
+
+-- Índice de trigramas para buscar por subcadena en título, autor y género
+CREATE VIRTUAL TABLE IF NOT EXISTS libros_fts USING fts5(
+    titulo_n, autor_n, genero_n, content='libros', content_rowid='id', tokenize='trigram'
+);
+CREATE TRIGGER IF NOT EXISTS libros_fts_alta AFTER INSERT ON libros BEGIN
+    INSERT INTO libros_fts (rowid, titulo_n, autor_n, genero_n)
+    VALUES (new.id, new.titulo_n, new.autor_n, new.genero_n);
+END;
+CREATE TRIGGER IF NOT EXISTS libros_fts_baja AFTER DELETE ON libros BEGIN
+    INSERT INTO libros_fts (libros_fts, rowid, titulo_n, autor_n, genero_n)
+    VALUES ('delete', old.id, old.titulo_n, old.autor_n, old.genero_n);
+END;
+CREATE TRIGGER IF NOT EXISTS libros_fts_edicion AFTER UPDATE OF titulo_n, autor_n, genero_n ON libros BEGIN
+    INSERT INTO libros_fts (libros_fts, rowid, titulo_n, autor_n, genero_n)
+    VALUES ('delete', old.id, old.titulo_n, old.autor_n, old.genero_n);
+    INSERT INTO libros_fts (rowid, titulo_n, autor_n, genero_n)
+    VALUES (new.id, new.titulo_n, new.autor_n, new.genero_n);
+END;
+
+-- Totales que mantienen los triggers, para que el tablero no recorra las tablas.
+-- Si la base ya tenía datos se calculan una única vez al crear la tabla
+CREATE TABLE IF NOT EXISTS totales (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    libros INTEGER NOT NULL,
+    usuarios INTEGER NOT NULL,
+    stock INTEGER NOT NULL,
+    prestados INTEGER NOT NULL,
+    usuarios_con_prestamos INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS libros_por_genero (
+    genero TEXT PRIMARY KEY,
+    libros INTEGER NOT NULL
+);
+INSERT INTO libros_por_genero (genero, libros)
+    SELECT genero, COUNT(*) FROM libros WHERE NOT EXISTS (SELECT 1 FROM totales) GROUP BY genero;
+INSERT INTO totales
+    SELECT 1, (SELECT COUNT(*) FROM libros), (SELECT COUNT(*) FROM usuarios),
+        (SELECT COALESCE(SUM(stock), 0) FROM libros), (SELECT COALESCE(SUM(prestados), 0) FROM libros),
+        (SELECT COUNT(DISTINCT id_usuario) FROM prestamos)
+    WHERE NOT EXISTS (SELECT 1 FROM totales);
+
+-- Transacciones de escritura confirmadas por cualquier conexión, de este proceso
+-- o de otro (ver BibliotecaSQLite.generacion)
+CREATE TABLE IF NOT EXISTS generacion (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    numero INTEGER NOT NULL
+);
+INSERT OR IGNORE INTO generacion VALUES (1, 0);
+
+CREATE TRIGGER IF NOT EXISTS totales_libro_alta AFTER INSERT ON libros BEGIN
+    UPDATE totales SET libros = libros + 1, stock = stock + new.stock, prestados = prestados + new.prestados;
+    INSERT INTO libros_por_genero (genero, libros) VALUES (new.genero, 1)
+        ON CONFLICT (genero) DO UPDATE SET libros = libros + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS totales_libro_baja AFTER DELETE ON libros BEGIN
+    UPDATE totales SET libros = libros - 1, stock = stock - old.stock, prestados = prestados - old.prestados;
+    UPDATE libros_por_genero SET libros = libros - 1 WHERE genero = old.genero;
+    DELETE FROM libros_por_genero WHERE genero = old.genero AND libros <= 0;
+END;
+CREATE TRIGGER IF NOT EXISTS totales_libro_stock AFTER UPDATE OF stock, prestados ON libros BEGIN
+    UPDATE totales SET stock = stock + new.stock - old.stock, prestados = prestados + new.prestados - old.prestados;
+END;
+CREATE TRIGGER IF NOT EXISTS totales_libro_genero AFTER UPDATE OF genero ON libros
+WHEN old.genero <> new.genero BEGIN
+    UPDATE libros_por_genero SET libros = libros - 1 WHERE genero = old.genero;
+    DELETE FROM libros_por_genero WHERE genero = old.genero AND libros <= 0;
+    INSERT INTO libros_por_genero (genero, libros) VALUES (new.genero, 1)
+        ON CONFLICT (genero) DO UPDATE SET libros = libros + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS totales_usuario_alta AFTER INSERT ON usuarios BEGIN
+    UPDATE totales SET usuarios = usuarios + 1;
+END;
+CREATE TRIGGER IF NOT EXISTS totales_usuario_baja AFTER DELETE ON usuarios BEGIN
+    UPDATE totales SET usuarios = usuarios - 1;
+END;
+CREATE TRIGGER IF NOT EXISTS totales_prestamo_alta AFTER INSERT ON prestamos BEGIN
+    UPDATE totales SET usuarios_con_prestamos = usuarios_con_prestamos + 1
+    WHERE (SELECT COUNT(*) FROM prestamos WHERE id_usuario = new.id_usuario) = 1;
+END;
+CREATE TRIGGER IF NOT EXISTS totales_prestamo_baja AFTER DELETE ON prestamos BEGIN
+    UPDATE totales SET usuarios_con_prestamos = usuarios_con_prestamos - 1
+    WHERE NOT EXISTS (SELECT 1 FROM prestamos WHERE id_usuario = old.id_usuario);
+END;
+"""
+
+COLUMNAS_LIBRO = "id, titulo, autor, genero, stock, prestados"
+COLUMNAS_LIBRO_JOIN = "l.id, l.titulo, l.autor, l.genero, l.stock, l.prestados"
+COLUMNAS_USUARIO = "id, nombre, apellido, dni, telefono, direccion, nro_direccion"
+INSERTAR_LIBRO = (
+    "INSERT INTO libros (id, titulo, autor, genero, stock, prestados, titulo_n, autor_n, genero_n)"
+    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)"
+)
+
+# Campo pedido por la ruta -> columna normalizada por la que se filtra y ordena
+COLUMNAS_ORDEN_LIBROS = {"titulo": "titulo_n", "autor": "autor_n", "genero": "genero_n"}
+COLUMNAS_ORDEN_USUARIOS = {"nombre": "nombre_n", "apellido": "apellido_n", "dni": "dni_n"}
+
+# Cantidad de usuarios que se leen juntos al recorrer resultados,
+# para buscar los libros prestados de todos ellos en una sola consulta
+TAMANIO_LOTE_USUARIOS = 200
+
+
+class PoolConexiones:
+    # Una conexión por hilo, creada la primera vez que el hilo la pide.
+    # sqlite3 guarda en cada conexión las sentencias ya preparadas
+    # (cached_statements), así que las consultas repetidas no se vuelven a compilar.
+    def __init__(self, ruta):
+        self._memoria = ruta == ":memory:"
+        if self._memoria:
+            # Base en memoria compartida entre las conexiones de todos los hilos
+            ruta = f"file:biblioteca_{id(self)}?mode=memory&cache=shared"
+        self.ruta = ruta
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._conexiones = []
+
+    def obtener(self):
+        conexion = getattr(self._local, "conexion", None)
+        if conexion is None:
+            conexion = sqlite3.connect(
+                self.ruta,
+                uri=self._memoria,
+                isolation_level=None,
+                check_same_thread=False,
+                cached_statements=256,
+            )
+            conexion.execute("PRAGMA busy_timeout = 5000")
+            conexion.execute("PRAGMA foreign_keys = ON")
+            if not self._memoria:
+                conexion.execute("PRAGMA journal_mode = WAL")
+                conexion.execute("PRAGMA synchronous = NORMAL")
+            self._local.conexion = conexion
+            with self._lock:
+                self._conexiones.append(conexion)
+        return conexion
+
+    def cerrar(self):
+        with self._lock:
+            for conexion in self._conexiones:
+                conexion.close()
+            self._conexiones = []
+        self._local = threading.local()
+
+
+# Las copias leídas de la base no tienen versión: se arman de nuevo en cada
+# consulta y no se pueden comparar con una fila ya renderizada
+def fila_a_libro(fila):
+    libro = Libro(fila[0], fila[1], fila[2], fila[3], fila[4])
+    libro.prestados = fila[5]
+    libro.version = None
+    return libro
+
+
+def fila_de_libro(libro):
+    return (
+        libro.id_libro, libro.titulo, libro.autor, libro.genero, libro.stock, libro.prestados,
+        clave_orden(libro.titulo), clave_orden(libro.autor), clave_orden(libro.genero),
+    )
+
+
+def fila_a_usuario(fila, libros=None):
+    usuario = Usuario(*fila, libros=libros)
+    usuario.version = None
+    return usuario
+
+
+def fila_a_prestamo(fila):
+    prestamo = Prestamo(fila[0], fila[1])
+    prestamo.fecha = datetime.fromisoformat(fila[2]) if fila[2] else None
+    prestamo.vence = datetime.fromisoformat(fila[3]) if fila[3] else None
+    return prestamo
+
+
+def fila_a_reserva(fila):
+    reserva = Reserva(fila[0], fila[1])
+    reserva.fecha = datetime.fromisoformat(fila[2]) if fila[2] else None
+    return reserva
+
+
+def texto_fts(texto):
+    # Frase entre comillas para que FTS5 la busque tal cual (las comillas se duplican)
+    return '"' + texto.replace('"', '""') + '"'
+
+
+class BibliotecaSQLite:
+    # Misma interfaz que Biblioteca, pero con los datos en una base SQLite.
+    # Los Libro y Usuario que devuelve son copias: los cambios se hacen con
+    # los métodos de la biblioteca (editar_libro, prestar, etc.), no sobre los objetos.
+    def __init__(self, ruta="biblioteca.db"):
+        self.persistencia = None
+        self._lock_generacion = threading.Lock()
+        self._pool = PoolConexiones(ruta)
+        # Canal de /eventos (ver activar_eventos) y los eventos de la transacción
+        # abierta en cada hilo, que se publican recién con el COMMIT
+        self.eventos = None
+        self._eventos_hilo = threading.local()
+        conexion = self._conexion()
+        conexion.executescript(ESQUEMA)
+        # Bases creadas antes de guardar la fecha de los préstamos o su vencimiento
+        columnas = {fila[1] for fila in conexion.execute("PRAGMA table_info(prestamos)")}
+        if "fecha" not in columnas:
+            conexion.execute("ALTER TABLE prestamos ADD COLUMN fecha TEXT")
+        if "vence" not in columnas:
+            with self._transaccion():
+                conexion.execute("ALTER TABLE prestamos ADD COLUMN vence TEXT")
+                conexion.execute(
+                    "UPDATE prestamos SET vence = strftime('%Y-%m-%dT%H:%M:%S', fecha, ?) WHERE fecha IS NOT NULL",
+                    (f"+{DIAS_PRESTAMO} days",),
+                )
+        # Los vencidos se leen de este índice en orden, sin revisar todos los préstamos
+        conexion.execute("CREATE INDEX IF NOT EXISTS prestamos_vence ON prestamos (vence)")
+        # Bases cuyas claves *_n solo estaban en minúsculas: se recalculan sin acentos
+        # (los triggers de libros_fts reindexan las filas que cambian)
+        if conexion.execute("PRAGMA user_version").fetchone()[0] < 1:
+            conexion.create_function("normalizar", 1, normalizar, deterministic=True)
+            with self._transaccion():
+                conexion.execute(
+                    "UPDATE libros SET titulo_n = normalizar(titulo), autor_n = normalizar(autor),"
+                    " genero_n = normalizar(genero)"
+                )
+                conexion.execute(
+                    "UPDATE usuarios SET nombre_n = normalizar(nombre), apellido_n = normalizar(apellido)"
+                )
+                conexion.execute("PRAGMA user_version = 1")
+        # Bases con libros y usuarios sin AUTOINCREMENT: se rearman las tablas con las
+        # mismas filas e ids (al copiarlos, sqlite_sequence queda en el id más alto).
+        # Borrar la tabla vieja también borra sus índices y triggers, que vuelve a
+        # crear ESQUEMA; libros_fts no cambia porque los ids son los mismos
+        if conexion.execute("PRAGMA user_version").fetchone()[0] < 2:
+            # foreign_keys solo se puede cambiar fuera de una transacción
+            conexion.execute("PRAGMA foreign_keys = OFF")
+            try:
+                with self._transaccion():
+                    for tabla in ("libros", "usuarios"):
+                        self._migrar_autoincrement(conexion, tabla)
+                    conexion.execute("PRAGMA user_version = 2")
+            finally:
+                conexion.execute("PRAGMA foreign_keys = ON")
+            conexion.executescript(ESQUEMA)
+
+    def _migrar_autoincrement(self, conexion, tabla):
+        # Dentro de la transacción: otro proceso que abrió la base al mismo
+        # tiempo ya puede haberla migrado
+        sql = conexion.execute(
+            "SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (tabla,)
+        ).fetchone()[0]
+        if "AUTOINCREMENT" in sql.upper():
+            return
+        nueva = f"{tabla}_nueva"
+        sql = sql.replace(tabla, nueva, 1)
+        sql = sql.replace("id INTEGER PRIMARY KEY", "id INTEGER PRIMARY KEY AUTOINCREMENT", 1)
+        conexion.execute(sql)
+        conexion.execute(f"INSERT INTO {nueva} SELECT * FROM {tabla}")
+        conexion.execute(f"DROP TABLE {tabla}")
+        conexion.execute(f"ALTER TABLE {nueva} RENAME TO {tabla}")
+
+    def _conexion(self):
+        return self._pool.obtener()
+
+    @contextmanager
+    def _transaccion(self):
+        conexion = self._conexion()
+        if conexion.in_transaction:
+            # Transacción ya abierta (ej: dentro de carga_masiva)
+            yield conexion
+            return
+        conexion.execute("BEGIN IMMEDIATE")
+        try:
+            yield conexion
+        except BaseException:
+            conexion.execute("ROLLBACK")
+            self._pendientes().clear()
+            raise
+        # Los eventos salen en el mismo orden en que se confirmaron las transacciones
+        with self._lock_generacion:
+            conexion.execute("UPDATE generacion SET numero = numero + 1")
+            conexion.execute("COMMIT")
+            pendientes = self._pendientes()
+            for evento in pendientes:
+                self.eventos.publicar(*evento)
+            pendientes.clear()
+
+    @contextmanager
+    def _lectura(self):
+        # Transacción de solo lectura: en modo WAL todas las consultas de adentro
+        # ven la misma versión de la base, aunque otra conexión confirme cambios en el medio
+        conexion = self._conexion()
+        if conexion.in_transaction:
+            yield conexion
+            return
+        conexion.execute("BEGIN")
+        try:
+            yield conexion
+        finally:
+            conexion.execute("COMMIT")
+
+    @property
+    def generacion(self):
+        # Aumenta con cada transacción de escritura confirmada (ver Biblioteca.generacion).
+        # Se lee de la base y no de un contador del proceso: las escrituras de otro
+        # worker, de "flask importar" o de otra conexión también invalidan la caché
+        # de respuestas y los ETag
+        return self._conexion().execute("SELECT numero FROM generacion").fetchone()[0]
+
+    def cerrar(self):
+        self._pool.cerrar()
+
+    # Solo se publican los cambios hechos por este proceso: si otro proceso escribe
+    # en la misma base, sus clientes de /eventos no se enteran
+    def activar_eventos(self, canal):
+        self.eventos = canal
+
+    def _pendientes(self):
+        pendientes = getattr(self._eventos_hilo, "pendientes", None)
+        if pendientes is None:
+            pendientes = self._eventos_hilo.pendientes = []
+        return pendientes
+
+    def _publicar(self, evento):
+        # Se llama dentro de la transacción que hace el cambio
+        if self.eventos is not None and not getattr(self._eventos_hilo, "en_carga", False):
+            self._pendientes().append(evento)
+
+    # Los registros que revisa cada consulta los cuenta SQLite y no se ven desde
+    # Python: /metrics solo muestra los tiempos por ruta con este almacenamiento
+    def activar_contadores(self):
+        pass
+
+    def contadores(self):
+        return {}, {}
+
+    # ---------- Libros ----------
+
+    @property
+    def libros(self):
+        filas = self._conexion().execute(f"SELECT {COLUMNAS_LIBRO} FROM libros ORDER BY id")
+        return [fila_a_libro(f) for f in filas]
+
+    def agregar_libro(self, libro):
+        self.agregar_libros([libro])
+
+    def agregar_libros(self, libros):
+        # Alta de un lote con un solo executemany. Los libros sin id (None) reciben
+        # el que asigna SQLite (el mayor + 1) dentro de la transacción: otro proceso
+        # que escribe en la misma base no puede darle el mismo a otro libro
+        with self._transaccion() as conexion:
+            conexion.executemany(
+                INSERTAR_LIBRO, [fila_de_libro(libro) for libro in libros if libro.id_libro is not None]
+            )
+            for libro in libros:
+                if libro.id_libro is None:
+                    libro.id_libro = conexion.execute(INSERTAR_LIBRO, fila_de_libro(libro)).lastrowid
+            if self.eventos is not None and not getattr(self._eventos_hilo, "en_carga", False):
+                for libro in libros:
+                    self._publicar(evento_libro(libro))
+
+    def editar_libro(self, libro, titulo, autor, genero, stock):
+        # Solo se permite AUMENTAR el stock (MAX contra el valor actual en la base)
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "UPDATE libros SET titulo = ?, autor = ?, genero = ?, stock = MAX(stock, ?),"
+                " titulo_n = ?, autor_n = ?, genero_n = ? WHERE id = ?",
+                (
+                    titulo, autor, genero, stock,
+                    clave_orden(titulo), clave_orden(autor), clave_orden(genero), libro.id_libro,
+                ),
+            )
+            # Los ejemplares nuevos son primero para los que esperan el libro
+            self._atender_reservas(conexion, libro.id_libro)
+            stock = conexion.execute("SELECT stock FROM libros WHERE id = ?", (libro.id_libro,)).fetchone()[0]
+            libro.titulo = titulo
+            libro.autor = autor
+            libro.genero = genero
+            libro.stock = stock
+            libro.actualizar_claves()
+            self._publicar(evento_libro(libro))
+
+    def obtener_libro(self, id_libro):
+        fila = self._conexion().execute(
+            f"SELECT {COLUMNAS_LIBRO} FROM libros WHERE id = ?", (id_libro,)
+        ).fetchone()
+        return fila_a_libro(fila) if fila else None
+
+    def obtener_libro_por_titulo(self, titulo):
+        fila = self._conexion().execute(
+            f"SELECT {COLUMNAS_LIBRO} FROM libros WHERE titulo_n = ? ORDER BY id LIMIT 1",
+            (normalizar(titulo),),
+        ).fetchone()
+        return fila_a_libro(fila) if fila else None
+
+    def _total(self, columna):
+        return self._conexion().execute(f"SELECT {columna} FROM totales").fetchone()[0]
+
+    def total_libros(self):
+        return self._total("libros")
+
+    def disponibles(self):
+        return self._total("stock")
+
+    def prestados(self):
+        return self._total("prestados")
+
+    def estadisticas(self):
+        conexion = self._conexion()
+        libros, usuarios, stock, prestados, con_prestamos = conexion.execute(
+            "SELECT libros, usuarios, stock, prestados, usuarios_con_prestamos FROM totales"
+        ).fetchone()
+        return {
+            "libros": libros,
+            "usuarios": usuarios,
+            "disponibles": stock,
+            "prestados": prestados,
+            "usuarios_con_prestamos": con_prestamos,
+            "libros_por_genero": dict(conexion.execute("SELECT genero, libros FROM libros_por_genero")),
+        }
+
+    def libros_disponibles(self):
+        filas = self._conexion().execute(f"SELECT {COLUMNAS_LIBRO} FROM libros WHERE stock > 0 ORDER BY id")
+        return [fila_a_libro(f) for f in filas]
+
+    def _siguiente_id(self, tabla):
+        # Solo informativo: otra conexión puede insertar antes con ese id. Las altas
+        # se hacen sin id (None) y SQLite les asigna uno dentro de su transacción.
+        # Con AUTOINCREMENT el próximo id sale de sqlite_sequence y no de MAX(id):
+        # los ids de filas borradas no se vuelven a usar
+        fila = self._conexion().execute("SELECT seq FROM sqlite_sequence WHERE name = ?", (tabla,)).fetchone()
+        return (fila[0] if fila else 0) + 1
+
+    def siguiente_id_libro(self):
+        return self._siguiente_id("libros")
+
+    def eliminar(self, id_libro):
+        with self._transaccion() as conexion:
+            fila = conexion.execute(
+                f"SELECT {COLUMNAS_LIBRO} FROM libros WHERE id = ?", (id_libro,)
+            ).fetchone()
+            if fila is None:
+                raise NoEncontrado("Libro no encontrado")
+            libro = fila_a_libro(fila)
+            if libro.prestados > 0:
+                raise ErrorBiblioteca(
+                    f"No se puede eliminar el libro '{libro.titulo}' porque tiene "
+                    f"{libro.prestados} ejemplar(es) prestado(s)."
+                )
+            conexion.execute("DELETE FROM reservas WHERE id_libro = ?", (id_libro,))
+            conexion.execute("DELETE FROM libros WHERE id = ?", (id_libro,))
+            self._publicar(evento_baja_libro(id_libro))
+            return libro
+
+    def _filtro_libros(self, q, campo):
+        # Devuelve (condición WHERE, parámetros) para buscar q dentro del campo
+        validar_campo_libros(campo)
+        if not q:
+            return "1", ()
+        columna = COLUMNAS_ORDEN_LIBROS[campo]
+        if len(q) < 3:
+            # El índice de trigramas no sirve para textos más cortos
+            return f"instr({columna}, ?) > 0", (q,)
+        return (
+            f"id IN (SELECT rowid FROM libros_fts WHERE libros_fts MATCH ?) AND instr({columna}, ?) > 0",
+            (f"{columna} : {texto_fts(q)}", q),
+        )
+
+    def buscar_libros(self, q, campo="titulo"):
+        _, libros = self.consultar_libros(q, campo)
+        return list(libros)
+
+    def consultar_libros(self, q="", campo="titulo", descendente=False, desde=None, limite=None):
+        # Filtro, orden y LIMIT se resuelven en SQL; el orden continúa después del
+        # cursor (clave, id) comparando como fila contra el índice (columna, id)
+        # El total y la página se leen en la misma transacción, así coinciden
+        # aunque otro worker escriba entre las dos consultas
+        condicion, parametros = self._filtro_libros(normalizar(q), campo)
+        columna = COLUMNAS_ORDEN_LIBROS[campo]
+        direccion = "DESC" if descendente else "ASC"
+        with self._lectura() as conexion:
+            total = conexion.execute(
+                f"SELECT COUNT(*) FROM libros WHERE {condicion}", parametros
+            ).fetchone()[0]
+
+            if desde is not None:
+                condicion += f" AND ({columna}, id) {'<' if descendente else '>'} (?, ?)"
+                parametros += tuple(desde)
+            filas = conexion.execute(
+                f"SELECT {COLUMNAS_LIBRO} FROM libros WHERE {condicion}"
+                f" ORDER BY {columna} {direccion}, id {direccion} LIMIT ?",
+                parametros + (limite if limite is not None else -1,),
+            ).fetchall()
+        return total, [fila_a_libro(f) for f in filas]
+
+    def cursor_libro(self, libro, campo="titulo"):
+        campo = campo if campo in COLUMNAS_ORDEN_LIBROS else "titulo"
+        return (clave_orden(getattr(libro, campo)), libro.id_libro)
+
+    # ---------- Préstamos ----------
+
+    def _prestamo(self, conexion, id_usuario, id_libro):
+        # Usuario, libro y si el préstamo existe, leídos dentro de la transacción
+        usuario = conexion.execute(
+            "SELECT nombre FROM usuarios WHERE id = ?", (id_usuario,)
+        ).fetchone()
+        libro = conexion.execute(
+            f"SELECT {COLUMNAS_LIBRO} FROM libros WHERE id = ?", (id_libro,)
+        ).fetchone()
+        if usuario is None or libro is None:
+            raise NoEncontrado("Usuario o libro no encontrado.")
+        existe = conexion.execute(
+            "SELECT 1 FROM prestamos WHERE id_usuario = ? AND id_libro = ?", (id_usuario, id_libro)
+        ).fetchone()
+        return usuario[0], fila_a_libro(libro), existe is not None
+
+    def prestar(self, id_usuario, id_libro, fecha=None, vence=None):
+        # BEGIN IMMEDIATE toma el lock de escritura de la base antes de validar,
+        # así dos préstamos simultáneos no pueden llevarse el último ejemplar
+        with self._transaccion() as conexion:
+            nombre, libro, existe = self._prestamo(conexion, id_usuario, id_libro)
+            if existe:
+                raise ErrorBiblioteca(f"El usuario {nombre} ya tiene el libro '{libro.titulo}'.")
+            if libro.stock <= 0:
+                raise ErrorBiblioteca(f"No hay ejemplares disponibles de '{libro.titulo}'.")
+            # Con reservas pendientes, los ejemplares disponibles son primero de los de la fila;
+            # solo los que sobran pueden ir a otro usuario
+            primeros = [
+                fila[0] for fila in conexion.execute(
+                    "SELECT id_usuario FROM reservas WHERE id_libro = ? ORDER BY id LIMIT ?", (id_libro, libro.stock)
+                )
+            ]
+            if len(primeros) == libro.stock and id_usuario not in primeros:
+                raise ErrorBiblioteca(f"Los ejemplares de '{libro.titulo}' están reservados por otros usuarios.")
+            prestamo = Prestamo(id_usuario, id_libro, fecha, vence)
+            conexion.execute(
+                "INSERT INTO prestamos (id_usuario, id_libro, fecha, vence) VALUES (?, ?, ?, ?)",
+                (id_usuario, id_libro, prestamo.fecha.isoformat(), prestamo.vence.isoformat()),
+            )
+            if primeros:
+                conexion.execute("DELETE FROM reservas WHERE id_usuario = ? AND id_libro = ?", (id_usuario, id_libro))
+            conexion.execute(
+                "UPDATE libros SET stock = stock - 1, prestados = prestados + 1 WHERE id = ?", (id_libro,)
+            )
+            libro.prestar()
+            usuario = self.obtener_usuario(id_usuario)
+            self._publicar(evento_prestamo("prestamo", usuario, libro))
+        return usuario, libro
+
+    def devolver(self, id_usuario, id_libro):
+        with self._transaccion() as conexion:
+            _, libro, existe = self._prestamo(conexion, id_usuario, id_libro)
+            if not existe:
+                raise ErrorBiblioteca("El usuario no tiene este libro prestado.")
+            conexion.execute(
+                "DELETE FROM prestamos WHERE id_usuario = ? AND id_libro = ?", (id_usuario, id_libro)
+            )
+            conexion.execute(
+                "UPDATE libros SET stock = stock + 1, prestados = prestados - 1 WHERE id = ?", (id_libro,)
+            )
+            libro.devolver()
+            usuario = self.obtener_usuario(id_usuario)
+            self._publicar(evento_prestamo("devolucion", usuario, libro))
+            # En la misma transacción: nadie más puede llevarse el ejemplar devuelto
+            self._atender_reservas(conexion, id_libro)
+        return usuario, libro
+
+    def prestar_lote(self, pares, todo_o_nada=False):
+        # Misma respuesta que Biblioteca.prestar_lote(), con todo el lote en una transacción
+        return self._lote(pares, todo_o_nada, self.prestar)
+
+    def devolver_lote(self, pares, todo_o_nada=False):
+        return self._lote(pares, todo_o_nada, self.devolver)
+
+    def _lote(self, pares, todo_o_nada, operacion):
+        # Cada par se aplica como una operación suelta dentro de la misma transacción
+        # (un par rechazado no llega a escribir nada); con todo_o_nada, si alguno
+        # falló se vuelve al savepoint y no queda ninguno
+        resultados = []
+        with self._transaccion() as conexion:
+            conexion.execute("SAVEPOINT lote")
+            publicados = len(self._pendientes())
+            for id_usuario, id_libro in pares:
+                try:
+                    resultados.append(operacion(id_usuario, id_libro))
+                except ErrorBiblioteca as error:
+                    resultados.append(error)
+            aplicado = not (todo_o_nada and any(isinstance(r, ErrorBiblioteca) for r in resultados))
+            if not aplicado:
+                conexion.execute("ROLLBACK TO lote")
+                del self._pendientes()[publicados:]
+            conexion.execute("RELEASE lote")
+        return aplicado, resultados
+
+    def restaurar_prestamo(self, id_usuario, id_libro, fecha=None, vence=None):
+        # El stock del libro ya refleja el préstamo: solo se asocia al usuario
+        prestamo = Prestamo(id_usuario, id_libro, fecha, vence)
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "INSERT INTO prestamos (id_usuario, id_libro, fecha, vence) VALUES (?, ?, ?, ?)",
+                (id_usuario, id_libro, prestamo.fecha.isoformat(), prestamo.vence.isoformat()),
+            )
+
+    # ---------- Reservas ----------
+
+    def reservar(self, id_usuario, id_libro, fecha=None):
+        # Igual que Biblioteca.reservar(): devuelve (usuario, libro, lugar en la fila)
+        with self._transaccion() as conexion:
+            nombre, libro, existe = self._prestamo(conexion, id_usuario, id_libro)
+            if existe:
+                raise ErrorBiblioteca(f"El usuario {nombre} ya tiene el libro '{libro.titulo}'.")
+            reservado = conexion.execute(
+                "SELECT 1 FROM reservas WHERE id_usuario = ? AND id_libro = ?", (id_usuario, id_libro)
+            ).fetchone()
+            if reservado:
+                raise ErrorBiblioteca(f"El usuario {nombre} ya reservó el libro '{libro.titulo}'.")
+            en_fila = conexion.execute("SELECT COUNT(*) FROM reservas WHERE id_libro = ?", (id_libro,)).fetchone()[0]
+            if libro.stock > en_fila:
+                raise ErrorBiblioteca(
+                    f"Hay ejemplares disponibles de '{libro.titulo}': se puede prestar directamente."
+                )
+            self.restaurar_reserva(id_usuario, id_libro, fecha)
+            usuario = self.obtener_usuario(id_usuario)
+        return usuario, libro, en_fila + 1
+
+    def cancelar_reserva(self, id_usuario, id_libro):
+        with self._transaccion() as conexion:
+            cursor = conexion.execute(
+                "DELETE FROM reservas WHERE id_usuario = ? AND id_libro = ?", (id_usuario, id_libro)
+            )
+            if cursor.rowcount == 0:
+                raise ErrorBiblioteca("El usuario no tiene reservado este libro.")
+            self._atender_reservas(conexion, id_libro)
+
+    def restaurar_reserva(self, id_usuario, id_libro, fecha=None):
+        reserva = Reserva(id_usuario, id_libro, fecha)
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "INSERT INTO reservas (id_usuario, id_libro, fecha) VALUES (?, ?, ?)",
+                (id_usuario, id_libro, reserva.fecha.isoformat()),
+            )
+
+    def _atender_reservas(self, conexion, id_libro):
+        # Dentro de la transacción abierta: presta los ejemplares disponibles
+        # a los primeros de la fila
+        while True:
+            fila = conexion.execute(
+                "SELECT r.id_usuario FROM reservas r JOIN libros l ON l.id = r.id_libro"
+                " WHERE r.id_libro = ? AND l.stock > 0 ORDER BY r.id LIMIT 1",
+                (id_libro,),
+            ).fetchone()
+            if fila is None:
+                return
+            self.prestar(fila[0], id_libro)
+
+    def reservas_de_libro(self, id_libro):
+        filas = self._conexion().execute(
+            "SELECT id_usuario, id_libro, fecha FROM reservas WHERE id_libro = ? ORDER BY id", (id_libro,)
+        )
+        return [fila_a_reserva(f) for f in filas]
+
+    def reservas_de(self, id_usuario):
+        filas = self._conexion().execute(
+            "SELECT id_usuario, id_libro, fecha FROM reservas WHERE id_usuario = ? ORDER BY id", (id_usuario,)
+        )
+        return [fila_a_reserva(f) for f in filas]
+
+    def reservas(self):
+        filas = self._conexion().execute("SELECT id_usuario, id_libro, fecha FROM reservas ORDER BY id_libro, id")
+        return [fila_a_reserva(f) for f in filas]
+
+    # ---------- Consultas de préstamos ----------
+
+    def tiene_libro(self, id_usuario, id_libro):
+        return self._conexion().execute(
+            "SELECT 1 FROM prestamos WHERE id_usuario = ? AND id_libro = ?", (id_usuario, id_libro)
+        ).fetchone() is not None
+
+    def ids_libros_prestados(self, id_usuario):
+        filas = self._conexion().execute("SELECT id_libro FROM prestamos WHERE id_usuario = ?", (id_usuario,))
+        return {fila[0] for fila in filas}
+
+    def prestamo(self, id_usuario, id_libro):
+        fila = self._conexion().execute(
+            "SELECT id_usuario, id_libro, fecha, vence FROM prestamos WHERE id_usuario = ? AND id_libro = ?",
+            (id_usuario, id_libro),
+        ).fetchone()
+        return fila_a_prestamo(fila) if fila else None
+
+    def prestamos_de(self, id_usuario):
+        filas = self._conexion().execute(
+            "SELECT id_usuario, id_libro, fecha, vence FROM prestamos WHERE id_usuario = ? ORDER BY id",
+            (id_usuario,),
+        )
+        return [fila_a_prestamo(f) for f in filas]
+
+    def vencidos(self, hasta=None, limite=None):
+        # Recorre el índice prestamos_vence desde el principio hasta "hasta"
+        filas = self._conexion().execute(
+            "SELECT id_usuario, id_libro, fecha, vence FROM prestamos WHERE vence <= ? ORDER BY vence, id LIMIT ?",
+            ((hasta or ahora()).isoformat(), limite if limite is not None else -1),
+        )
+        return [fila_a_prestamo(f) for f in filas]
+
+    def prestatarios(self, id_libro):
+        # Usa el índice prestamos_libro en lugar de revisar los préstamos de cada usuario
+        filas = self._conexion().execute(
+            f"SELECT {COLUMNAS_USUARIO} FROM usuarios"
+            " WHERE id IN (SELECT id_usuario FROM prestamos WHERE id_libro = ?) ORDER BY id",
+            (id_libro,),
+        )
+        return list(self._filas_a_usuarios(filas))
+
+    def _libros_de(self, ids_usuarios):
+        # Libros prestados de varios usuarios con una sola consulta: {id_usuario: [Libro, ...]}
+        libros = {i: [] for i in ids_usuarios}
+        if not libros:
+            return libros
+        marcas = ", ".join("?" * len(libros))
+        filas = self._conexion().execute(
+            f"SELECT p.id_usuario, {COLUMNAS_LIBRO_JOIN}"
+            f" FROM prestamos p JOIN libros l ON l.id = p.id_libro"
+            f" WHERE p.id_usuario IN ({marcas}) ORDER BY p.id",
+            tuple(libros),
+        )
+        for fila in filas:
+            libros[fila[0]].append(fila_a_libro(fila[1:]))
+        return libros
+
+    def _filas_a_usuarios(self, filas):
+        # Convierte las filas en Usuario de a lotes, cargando sus libros prestados
+        while True:
+            lote = list(itertools.islice(filas, TAMANIO_LOTE_USUARIOS))
+            if not lote:
+                return
+            libros = self._libros_de([f[0] for f in lote])
+            for fila in lote:
+                yield fila_a_usuario(fila, libros[fila[0]])
+
+    # ---------- Usuarios ----------
+
+    @property
+    def users(self):
+        filas = self._conexion().execute(f"SELECT {COLUMNAS_USUARIO} FROM usuarios ORDER BY id")
+        return list(self._filas_a_usuarios(filas))
+
+    def total_usuarios(self):
+        return self._total("usuarios")
+
+    def agregar_usuario(self, usuario):
+        # Un usuario sin id (None) recibe el que asigna SQLite
+        with self._transaccion() as conexion:
+            cursor = conexion.execute(
+                "INSERT INTO usuarios (id, nombre, apellido, dni, telefono, direccion, nro_direccion,"
+                " nombre_n, apellido_n, dni_n) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    usuario.id_usuario, usuario.nombre, usuario.apellido, usuario.dni, usuario.telefono,
+                    usuario.direccion, usuario.nro_direccion,
+                    clave_orden(usuario.nombre), clave_orden(usuario.apellido), clave_orden(usuario.dni),
+                ),
+            )
+            usuario.id_usuario = cursor.lastrowid
+            for libro in usuario.libros:
+                self.restaurar_prestamo(usuario.id_usuario, libro.id_libro)
+            self._publicar(evento_usuario(usuario))
+
+    def agregar_usuarios(self, users):
+        with self._transaccion():
+            for usuario in users:
+                self.agregar_usuario(usuario)
+
+    def agregar_si_vacia(self, libros, users):
+        # BEGIN IMMEDIATE bloquea la base: otro proceso que arranque a la vez
+        # espera y después ya la encuentra con datos
+        with self._transaccion():
+            if self.total_libros() or self.total_usuarios():
+                return False
+            self.agregar_libros(libros)
+            self.agregar_usuarios(users)
+            return True
+
+    def editar_usuario(self, usuario, nombre, apellido, telefono, direccion, nro_direccion):
+        with self._transaccion() as conexion:
+            conexion.execute(
+                "UPDATE usuarios SET nombre = ?, apellido = ?, telefono = ?, direccion = ?, nro_direccion = ?,"
+                " nombre_n = ?, apellido_n = ? WHERE id = ?",
+                (
+                    nombre, apellido, telefono, direccion, nro_direccion,
+                    clave_orden(nombre), clave_orden(apellido), usuario.id_usuario,
+                ),
+            )
+            usuario.nombre = nombre
+            usuario.apellido = apellido
+            usuario.telefono = telefono
+            usuario.direccion = direccion
+            usuario.nro_direccion = nro_direccion
+            usuario.actualizar_claves()
+            self._publicar(evento_usuario(usuario))
+
+    def obtener_usuario(self, id_usuario):
+        filas = self._conexion().execute(
+            f"SELECT {COLUMNAS_USUARIO} FROM usuarios WHERE id = ?", (id_usuario,)
+        )
+        return next(self._filas_a_usuarios(filas), None)
+
+    def siguiente_id_usuario(self):
+        return self._siguiente_id("usuarios")
+
+    def _filtro_usuarios(self, texto, campo):
+        if not texto:
+            return "1", ()
+        if campo in COLUMNAS_ORDEN_USUARIOS:
+            return f"instr({COLUMNAS_ORDEN_USUARIOS[campo]}, ?) > 0", (texto,)
+        if campo == "libros":
+            return (
+                "id IN (SELECT p.id_usuario FROM prestamos p JOIN libros l ON l.id = p.id_libro"
+                " WHERE instr(l.titulo_n, ?) > 0)",
+                (texto,),
+            )
+        return "0", ()
+
+    def buscar_usuarios(self, texto, campo="nombre"):
+        _, users = self.consultar_usuarios(texto, campo)
+        return list(users)
+
+    def consultar_usuarios(self, q="", campo="nombre", descendente=False, desde=None, limite=None):
+        # Igual que consultar_libros(); los libros prestados de cada usuario
+        # también se leen dentro de la misma transacción
+        condicion, parametros = self._filtro_usuarios(normalizar(q), campo)
+        columna = COLUMNAS_ORDEN_USUARIOS.get(campo, "nombre_n")
+        direccion = "DESC" if descendente else "ASC"
+        with self._lectura() as conexion:
+            total = conexion.execute(
+                f"SELECT COUNT(*) FROM usuarios WHERE {condicion}", parametros
+            ).fetchone()[0]
+
+            if desde is not None:
+                condicion += f" AND ({columna}, id) {'<' if descendente else '>'} (?, ?)"
+                parametros += tuple(desde)
+            filas = conexion.execute(
+                f"SELECT {COLUMNAS_USUARIO} FROM usuarios WHERE {condicion}"
+                f" ORDER BY {columna} {direccion}, id {direccion} LIMIT ?",
+                parametros + (limite if limite is not None else -1,),
+            ).fetchall()
+            return total, list(self._filas_a_usuarios(iter(filas)))
+
+    def cursor_usuario(self, usuario, campo="nombre"):
+        campo = campo if campo in COLUMNAS_ORDEN_USUARIOS else "nombre"
+        return (clave_orden(getattr(usuario, campo)), usuario.id_usuario)
+
+    def eliminar_usuario(self, id_usuario):
+        with self._transaccion():
+            usuario = self.obtener_usuario(id_usuario)
+            if usuario is None:
+                raise NoEncontrado("Usuario no encontrado")
+            if usuario.libros:
+                titulos = ", ".join([l.titulo for l in usuario.libros])
+                raise ErrorBiblioteca(
+                    f"No se puede eliminar al usuario {usuario.nombre} {usuario.apellido} "
+                    f"porque tiene libro(s) prestado(s): {titulos}"
+                )
+            conexion = self._conexion()
+            filas = conexion.execute("SELECT id_libro FROM reservas WHERE id_usuario = ?", (id_usuario,))
+            reservados = [fila[0] for fila in filas]
+            conexion.execute("DELETE FROM reservas WHERE id_usuario = ?", (id_usuario,))
+            conexion.execute("DELETE FROM usuarios WHERE id = ?", (id_usuario,))
+            self._publicar(evento_baja_usuario(id_usuario))
+            for id_libro in reservados:
+                self._atender_reservas(conexion, id_libro)
+            return usuario
+
+    # ---------- Autocompletado ----------
+
+    def autocompletar(self, q, campo="titulo", limite=10):
+        # Rango del índice (columna, id) que empieza con q, agrupado por texto.
+        # Para prefijos muy cortos recorre muchas filas: la versión en memoria
+        # guarda aparte los más populares de cada prefijo
+        q = normalizar(q)
+        limite = max(1, min(limite, 64))
+        if not q:
+            return []
+        if campo in CAMPOS_AUTOCOMPLETAR_LIBROS:
+            columna = COLUMNAS_ORDEN_LIBROS[campo]
+            consulta = (
+                f"SELECT MIN({campo}), SUM(prestados) FROM libros"
+                f" WHERE {columna} >= ? AND {columna} < ?"
+                f" GROUP BY {columna} ORDER BY 2 DESC, {columna} LIMIT ?"
+            )
+        elif campo in CAMPOS_AUTOCOMPLETAR_USUARIOS:
+            columna = COLUMNAS_ORDEN_USUARIOS[campo]
+            consulta = (
+                f"SELECT MIN(u.{campo}), COUNT(p.id_libro) FROM usuarios u"
+                f" LEFT JOIN prestamos p ON p.id_usuario = u.id"
+                f" WHERE u.{columna} >= ? AND u.{columna} < ?"
+                f" GROUP BY u.{columna} ORDER BY 2 DESC, u.{columna} LIMIT ?"
+            )
+        else:
+            raise ErrorBiblioteca(f"No hay sugerencias para el campo '{campo}'.")
+        filas = self._conexion().execute(consulta, (q, q + "\U0010ffff", limite))
+        return [{"texto": texto, "popularidad": popularidad} for texto, popularidad in filas]
+
+    # ---------- Mantenimiento ----------
+
+    @contextmanager
+    def carga_masiva(self):
+        # Todas las altas del bloque van en una única transacción, y los clientes
+        # de /eventos reciben un solo "reiniciar" en vez de un evento por alta
+        self._eventos_hilo.en_carga = True
+        try:
+            with self._transaccion():
+                yield self
+        finally:
+            self._eventos_hilo.en_carga = False
+        if self.eventos is not None:
+            self.eventos.reiniciar()
+
+    def compactar(self):
+        # Pasa el contenido del WAL a la base y lo trunca
+        self._conexion().execute("PRAGMA wal_checkpoint(TRUNCATE)")
@@ -0,0 +1,331 @@
+import logging
+import os
+import struct
+import threading
+from collections import deque
+from contextlib import contextmanager, nullcontext
+from multiprocessing import resource_tracker, shared_memory
+from multiprocessing.managers import BaseManager
+
+from models.biblioteca import Biblioteca, NoEncontrado
+from models.persistencia import aplicar, leer_instantanea, registros_de
+
+
+# Estado compartido entre varios procesos de la aplicación en una misma máquina
+# (ej: los workers de gunicorn):
+# - ServidorEstado corre en un proceso aparte y es el único que modifica la
+#   biblioteca: las validaciones de stock y préstamos se hacen en un solo lugar.
+#   Atiende por un socket Unix y numera cada cambio en un RegistroCambios
+# - cada proceso usa una BibliotecaReplicada: las consultas se responden con una
+#   copia local en memoria y las escrituras se mandan al servidor
+# - el número del último cambio está además en un segmento de memoria compartida:
+#   antes de cada lectura la réplica lo compara con el suyo, sin hablar con el
+#   servidor, y solo si quedó atrás le pide los cambios que le faltan
+
+log = logging.getLogger(__name__)
+
+# Cambios que conserva el servidor; una réplica más atrasada vuelve a copiar todo
+CAPACIDAD_CAMBIOS = 100_000
+# Con más cambios pendientes que esto, la réplica los aplica con carga_masiva()
+CAMBIOS_CARGA_MASIVA = 1000
+NUMERO = struct.Struct("<Q")
+
+
+class _GestorServidor(BaseManager):
+    pass
+
+
+class _GestorCliente(BaseManager):
+    pass
+
+
+_GestorCliente.register("estado")
+
+
+class RegistroCambios:
+    # Últimos cambios de una biblioteca (en el formato de models/persistencia.py),
+    # numerados desde 1. Biblioteca._registrar lo llama con los locks de la
+    # operación tomados, así dos cambios que dependen entre sí (ej: un alta y un
+    # préstamo del mismo libro) quedan en el orden en que se aplicaron
+    def __init__(self, capacidad=CAPACIDAD_CAMBIOS):
+        self._lock = threading.Lock()
+        self._cambios = deque(maxlen=capacidad)
+        self.ultimo = 0
+        self.memoria = shared_memory.SharedMemory(create=True, size=NUMERO.size)
+        NUMERO.pack_into(self.memoria.buf, 0, 0)
+
+    def registrar(self, operacion):
+        with self._lock:
+            self._cambios.append(operacion)
+            self.ultimo += 1
+            NUMERO.pack_into(self.memoria.buf, 0, self.ultimo)
+
+    def desde(self, numero):
+        # (último número, cambios posteriores a "numero"), o None si ya se descartaron
+        with self._lock:
+            faltan = self.ultimo - numero
+            if faltan > len(self._cambios):
+                return None
+            return self.ultimo, list(self._cambios)[len(self._cambios) - faltan:]
+
+    def cerrar(self):
+        self.memoria.close()
+        self.memoria.unlink()
+
+
+class ServidorEstado:
+    # Dueño de la biblioteca. Sus métodos públicos son los que pueden llamar las
+    # réplicas: cada escritura devuelve (número del último cambio, resultado) para
+    # que quien la pidió se actualice hasta ahí antes de responder
+    def __init__(self, biblioteca, direccion, clave):
+        self.biblioteca = biblioteca
+        self.direccion = direccion
+        self.clave = clave
+        self.registro = RegistroCambios()
+        biblioteca.cambios = self.registro
+
+    def servir(self):
+        # Atiende hasta recibir SystemExit o KeyboardInterrupt; un hilo por conexión
+        if os.path.exists(self.direccion):
+            # Socket de una ejecución anterior que no se cerró bien
+            os.remove(self.direccion)
+        _GestorServidor.register("estado", callable=lambda: self)
+        gestor = _GestorServidor(address=self.direccion, authkey=self.clave)
+        gestor.get_server().serve_forever()
+
+    def cerrar(self):
+        # El socket lo borra el propio servidor del gestor al terminar
+        self.biblioteca.cambios = None
+        self.registro.cerrar()
+
+    # ---------- Lecturas para las réplicas ----------
+
+    def nombre_memoria(self):
+        return self.registro.memoria.name
+
+    def cambios(self, desde):
+        return self.registro.desde(desde)
+
+    def instantanea(self):
+        # Estado completo y el número del último cambio que incluye
+        with self.biblioteca.exclusiva():
+            return self.registro.ultimo, list(registros_de(self.biblioteca))
+
+    # ---------- Escrituras ----------
+
+    def _escribir(self, resultado):
+        return self.registro.ultimo, resultado
+
+    def _libro(self, id_libro):
+        libro = self.biblioteca.obtener_libro(id_libro)
+        if libro is None:
+            raise NoEncontrado("Libro no encontrado")
+        return libro
+
+    def _usuario(self, id_usuario):
+        usuario = self.biblioteca.obtener_usuario(id_usuario)
+        if usuario is None:
+            raise NoEncontrado("Usuario no encontrado")
+        return usuario
+
+    def siguiente_id_libro(self):
+        return self._escribir(self.biblioteca.siguiente_id_libro())
+
+    def siguiente_id_usuario(self):
+        return self._escribir(self.biblioteca.siguiente_id_usuario())
+
+    def agregar_libros(self, libros):
+        return self._escribir(self.biblioteca.agregar_libros(libros))
+
+    def editar_libro(self, id_libro, titulo, autor, genero, stock):
+        return self._escribir(self.biblioteca.editar_libro(self._libro(id_libro), titulo, autor, genero, stock))
+
+    def eliminar(self, id_libro):
+        return self._escribir(self.biblioteca.eliminar(id_libro))
+
+    def agregar_usuarios(self, users):
+        return self._escribir(self.biblioteca.agregar_usuarios(users))
+
+    def editar_usuario(self, id_usuario, nombre, apellido, telefono, direccion, nro_direccion):
+        return self._escribir(
+            self.biblioteca.editar_usuario(
+                self._usuario(id_usuario), nombre, apellido, telefono, direccion, nro_direccion
+            )
+        )
+
+    def eliminar_usuario(self, id_usuario):
+        return self._escribir(self.biblioteca.eliminar_usuario(id_usuario))
+
+    def prestar(self, id_usuario, id_libro):
+        return self._escribir(self.biblioteca.prestar(id_usuario, id_libro))
+
+    def devolver(self, id_usuario, id_libro):
+        return self._escribir(self.biblioteca.devolver(id_usuario, id_libro))
+
+    def prestar_lote(self, pares, todo_o_nada):
+        return self._escribir(self.biblioteca.prestar_lote(pares, todo_o_nada))
+
+    def devolver_lote(self, pares, todo_o_nada):
+        return self._escribir(self.biblioteca.devolver_lote(pares, todo_o_nada))
+
+    def reservar(self, id_usuario, id_libro):
+        return self._escribir(self.biblioteca.reservar(id_usuario, id_libro))
+
+    def cancelar_reserva(self, id_usuario, id_libro):
+        return self._escribir(self.biblioteca.cancelar_reserva(id_usuario, id_libro))
+
+    def agregar_si_vacia(self, libros, users):
+        return self._escribir(self.biblioteca.agregar_si_vacia(libros, users))
+
+    def compactar(self):
+        return self._escribir(self.biblioteca.compactar())
+
+
+class BibliotecaReplicada:
+    # Misma interfaz que Biblioteca. Lo que no es una escritura se le pide a la
+    # réplica local (ver __getattr__), después de ponerla al día si hace falta.
+    # Una escritura vuelve con la réplica actualizada al menos hasta ese cambio:
+    # quien acaba de prestar un libro lo ve prestado en la consulta siguiente
+    def __init__(self, direccion, clave):
+        gestor = _GestorCliente(address=direccion, authkey=clave)
+        gestor.connect()
+        self._estado = gestor.estado()
+        self._memoria = shared_memory.SharedMemory(name=self._estado.nombre_memoria())
+        # En Python < 3.13 el proceso que solo se conecta al segmento también lo
+        # anota para borrarlo al salir: el segmento es del servidor
+        resource_tracker.unregister(self._memoria._name, "shared_memory")
+        self._lock = threading.Lock()
+        self._con_contadores = False
+        self._eventos = None
+        self._replica = None
+        self._numero = 0
+        self._recargar()
+
+    def __getattr__(self, nombre):
+        # Solo se llama para lo que no está definido en esta clase
+        self._sincronizar()
+        return getattr(self._replica, nombre)
+
+    # ---------- Réplica local ----------
+
+    def _recargar(self):
+        # Copia completa: al iniciar o si la réplica quedó más atrás de lo que guarda el servidor
+        numero, registros = self._estado.instantanea()
+        replica = Biblioteca()
+        # La réplica solo aplica cambios del servidor, que ya asignó las reservas
+        replica.asignar_reservas = False
+        replica.restaurar(*leer_instantanea(registros))
+        if self._replica is not None:
+            # La generación nunca vuelve atrás: la caché de respuestas y los ETag dependen de eso
+            replica.generacion = max(replica.generacion, self._replica.generacion) + 1
+        if self._con_contadores:
+            replica.activar_contadores()
+        if self._eventos is not None:
+            replica.activar_eventos(self._eventos)
+        self._replica = replica
+        self._numero = numero
+        if self._eventos is not None:
+            # Los cambios que faltaban no se publicaron uno por uno
+            self._eventos.reiniciar()
+
+    def _sincronizar(self, hasta=None):
+        if hasta is None:
+            hasta = NUMERO.unpack_from(self._memoria.buf)[0]
+        if hasta <= self._numero:
+            return
+        with self._lock:
+            if hasta <= self._numero:
+                return
+            respuesta = self._estado.cambios(self._numero)
+            if respuesta is None:
+                self._recargar()
+                return
+            numero, cambios = respuesta
+            masiva = self._replica.carga_masiva() if len(cambios) > CAMBIOS_CARGA_MASIVA else nullcontext()
+            try:
+                with masiva:
+                    for registro in cambios:
+                        aplicar(self._replica, registro)
+            except Exception:
+                # La réplica quedó a medio aplicar y sin avanzar _numero: reintentar los
+                # mismos cambios fallaría en cada lectura. Se vuelve a copiar todo
+                log.exception("No se pudieron aplicar los cambios %d a %d en la réplica", self._numero + 1, numero)
+                self._recargar()
+                return
+            self._numero = numero
+
+    def _escribir(self, metodo, *args):
+        numero, resultado = getattr(self._estado, metodo)(*args)
+        self._sincronizar(numero)
+        return resultado
+
+    def activar_contadores(self):
+        self._con_contadores = True
+        self._replica.activar_contadores()
+
+    def activar_eventos(self, canal):
+        # La réplica publica los cambios al aplicarlos, vengan de este proceso o de otro
+        self._eventos = canal
+        self._replica.activar_eventos(canal)
+
+    @contextmanager
+    def carga_masiva(self):
+        # Cada lote ya se agrega en el servidor con una sola llamada;
+        # la réplica usa carga_masiva() por su cuenta al recibir muchos cambios
+        yield self
+
+    # ---------- Escrituras (van al servidor) ----------
+
+    def siguiente_id_libro(self):
+        return self._escribir("siguiente_id_libro")
+
+    def siguiente_id_usuario(self):
+        return self._escribir("siguiente_id_usuario")
+
+    def agregar_libro(self, libro):
+        self.agregar_libros([libro])
+
+    def agregar_libros(self, libros):
+        return self._escribir("agregar_libros", libros)
+
+    def editar_libro(self, libro, titulo, autor, genero, stock):
+        return self._escribir("editar_libro", libro.id_libro, titulo, autor, genero, stock)
+
+    def eliminar(self, id_libro):
+        return self._escribir("eliminar", id_libro)
+
+    def agregar_usuario(self, usuario):
+        self.agregar_usuarios([usuario])
+
+    def agregar_usuarios(self, users):
+        return self._escribir("agregar_usuarios", users)
+
+    def editar_usuario(self, usuario, nombre, apellido, telefono, direccion, nro_direccion):
+        return self._escribir("editar_usuario", usuario.id_usuario, nombre, apellido, telefono, direccion, nro_direccion)
+
+    def eliminar_usuario(self, id_usuario):
+        return self._escribir("eliminar_usuario", id_usuario)
+
+    def prestar(self, id_usuario, id_libro):
+        return self._escribir("prestar", id_usuario, id_libro)
+
+    def devolver(self, id_usuario, id_libro):
+        return self._escribir("devolver", id_usuario, id_libro)
+
+    def prestar_lote(self, pares, todo_o_nada=False):
+        return self._escribir("prestar_lote", list(pares), todo_o_nada)
+
+    def devolver_lote(self, pares, todo_o_nada=False):
+        return self._escribir("devolver_lote", list(pares), todo_o_nada)
+
+    def reservar(self, id_usuario, id_libro):
+        return self._escribir("reservar", id_usuario, id_libro)
+
+    def cancelar_reserva(self, id_usuario, id_libro):
+        return self._escribir("cancelar_reserva", id_usuario, id_libro)
+
+    def agregar_si_vacia(self, libros, users):
+        return self._escribir("agregar_si_vacia", libros, users)
+
+    def compactar(self):
+        return self._escribir("compactar")
@@ -0,0 +1,184 @@
+import json
+import threading
+from collections import deque
+
+# Cambios de la biblioteca para los clientes conectados a /eventos (Server-Sent Events).
+# Cada cambio se publica una sola vez como un evento numerado y ya serializado;
+# cada cliente tiene su propia Suscripcion con una cola de tamaño fijo:
+# - publicar nunca espera a un cliente (se llama con locks de la biblioteca tomados)
+# - si un cliente lento llena su cola, se descartan sus eventos pendientes y
+#   recibe un único "reiniciar": vuelve a pedir la página que muestra en vez de
+#   aplicar cambios uno por uno
+# - los últimos eventos quedan en un historial, así un cliente que se reconecta
+#   (Last-Event-ID) recibe solo lo que se perdió
+
+# Eventos que se conservan para las reconexiones
+HISTORIAL_EVENTOS = 10_000
+# Eventos pendientes por cliente antes de mandarle "reiniciar"
+CAPACIDAD_CLIENTE = 1000
+MAX_CLIENTES = 10_000
+
+
+# ---------- Contenido de los eventos ----------
+# Solo lo que hace falta para actualizar una fila de libros.html o usuarios.html
+
+def evento_libro(libro):
+    return "libro", {
+        "id_libro": libro.id_libro,
+        "titulo": libro.titulo,
+        "autor": libro.autor,
+        "genero": libro.genero,
+        "stock": libro.stock,
+        "prestados": libro.prestados,
+    }
+
+
+def evento_baja_libro(id_libro):
+    return "libro_eliminado", {"id_libro": id_libro}
+
+
+def evento_usuario(usuario):
+    return "usuario", {
+        "id_usuario": usuario.id_usuario,
+        "nombre": usuario.nombre,
+        "apellido": usuario.apellido,
+        "dni": usuario.dni,
+        "telefono": usuario.telefono,
+        "direccion": usuario.direccion,
+        "nro_direccion": usuario.nro_direccion,
+        "libros": _libros_de(usuario),
+    }
+
+
+def evento_baja_usuario(id_usuario):
+    return "usuario_eliminado", {"id_usuario": id_usuario}
+
+
+def evento_prestamo(tipo, usuario, libro):
+    # tipo: "prestamo" o "devolucion". Cambian el stock del libro y la lista del usuario
+    return tipo, {
+        "libro": {"id_libro": libro.id_libro, "stock": libro.stock, "prestados": libro.prestados},
+        "usuario": {"id_usuario": usuario.id_usuario, "libros": _libros_de(usuario)},
+    }
+
+
+def _libros_de(usuario):
+    return [{"titulo": l.titulo, "autor": l.autor} for l in usuario.libros]
+
+
+def formato_sse(numero, tipo, datos):
+    return f"id: {numero}\nevent: {tipo}\ndata: {datos}\n\n"
+
+
+# ---------- Canal y suscripciones ----------
+
+class Suscripcion:
+    # Cola de un cliente. recibir() lo llama el canal; tomar() el hilo o la
+    # corrutina que le escribe al cliente. avisar (opcional) se llama con cada
+    # evento nuevo, ej: para despertar una corrutina de asgi.py
+    def __init__(self, tipos=None, capacidad=CAPACIDAD_CLIENTE, avisar=None):
+        self.tipos = tipos
+        self._capacidad = capacidad
+        self._avisar = avisar
+        self._lock = threading.Lock()
+        self._hay = threading.Event()
+        self._pendientes = deque()
+        # Número del último evento descartado por desborde (None si no hubo)
+        self._reinicio = None
+
+    def recibir(self, evento):
+        numero, tipo, _ = evento
+        if tipo == "reiniciar":
+            self.reiniciar(numero)
+            return
+        if self.tipos is not None and tipo not in self.tipos:
+            return
+        with self._lock:
+            if self._reinicio is not None or len(self._pendientes) >= self._capacidad:
+                self._pendientes.clear()
+                self._reinicio = numero
+            else:
+                self._pendientes.append(evento)
+        self._hay.set()
+        if self._avisar is not None:
+            self._avisar()
+
+    def reiniciar(self, numero):
+        # El cliente tiene que volver a pedir lo que muestra (ej: la réplica se recargó entera)
+        with self._lock:
+            self._pendientes.clear()
+            self._reinicio = numero
+        self._hay.set()
+        if self._avisar is not None:
+            self._avisar()
+
+    def tomar(self, espera=None):
+        # Espera hasta "espera" segundos si no hay nada. Devuelve (eventos, reinicio):
+        # reinicio es el número con el que mandar "reiniciar", o None
+        if espera:
+            self._hay.wait(espera)
+        with self._lock:
+            self._hay.clear()
+            eventos = list(self._pendientes)
+            self._pendientes.clear()
+            reinicio, self._reinicio = self._reinicio, None
+        return eventos, reinicio
+
+    def texto(self, eventos, reinicio):
+        # Lo que se le envía al cliente por cada tomar()
+        partes = []
+        if reinicio is not None:
+            partes.append(formato_sse(reinicio, "reiniciar", "{}"))
+        partes.extend(formato_sse(*evento) for evento in eventos)
+        return "".join(partes)
+
+
+class CanalEventos:
+    def __init__(self, historial=HISTORIAL_EVENTOS, capacidad_cliente=CAPACIDAD_CLIENTE, max_clientes=MAX_CLIENTES):
+        self.capacidad_cliente = capacidad_cliente
+        self.max_clientes = max_clientes
+        self._lock = threading.Lock()
+        self._historial = deque(maxlen=historial)
+        self._clientes = set()
+        self.ultimo = 0
+
+    def publicar(self, tipo, datos):
+        texto = json.dumps(datos, ensure_ascii=False, separators=(",", ":"))
+        with self._lock:
+            self.ultimo += 1
+            evento = (self.ultimo, tipo, texto)
+            self._historial.append(evento)
+            for suscripcion in self._clientes:
+                suscripcion.recibir(evento)
+
+    def reiniciar(self):
+        # Todos los clientes vuelven a pedir lo que muestran (ej: después de una carga
+        # masiva, que no publica un evento por registro). Queda en el historial para
+        # los que se reconecten después
+        self.publicar("reiniciar", {})
+
+    def suscribir(self, tipos=None, desde=None, avisar=None):
+        # desde: número del último evento que recibió el cliente (Last-Event-ID).
+        # Devuelve None si ya hay max_clientes conectados
+        with self._lock:
+            if len(self._clientes) >= self.max_clientes:
+                return None
+            suscripcion = Suscripcion(tipos, self.capacidad_cliente, avisar)
+            if desde is not None and desde < self.ultimo:
+                if self._historial and self._historial[0][0] <= desde + 1:
+                    for evento in self._historial:
+                        if evento[0] > desde:
+                            suscripcion.recibir(evento)
+                else:
+                    # Lo que se perdió ya no está en el historial
+                    suscripcion.reiniciar(self.ultimo)
+            self._clientes.add(suscripcion)
+            return suscripcion
+
+    def cancelar(self, suscripcion):
+        with self._lock:
+            self._clientes.discard(suscripcion)
+
+    def estadisticas(self):
+        with self._lock:
+            return {"clientes": len(self._clientes), "ultimo": self.ultimo, "historial": len(self._historial)}
@@ -0,0 +1,158 @@
+import csv
+import io
+import json
+
+from models.biblioteca import ErrorBiblioteca
+from models.libro import Libro
+from models.usuario import Usuario
+
+
+# Columnas de cada tipo de registro, en el orden en que se exportan.
+# Al importar, el id y los préstamos se ignoran: cada registro recibe un id nuevo
+COLUMNAS = {
+    "libros": ("id_libro", "titulo", "autor", "genero", "stock", "prestados"),
+    "usuarios": ("id_usuario", "nombre", "apellido", "dni", "telefono", "direccion", "nro_direccion"),
+}
+FORMATOS = ("csv", "jsonl")
+
+# Registros que se agregan juntos, con los índices armados al final de cada lote
+TAMANIO_LOTE = 200_000
+# Errores que se detallan en el resultado (el resto solo se cuentan)
+MAXIMO_ERRORES = 100
+# Registros por bloque de texto al exportar
+FILAS_POR_BLOQUE = 1000
+
+
+def formato_de(nombre_archivo, formato=None):
+    # El formato se puede indicar explícitamente o deducir de la extensión
+    if not formato and nombre_archivo:
+        extension = nombre_archivo.rsplit(".", 1)[-1].lower()
+        formato = "jsonl" if extension in ("jsonl", "ndjson") else extension
+    if formato not in FORMATOS:
+        raise ErrorBiblioteca("Formato inválido: debe ser csv o jsonl.")
+    return formato
+
+
+def _validar_tipo(tipo):
+    if tipo not in COLUMNAS:
+        raise ErrorBiblioteca("Tipo inválido: debe ser libros o usuarios.")
+
+
+# ---------- Importación ----------
+
+def leer_filas(archivo, formato):
+    # Genera (número de línea, fila) leyendo el archivo de texto de a una línea
+    if formato == "csv":
+        lector = csv.DictReader(archivo)
+        for fila in lector:
+            yield lector.line_num, fila
+        return
+    for numero, linea in enumerate(archivo, 1):
+        if not linea.strip():
+            continue
+        try:
+            yield numero, json.loads(linea)
+        except json.JSONDecodeError:
+            yield numero, None
+
+
+def _texto(fila, campo, obligatorio=True):
+    valor = fila.get(campo)
+    valor = "" if valor is None else str(valor).strip()
+    if obligatorio and not valor:
+        raise ValueError(f"Falta el campo '{campo}'.")
+    return valor
+
+
+def libro_desde_fila(fila):
+    stock = fila.get("stock")
+    if stock is None or stock == "":
+        stock = 1
+    try:
+        stock = int(stock)
+    except (TypeError, ValueError):
+        raise ValueError(f"Stock inválido: {stock!r}.")
+    if stock < 0:
+        raise ValueError("El stock no puede ser negativo.")
+    return Libro(None, _texto(fila, "titulo"), _texto(fila, "autor"), _texto(fila, "genero"), stock)
+
+
+def usuario_desde_fila(fila):
+    return Usuario(
+        None,
+        _texto(fila, "nombre"),
+        _texto(fila, "apellido"),
+        _texto(fila, "dni"),
+        _texto(fila, "telefono", obligatorio=False),
+        _texto(fila, "direccion", obligatorio=False),
+        _texto(fila, "nro_direccion", obligatorio=False),
+    )
+
+
+def importar(biblioteca, archivo, tipo, formato, tamanio_lote=TAMANIO_LOTE):
+    # Lee el archivo por partes y agrega los registros válidos en lotes.
+    # Las filas inválidas se saltean y se informan con su número de línea
+    _validar_tipo(tipo)
+    formato = formato_de(None, formato)
+    if tipo == "libros":
+        convertir, agregar = libro_desde_fila, biblioteca.agregar_libros
+    else:
+        convertir, agregar = usuario_desde_fila, biblioteca.agregar_usuarios
+
+    importados = 0
+    cantidad_errores = 0
+    errores = []
+    lote = []
+    for numero, fila in leer_filas(archivo, formato):
+        try:
+            if not isinstance(fila, dict):
+                raise ValueError("La línea no es un objeto JSON válido.")
+            lote.append(convertir(fila))
+        except ValueError as error:
+            cantidad_errores += 1
+            if len(errores) < MAXIMO_ERRORES:
+                errores.append({"linea": numero, "error": str(error)})
+            continue
+        if len(lote) >= tamanio_lote:
+            importados += _agregar_lote(biblioteca, agregar, lote)
+            lote = []
+    if lote:
+        importados += _agregar_lote(biblioteca, agregar, lote)
+    return {"importados": importados, "errores": cantidad_errores, "detalle_errores": errores}
+
+
+def _agregar_lote(biblioteca, agregar, lote):
+    with biblioteca.carga_masiva():
+        agregar(lote)
+    return len(lote)
+
+
+# ---------- Exportación ----------
+
+def exportar(biblioteca, tipo, formato):
+    # Generador de bloques de texto para una respuesta en streaming:
+    # los registros se leen de a uno, sin armar el archivo completo en memoria
+    _validar_tipo(tipo)
+    formato = formato_de(None, formato)
+    columnas = COLUMNAS[tipo]
+    if tipo == "libros":
+        _, registros = biblioteca.consultar_libros()
+    else:
+        _, registros = biblioteca.consultar_usuarios()
+
+    buffer = io.StringIO()
+    escritor = csv.writer(buffer, lineterminator="\n")
+    if formato == "csv":
+        escritor.writerow(columnas)
+    for cantidad, registro in enumerate(registros, 1):
+        valores = [getattr(registro, columna) for columna in columnas]
+        if formato == "csv":
+            escritor.writerow(valores)
+        else:
+            buffer.write(json.dumps(dict(zip(columnas, valores)), ensure_ascii=False) + "\n")
+        if cantidad % FILAS_POR_BLOQUE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
@@ -0,0 +1,559 @@
+import sys
+import threading
+from array import array
+from bisect import bisect_left, bisect_right, insort
+from heapq import heapify, heappop, heappush, nsmallest
+from math import log2
+
+from models.texto import normalizar
+
+
+class IndiceNgramas:
+    # Índice invertido de n-gramas para búsquedas por subcadena.
+    # Cada n-grama apunta a un array compacto con los ids de los registros que
+    # lo contienen. Las bajas y ediciones no recorren los arrays: se marcan
+    # como entradas obsoletas y se descartan al verificar los candidatos.
+    # Con internar=True los textos iguales se guardan una sola vez (para campos
+    # con pocos valores distintos, como autor o género)
+    def __init__(self, n=3, internar=False):
+        self.n = n
+        self.internar = internar
+        self._textos = {}
+        self._posting = {}
+        self._obsoletas = 0
+        self._pendientes = None
+        # Textos revisados por buscar() desde que se creó el índice (para las métricas)
+        self.revisados = 0
+
+    def __len__(self):
+        return len(self._textos)
+
+    def _ngramas(self, texto):
+        return {texto[i:i + self.n] for i in range(len(texto) - self.n + 1)}
+
+    def agregar(self, id_registro, texto):
+        # texto ya normalizado (ej: Libro.titulo_n): se guarda ese mismo objeto
+        if self.internar:
+            texto = sys.intern(texto)
+        anterior = self._textos.get(id_registro)
+        if anterior == texto:
+            return
+        if anterior is not None:
+            self._obsoletas += 1
+        self._textos[id_registro] = texto
+        if self._pendientes is not None:
+            self._pendientes.append(id_registro)
+            return
+        for ngrama in self._ngramas(texto):
+            posting = self._posting.get(ngrama)
+            if posting is None:
+                posting = self._posting[ngrama] = array("q")
+            posting.append(id_registro)
+        self._compactar_si_hace_falta()
+
+    def quitar(self, id_registro):
+        if self._textos.pop(id_registro, None) is not None:
+            self._obsoletas += 1
+            self._compactar_si_hace_falta()
+
+    def buscar(self, q):
+        # q ya viene normalizado, igual que los textos guardados,
+        # así que el resultado es el mismo que "q in normalizar(campo)"
+        if len(q) < self.n:
+            self.revisados += len(self._textos)
+            return [i for i, texto in self._textos.items() if q in texto]
+
+        # Solo se revisan los registros del n-grama menos frecuente de la consulta
+        postings = [self._posting.get(ngrama) for ngrama in self._ngramas(q)]
+        if any(p is None for p in postings):
+            return []
+        candidatos = min(postings, key=len)
+        self.revisados += len(candidatos)
+
+        vistos = set()
+        resultado = []
+        for id_registro in candidatos:
+            if id_registro in vistos:
+                continue
+            vistos.add(id_registro)
+            texto = self._textos.get(id_registro)
+            if texto is not None and q in texto:
+                resultado.append(id_registro)
+        return resultado
+
+    def armar(self, pares):
+        # Arma el índice vacío de una vez con los pares (id, texto normalizado),
+        # calculando los n-gramas una sola vez por texto distinto
+        por_texto = {}
+        for id_registro, texto in pares:
+            if self.internar:
+                texto = sys.intern(texto)
+            self._textos[id_registro] = texto
+            por_texto.setdefault(texto, []).append(id_registro)
+        # Primero en listas (agregar a una lista cuesta menos que a un array)
+        listas = {}
+        for texto, ids in por_texto.items():
+            for ngrama in self._ngramas(texto):
+                lista = listas.get(ngrama)
+                if lista is None:
+                    listas[ngrama] = ids.copy()
+                else:
+                    lista.extend(ids)
+        self._posting = {ngrama: array("q", ids) for ngrama, ids in listas.items()}
+
+    def diferir(self):
+        # Durante una carga masiva solo se guardan los textos; los arrays se arman
+        # al llamar a reanudar(), calculando una sola vez los n-gramas de cada texto
+        # distinto (autor y género se repiten en muchos registros)
+        if self._pendientes is None:
+            self._pendientes = []
+
+    def reanudar(self):
+        pendientes, self._pendientes = self._pendientes, None
+        if not pendientes:
+            return
+        por_texto = {}
+        for id_registro in pendientes:
+            texto = self._textos.get(id_registro)
+            if texto is not None:
+                por_texto.setdefault(texto, []).append(id_registro)
+        for texto, ids in por_texto.items():
+            for ngrama in self._ngramas(texto):
+                posting = self._posting.get(ngrama)
+                if posting is None:
+                    posting = self._posting[ngrama] = array("q")
+                posting.extend(ids)
+        self._compactar_si_hace_falta()
+
+    def _compactar_si_hace_falta(self):
+        # Reconstruimos los arrays cuando las entradas obsoletas superan a las vigentes
+        if self._obsoletas > max(len(self._textos), 1024):
+            self.reconstruir()
+
+    def reconstruir(self):
+        textos = self._textos
+        self._textos = {}
+        self._posting = {}
+        self._obsoletas = 0
+        for id_registro, texto in textos.items():
+            self.agregar(id_registro, texto)
+
+
+class IndiceOrdenado:
+    # Índice secundario que mantiene los ids ordenados por una clave.
+    # Las altas, ediciones y bajas insertan o quitan con búsqueda binaria,
+    # así los listados recorren el índice en lugar de ordenar en cada petición.
+    # internar=True comparte las claves de texto repetidas, igual que en IndiceNgramas
+    def __init__(self, internar=False):
+        self.internar = internar
+        self._claves = {}
+        self._orden = []
+        self._diferido = False
+
+    def __len__(self):
+        return len(self._orden)
+
+    def clave(self, id_registro):
+        return self._claves[id_registro]
+
+    def agregar(self, id_registro, clave):
+        if self.internar and isinstance(clave, str):
+            clave = sys.intern(clave)
+        anterior = self._claves.get(id_registro)
+        if anterior is not None:
+            if anterior == clave:
+                return
+            self._quitar_entrada(anterior, id_registro)
+        self._claves[id_registro] = clave
+        if self._diferido:
+            self._orden.append((clave, id_registro))
+        else:
+            insort(self._orden, (clave, id_registro))
+
+    def quitar(self, id_registro):
+        clave = self._claves.pop(id_registro, None)
+        if clave is not None:
+            self._quitar_entrada(clave, id_registro)
+
+    def _quitar_entrada(self, clave, id_registro):
+        if self._diferido:
+            self._orden.remove((clave, id_registro))
+            return
+        posicion = bisect_left(self._orden, (clave, id_registro))
+        del self._orden[posicion]
+
+    def armar(self, pares):
+        # Arma el índice vacío de una vez con los pares (id, clave): un único ordenamiento
+        claves = self._claves
+        for id_registro, clave in pares:
+            if self.internar and isinstance(clave, str):
+                clave = sys.intern(clave)
+            claves[id_registro] = clave
+        self._orden = sorted((clave, id_registro) for id_registro, clave in claves.items())
+
+    def diferir(self):
+        # Durante una carga masiva las altas se agregan al final sin ordenar
+        # y el índice se ordena una sola vez al llamar a reanudar()
+        self._diferido = True
+
+    def reanudar(self):
+        if self._diferido:
+            self._diferido = False
+            self._orden.sort()
+
+    def recorrer(self, descendente=False, desde=None):
+        # desde es una entrada (clave, id) ya entregada: se continúa justo después.
+        # El recorrido es por posición: si otro hilo quita entradas mientras tanto
+        # la página puede saltear alguna, pero nunca falla
+        orden = self._orden
+        try:
+            if descendente:
+                fin = len(orden) if desde is None else bisect_left(orden, desde)
+                for posicion in range(fin - 1, -1, -1):
+                    yield orden[posicion][1]
+            else:
+                inicio = 0 if desde is None else bisect_right(orden, desde)
+                for posicion in range(inicio, len(orden)):
+                    yield orden[posicion][1]
+        except IndexError:
+            return
+
+    def ordenar(self, ids, descendente=False, desde=None):
+        # Con pocos ids conviene ordenarlos usando las claves ya calculadas;
+        # con muchos, recorrer el índice y quedarse con los seleccionados
+        cantidad = len(ids)
+        if cantidad * log2(cantidad + 1) < len(self._orden):
+            claves = self._claves
+            entradas = sorted((claves[i], i) for i in ids if i in claves)
+            if descendente:
+                fin = len(entradas) if desde is None else bisect_left(entradas, desde)
+                return (entradas[p][1] for p in range(fin - 1, -1, -1))
+            inicio = 0 if desde is None else bisect_right(entradas, desde)
+            return (entradas[p][1] for p in range(inicio, len(entradas)))
+        seleccion = ids if isinstance(ids, (set, frozenset)) else set(ids)
+        if len(seleccion) == len(self._orden):
+            return self.recorrer(descendente, desde)
+        return (i for i in self.recorrer(descendente, desde) if i in seleccion)
+
+
+class IndicePrefijos:
+    # Índice para autocompletar: los textos distintos de un campo (normalizados)
+    # en una lista ordenada, cada uno con su popularidad acumulada (la suma de la
+    # de todos los registros que lo tienen). Las sugerencias de un prefijo son el
+    # rango de la lista que empieza con él, del más popular al menos popular.
+    # Para los prefijos cortos el rango es muy grande: de esos se guarda aparte una
+    # lista con los más populares, que se corrige con cada cambio en lugar de
+    # recalcularse. Invariante: todo texto del prefijo que no está en esa lista
+    # va después del último de la lista, así los primeros k son siempre exactos.
+    # Tiene su propio lock porque los préstamos cambian la popularidad sin tomar
+    # el lock de escritura de la biblioteca
+    def __init__(self, internar=False, capacidad=64, umbral=2048):
+        self.internar = internar
+        self.capacidad = capacidad
+        self.umbral = umbral
+        self._lock = threading.Lock()
+        self._registros = {}
+        self._valores = {}
+        self._orden = []
+        self._mejores = {}
+        self._largo_mejores = 0
+        self._diferido = False
+
+    def __len__(self):
+        return len(self._orden)
+
+    def agregar(self, id_registro, texto, popularidad=0, normalizado=None):
+        # Alta o edición: el registro queda con este texto y esta popularidad.
+        # normalizado es la clave ya calculada del texto (ej: Libro.titulo_n)
+        if normalizado is None:
+            normalizado = normalizar(texto)
+        if self.internar:
+            normalizado = sys.intern(normalizado)
+        with self._lock:
+            anterior = self._registros.get(id_registro)
+            if anterior is not None:
+                if anterior[0] == normalizado:
+                    self._sumar(anterior, popularidad - anterior[1])
+                    return
+                self._quitar(id_registro)
+            registro = self._registros[id_registro] = [normalizado, 0]
+            valor = self._valores.get(normalizado)
+            if valor is None:
+                # [texto a mostrar, popularidad, cantidad de registros]
+                valor = self._valores[normalizado] = [texto, 0, 0]
+                if self._diferido:
+                    self._orden.append(normalizado)
+                else:
+                    insort(self._orden, normalizado)
+                self._actualizar_mejores(normalizado, None, 0)
+            valor[2] += 1
+            self._sumar(registro, popularidad)
+
+    def quitar(self, id_registro):
+        with self._lock:
+            if id_registro in self._registros:
+                self._quitar(id_registro)
+
+    def sumar_popularidad(self, id_registro, cantidad):
+        with self._lock:
+            registro = self._registros.get(id_registro)
+            if registro is not None:
+                self._sumar(registro, cantidad)
+
+    def _sumar(self, registro, cantidad):
+        if not cantidad:
+            return
+        registro[1] += cantidad
+        valor = self._valores[registro[0]]
+        anterior = valor[1]
+        valor[1] += cantidad
+        self._actualizar_mejores(registro[0], anterior, valor[1])
+
+    def _quitar(self, id_registro):
+        normalizado, popularidad = self._registros.pop(id_registro)
+        valor = self._valores[normalizado]
+        anterior = valor[1]
+        valor[1] -= popularidad
+        valor[2] -= 1
+        if valor[2]:
+            self._actualizar_mejores(normalizado, anterior, valor[1])
+            return
+        del self._valores[normalizado]
+        if self._diferido:
+            self._orden.remove(normalizado)
+        else:
+            del self._orden[bisect_left(self._orden, normalizado)]
+        self._actualizar_mejores(normalizado, anterior, None)
+
+    def _actualizar_mejores(self, normalizado, antes, despues):
+        # Corrige las listas de los prefijos de normalizado que tienen una guardada.
+        # antes / despues son su popularidad (None si no existía o dejó de existir)
+        for largo in range(1, min(len(normalizado), self._largo_mejores) + 1):
+            prefijo = normalizado[:largo]
+            mejores = self._mejores.get(prefijo)
+            if mejores is None:
+                continue
+            if antes is not None:
+                entrada = (-antes, normalizado)
+                posicion = bisect_left(mejores, entrada)
+                if posicion < len(mejores) and mejores[posicion] == entrada:
+                    del mejores[posicion]
+            if not mejores:
+                # Sin un último de referencia no se puede mantener el invariante
+                del self._mejores[prefijo]
+                continue
+            if despues is None:
+                continue
+            entrada = (-despues, normalizado)
+            if entrada < mejores[-1]:
+                insort(mejores, entrada)
+                if len(mejores) > self.capacidad:
+                    mejores.pop()
+            # Si no, queda fuera de la lista (también si estaba y bajó): va después
+            # del último y la lista se recalcula cuando le faltan sugerencias
+
+    def sugerir(self, prefijo, cantidad=10):
+        # Devuelve hasta cantidad pares (texto, popularidad) que empiezan con prefijo
+        prefijo = normalizar(prefijo)
+        cantidad = max(1, min(cantidad, self.capacidad))
+        with self._lock:
+            if self._diferido or not prefijo:
+                return []
+            orden = self._orden
+            inicio = bisect_left(orden, prefijo)
+            fin = bisect_left(orden, prefijo + "\U0010ffff", inicio)
+            valores = self._valores
+            if fin - inicio <= self.umbral:
+                mejores = nsmallest(cantidad, ((-valores[t][1], t) for t in orden[inicio:fin]))
+            else:
+                mejores = self._mejores.get(prefijo)
+                if mejores is None or len(mejores) < cantidad:
+                    mejores = nsmallest(self.capacidad, ((-valores[t][1], t) for t in orden[inicio:fin]))
+                    self._mejores[prefijo] = mejores
+                    self._largo_mejores = max(self._largo_mejores, len(prefijo))
+                mejores = mejores[:cantidad]
+            return [(valores[t][0], -popularidad) for popularidad, t in mejores]
+
+    def armar(self, entradas):
+        # Arma el índice vacío de una vez con las entradas (id, texto, popularidad,
+        # normalizado). Las listas de los más populares se calculan al pedirlas
+        with self._lock:
+            registros = self._registros
+            valores = self._valores
+            for id_registro, texto, popularidad, normalizado in entradas:
+                if self.internar:
+                    normalizado = sys.intern(normalizado)
+                registros[id_registro] = [normalizado, popularidad]
+                valor = valores.get(normalizado)
+                if valor is None:
+                    valores[normalizado] = [texto, popularidad, 1]
+                else:
+                    valor[1] += popularidad
+                    valor[2] += 1
+            self._orden = sorted(valores)
+
+    def diferir(self):
+        # Igual que IndiceOrdenado: durante una carga masiva los textos nuevos se
+        # agregan al final y se ordenan una sola vez en reanudar()
+        with self._lock:
+            self._diferido = True
+            self._mejores = {}
+            self._largo_mejores = 0
+
+    def reanudar(self):
+        with self._lock:
+            if self._diferido:
+                self._diferido = False
+                self._orden.sort()
+
+
+class IndiceVencimientos:
+    # Préstamos vigentes ordenados por fecha de vencimiento en un heap binario
+    # (el primero en vencer en la raíz). El índice sabe en qué posición del heap
+    # está cada préstamo, así una devolución lo quita en O(log n) sin dejar
+    # entradas obsoletas. vencidos() no saca nada del heap: lo recorre como árbol
+    # desde la raíz y solo baja por los nodos ya vencidos (un nodo vence antes
+    # que sus hijos), así listar k vencidos cuesta O(k log k) aunque haya millones
+    # de préstamos. Tiene su propio lock porque los préstamos no toman el lock de
+    # escritura de la biblioteca
+    def __init__(self):
+        self._lock = threading.Lock()
+        # Entradas (vence en segundos, número de alta, id_usuario, id_libro): con
+        # enteros las comparaciones cuestan mucho menos que con datetime, y el
+        # número desempata los vencimientos iguales por orden de préstamo
+        self._heap = []
+        self._posiciones = {}
+        self._numero = 0
+        self._diferido = False
+
+    def __len__(self):
+        return len(self._heap)
+
+    def agregar(self, id_usuario, id_libro, vence):
+        with self._lock:
+            clave = (id_usuario, id_libro)
+            if clave in self._posiciones:
+                self._quitar(clave)
+            self._numero += 1
+            self._poner((_segundos(vence), self._numero, id_usuario, id_libro), len(self._heap))
+            if not self._diferido:
+                self._subir(len(self._heap) - 1)
+
+    def quitar(self, id_usuario, id_libro):
+        with self._lock:
+            clave = (id_usuario, id_libro)
+            if clave in self._posiciones:
+                self._quitar(clave)
+
+    def _quitar(self, clave):
+        # La última entrada ocupa el lugar de la que se va y se reacomoda
+        heap = self._heap
+        posicion = self._posiciones.pop(clave)
+        ultima = heap.pop()
+        if posicion == len(heap):
+            return
+        self._poner(ultima, posicion)
+        if not self._diferido:
+            self._bajar(self._subir(posicion))
+
+    def _poner(self, entrada, posicion):
+        if posicion == len(self._heap):
+            self._heap.append(entrada)
+        else:
+            self._heap[posicion] = entrada
+        self._posiciones[(entrada[2], entrada[3])] = posicion
+
+    def _subir(self, posicion):
+        heap = self._heap
+        entrada = heap[posicion]
+        while posicion > 0:
+            padre = (posicion - 1) // 2
+            if heap[padre] <= entrada:
+                break
+            self._poner(heap[padre], posicion)
+            posicion = padre
+        self._poner(entrada, posicion)
+        return posicion
+
+    def _bajar(self, posicion):
+        heap = self._heap
+        entrada = heap[posicion]
+        cantidad = len(heap)
+        while True:
+            hijo = 2 * posicion + 1
+            if hijo >= cantidad:
+                break
+            if hijo + 1 < cantidad and heap[hijo + 1] < heap[hijo]:
+                hijo += 1
+            if entrada <= heap[hijo]:
+                break
+            self._poner(heap[hijo], posicion)
+            posicion = hijo
+        self._poner(entrada, posicion)
+        return posicion
+
+    def vencidos(self, hasta, limite=None):
+        # Pares (id_usuario, id_libro) que vencen hasta "hasta", del que venció
+        # primero al último
+        hasta = _segundos(hasta)
+        with self._lock:
+            heap = self._heap
+            if self._diferido:
+                # Durante una carga masiva el heap todavía no está armado
+                entradas = sorted(e for e in heap if e[0] <= hasta)[:limite]
+                return [(e[2], e[3]) for e in entradas]
+            if not heap or heap[0][0] > hasta:
+                return []
+            if limite is None:
+                # Todos los vencidos: se juntan recorriendo el árbol y se ordenan una vez
+                entradas = []
+                pendientes = [0]
+                cantidad = len(heap)
+                while pendientes:
+                    posicion = pendientes.pop()
+                    entradas.append(heap[posicion])
+                    for hijo in (2 * posicion + 1, 2 * posicion + 2):
+                        if hijo < cantidad and heap[hijo][0] <= hasta:
+                            pendientes.append(hijo)
+                entradas.sort()
+                return [(e[2], e[3]) for e in entradas]
+            # Los primeros "limite": la frontera tiene los nodos vencidos todavía no
+            # entregados, ordenados; siempre se entrega el menor y se agregan sus hijos
+            resultado = []
+            frontera = [(heap[0], 0)]
+            while frontera and len(resultado) < limite:
+                entrada, posicion = heappop(frontera)
+                resultado.append((entrada[2], entrada[3]))
+                for hijo in (2 * posicion + 1, 2 * posicion + 2):
+                    if hijo < len(heap) and heap[hijo][0] <= hasta:
+                        heappush(frontera, (heap[hijo], hijo))
+            return resultado
+
+    def armar(self, prestamos):
+        # Arma el índice vacío de una vez con los préstamos (id_usuario, id_libro, vence)
+        with self._lock:
+            self._heap = [
+                (_segundos(vence), numero, id_usuario, id_libro)
+                for numero, (id_usuario, id_libro, vence) in enumerate(prestamos, 1)
+            ]
+            self._numero = len(self._heap)
+            heapify(self._heap)
+            self._posiciones = {(e[2], e[3]): i for i, e in enumerate(self._heap)}
+
+    def diferir(self):
+        # Durante una carga masiva las altas se agregan al final y el heap
+        # se arma una sola vez en reanudar()
+        with self._lock:
+            self._diferido = True
+
+    def reanudar(self):
+        with self._lock:
+            if self._diferido:
+                self._diferido = False
+                heapify(self._heap)
+                self._posiciones = {(e[2], e[3]): i for i, e in enumerate(self._heap)}
+
+
+def _segundos(fecha):
+    # Segundos desde el año 1 (sin microsegundos: las fechas de préstamo no los tienen)
+    return fecha.toordinal() * 86400 + fecha.hour * 3600 + fecha.minute * 60 + fecha.second
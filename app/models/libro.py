@@ -1,4 +1,14 @@
+from models.texto import normalizar
+from models.versiones import siguiente_version
+
+
 class Libro:
+    # __slots__ evita un __dict__ por instancia: con catálogos grandes
+    # es la mayor parte de la memoria que ocupa cada libro
+    __slots__ = (
+        "id_libro", "titulo", "autor", "genero", "prestados", "stock", "version", "titulo_n", "autor_n", "genero_n",
+    )
+
     def __init__(self, id_libro=None, titulo="", autor="", genero="", stock= 1):
         self.id_libro = id_libro  
         self.titulo = titulo
@@ -6,13 +16,34 @@ class Libro:
         self.genero = genero
         self.prestados = 0
         self.stock = stock
+        # Cambia con cada modificación (ver models/versiones.py); None en las copias
+        # leídas de SQLite, que se arman de nuevo en cada consulta
+        self.version = siguiente_version()
+        self.actualizar_claves()
+
+    def actualizar_claves(self):
+        # Claves normalizadas (ver models/texto.py) con las que se busca y se ordena;
+        # se calculan al crear el libro y al editarlo, no en cada consulta
+        self.titulo_n = normalizar(self.titulo)
+        self.autor_n = normalizar(self.autor)
+        self.genero_n = normalizar(self.genero)
 
     def prestar(self):
         if self.stock > 0:
             self.stock -= 1
             self.prestados += 1
+            self.version = siguiente_version()
 
     def devolver(self):
         if self.prestados > 0:
             self.stock += 1
             self.prestados -= 1
+            self.version = siguiente_version()
+
+    # Dos objetos Libro con el mismo id representan el mismo libro
+    # (por ejemplo, cuando se leen por separado desde la base de datos)
+    def __eq__(self, otro):
+        return isinstance(otro, Libro) and self.id_libro == otro.id_libro
+
+    def __hash__(self):
+        return hash(self.id_libro)
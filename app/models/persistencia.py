@@ -0,0 +1,260 @@
+import json
+import os
+import threading
+from contextlib import nullcontext
+from datetime import datetime
+
+from models.libro import Libro
+from models.prestamo import Prestamo, Reserva
+from models.usuario import Usuario
+
+
+class Persistencia:
+    # Guarda el estado de una Biblioteca en disco con dos tipos de archivo:
+    # - segmentos de registro de operaciones (append-only), uno por línea en JSON
+    # - una instantánea compacta del estado completo, que indica hasta qué
+    #   segmento incluye, para no volver a aplicar operaciones ya compactadas
+    # Las escrituras solo van al buffer del archivo; un hilo hace flush + fsync
+    # cada "intervalo_fsync" segundos, agrupando todas las operaciones del período.
+    def __init__(self, directorio, intervalo_fsync=0.05, operaciones_por_instantanea=100_000):
+        self.directorio = directorio
+        self.intervalo_fsync = intervalo_fsync
+        self.operaciones_por_instantanea = operaciones_por_instantanea
+        self._lock = threading.Lock()
+        self._archivo = None
+        self._segmento = 0
+        self._operaciones = 0
+        self._pendiente = False
+        self._compactando = False
+        self._cerrado = threading.Event()
+        self._hilo_fsync = None
+        self._hilo_instantanea = None
+        self._biblioteca = None
+        os.makedirs(directorio, exist_ok=True)
+
+    # ---------- Archivos ----------
+
+    def _ruta_segmento(self, numero):
+        return os.path.join(self.directorio, f"operaciones.{numero:06d}.log")
+
+    def _ruta_instantanea(self):
+        return os.path.join(self.directorio, "instantanea.jsonl")
+
+    def _segmentos(self):
+        numeros = []
+        for nombre in os.listdir(self.directorio):
+            if nombre.startswith("operaciones.") and nombre.endswith(".log"):
+                numeros.append(int(nombre.split(".")[1]))
+        return sorted(numeros)
+
+    def _abrir_segmento(self, numero):
+        self._segmento = numero
+        self._archivo = open(self._ruta_segmento(numero), "a", encoding="utf-8")
+
+    # ---------- Carga ----------
+
+    def cargar(self, biblioteca):
+        # Reconstruye la biblioteca desde la instantánea y los segmentos posteriores,
+        # y a partir de ahí registra en disco cada operación que se haga sobre ella
+        biblioteca.persistencia = None
+        # Los préstamos que resultaron de una reserva ya están en el registro
+        biblioteca.asignar_reservas = False
+        incluido = 0
+        if os.path.exists(self._ruta_instantanea()):
+            with open(self._ruta_instantanea(), encoding="utf-8") as archivo:
+                encabezado = json.loads(archivo.readline())
+                incluido = encabezado[1]
+                biblioteca.restaurar(*leer_instantanea(json.loads(linea) for linea in archivo))
+
+        segmentos = [n for n in self._segmentos() if n > incluido]
+        with biblioteca.carga_masiva() if segmentos else nullcontext():
+            for numero in segmentos:
+                with open(self._ruta_segmento(numero), encoding="utf-8") as archivo:
+                    for linea in archivo:
+                        # Una última línea incompleta (corte durante la escritura) se descarta
+                        if linea.endswith("\n"):
+                            aplicar(biblioteca, json.loads(linea))
+                            self._operaciones += 1
+
+        self._abrir_segmento(max(segmentos + [incluido]) + 1)
+        self._biblioteca = biblioteca
+        self._hilo_fsync = threading.Thread(target=self._sincronizar_periodicamente, daemon=True)
+        self._hilo_fsync.start()
+        biblioteca.asignar_reservas = True
+        biblioteca.persistencia = self
+
+    # ---------- Escritura ----------
+
+    def registrar(self, operacion):
+        linea = json.dumps(operacion, ensure_ascii=False, separators=(",", ":")) + "\n"
+        with self._lock:
+            self._archivo.write(linea)
+            self._pendiente = True
+            self._operaciones += 1
+
+    def _sincronizar_periodicamente(self):
+        # La instantánea también se dispara desde acá y no desde registrar():
+        # quien registra una operación tiene tomados locks de la biblioteca
+        # y compactar necesita tomarlos todos
+        while not self._cerrado.wait(self.intervalo_fsync):
+            self.sincronizar()
+            if self._operaciones >= self.operaciones_por_instantanea and not self._compactando:
+                self._biblioteca.compactar()
+
+    def sincronizar(self):
+        with self._lock:
+            if not self._pendiente or self._archivo is None:
+                return
+            self._archivo.flush()
+            os.fsync(self._archivo.fileno())
+            self._pendiente = False
+
+    # ---------- Compactación ----------
+
+    def compactar(self, biblioteca, en_segundo_plano=True):
+        # Debe llamarse sin otras escrituras en curso sobre la biblioteca
+        # (Biblioteca lo hace mientras tiene tomados todos sus locks).
+        # Se corta el segmento actual, se copia el estado en memoria y la
+        # instantánea se escribe en otro hilo sin frenar las peticiones.
+        with self._lock:
+            self._compactando = True
+            self._archivo.flush()
+            os.fsync(self._archivo.fileno())
+            self._archivo.close()
+            incluido = self._segmento
+            self._abrir_segmento(incluido + 1)
+            self._operaciones = 0
+        registros = list(registros_de(biblioteca))
+
+        if en_segundo_plano:
+            self._hilo_instantanea = threading.Thread(
+                target=self._escribir_instantanea, args=(incluido, registros), daemon=True
+            )
+            self._hilo_instantanea.start()
+        else:
+            self._escribir_instantanea(incluido, registros)
+
+    def _escribir_instantanea(self, incluido, registros):
+        temporal = self._ruta_instantanea() + ".tmp"
+        with open(temporal, "w", encoding="utf-8") as archivo:
+            archivo.write(json.dumps(["instantanea", incluido]) + "\n")
+            for registro in registros:
+                archivo.write(json.dumps(registro, ensure_ascii=False, separators=(",", ":")) + "\n")
+            archivo.flush()
+            os.fsync(archivo.fileno())
+        os.replace(temporal, self._ruta_instantanea())
+
+        # Los segmentos ya incluidos en la instantánea no hacen falta más
+        for numero in self._segmentos():
+            if numero <= incluido:
+                os.remove(self._ruta_segmento(numero))
+        self._compactando = False
+
+    def cerrar(self):
+        self._cerrado.set()
+        if self._hilo_fsync is not None and self._hilo_fsync is not threading.current_thread():
+            self._hilo_fsync.join()
+        if self._hilo_instantanea is not None:
+            self._hilo_instantanea.join()
+        self.sincronizar()
+        with self._lock:
+            if self._archivo is not None:
+                self._archivo.close()
+                self._archivo = None
+
+
+# ---------- Formato de los registros ----------
+# Cada operación es una lista JSON cuyo primer elemento es el tipo.
+# "libro", "usuario", "prestamo" y "reserva" también se usan en la instantánea.
+
+def registro_libro(libro):
+    return ["libro", libro.id_libro, libro.titulo, libro.autor, libro.genero, libro.stock, libro.prestados]
+
+
+def registro_usuario(usuario):
+    return [
+        "usuario", usuario.id_usuario, usuario.nombre, usuario.apellido, usuario.dni,
+        usuario.telefono, usuario.direccion, usuario.nro_direccion,
+    ]
+
+
+def registro_prestamo(tipo, prestamo):
+    return [tipo, prestamo.id_usuario, prestamo.id_libro, prestamo.fecha.isoformat(), prestamo.vence.isoformat()]
+
+
+def registro_reserva(tipo, reserva):
+    return [tipo, reserva.id_usuario, reserva.id_libro, reserva.fecha.isoformat()]
+
+
+def _fecha(registro, posicion):
+    # Los registros anteriores a las fechas de préstamo (o de vencimiento) no la traen
+    return datetime.fromisoformat(registro[posicion]) if len(registro) > posicion else None
+
+
+def registros_de(biblioteca):
+    for libro in biblioteca.libros:
+        yield registro_libro(libro)
+    for usuario in biblioteca.users:
+        yield registro_usuario(usuario)
+        for prestamo in biblioteca.prestamos_de(usuario.id_usuario):
+            yield registro_prestamo("prestamo", prestamo)
+    for reserva in biblioteca.reservas():
+        yield registro_reserva("reserva", reserva)
+
+
+def leer_instantanea(registros):
+    # Separa los registros de una instantánea (ver registros_de) en libros, usuarios,
+    # préstamos y reservas, para Biblioteca.restaurar()
+    libros, users, prestamos, reservas = [], [], [], []
+    for registro in registros:
+        tipo = registro[0]
+        if tipo == "libro":
+            _, id_libro, titulo, autor, genero, stock, prestados = registro
+            libro = Libro(id_libro, titulo, autor, genero, stock)
+            libro.prestados = prestados
+            libros.append(libro)
+        elif tipo == "usuario":
+            users.append(Usuario(*registro[1:]))
+        elif tipo == "prestamo":
+            prestamos.append(Prestamo(registro[1], registro[2], _fecha(registro, 3), _fecha(registro, 4)))
+        elif tipo == "reserva":
+            reservas.append(Reserva(registro[1], registro[2], _fecha(registro, 3)))
+        else:
+            raise ValueError(f"Registro desconocido en la instantánea: {tipo}")
+    return libros, users, prestamos, reservas
+
+
+def aplicar(biblioteca, registro):
+    tipo = registro[0]
+    if tipo == "libro":
+        _, id_libro, titulo, autor, genero, stock, prestados = registro
+        libro = Libro(id_libro, titulo, autor, genero, stock)
+        libro.prestados = prestados
+        biblioteca.agregar_libro(libro)
+    elif tipo == "editar_libro":
+        libro = biblioteca.obtener_libro(registro[1])
+        biblioteca.editar_libro(libro, *registro[2:])
+    elif tipo == "eliminar_libro":
+        biblioteca.eliminar(registro[1])
+    elif tipo == "usuario":
+        biblioteca.agregar_usuario(Usuario(*registro[1:]))
+    elif tipo == "editar_usuario":
+        usuario = biblioteca.obtener_usuario(registro[1])
+        biblioteca.editar_usuario(usuario, *registro[2:])
+    elif tipo == "eliminar_usuario":
+        biblioteca.eliminar_usuario(registro[1])
+    elif tipo == "prestamo":
+        # En la instantánea el stock del libro ya refleja el préstamo
+        biblioteca.restaurar_prestamo(registro[1], registro[2], _fecha(registro, 3), _fecha(registro, 4))
+    elif tipo == "prestar":
+        biblioteca.prestar(registro[1], registro[2], _fecha(registro, 3), _fecha(registro, 4))
+    elif tipo == "devolver":
+        biblioteca.devolver(registro[1], registro[2])
+    elif tipo == "reserva":
+        biblioteca.restaurar_reserva(registro[1], registro[2], _fecha(registro, 3))
+    elif tipo == "reservar":
+        biblioteca.reservar(registro[1], registro[2], _fecha(registro, 3))
+    elif tipo == "cancelar_reserva":
+        biblioteca.cancelar_reserva(registro[1], registro[2])
+    else:
+        raise ValueError(f"Operación desconocida en el registro: {tipo}")
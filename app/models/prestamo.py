@@ -0,0 +1,30 @@
+from datetime import datetime, timedelta
+
+# Un préstamo vence a los DIAS_PRESTAMO días de la fecha en que se hizo
+DIAS_PRESTAMO = 14
+
+
+def ahora():
+    return datetime.now().replace(microsecond=0)
+
+
+class Prestamo:
+    # Un ejemplar de un libro prestado a un usuario, con la fecha del préstamo
+    # y la de vencimiento
+    __slots__ = ("id_usuario", "id_libro", "fecha", "vence")
+
+    def __init__(self, id_usuario, id_libro, fecha=None, vence=None):
+        self.id_usuario = id_usuario
+        self.id_libro = id_libro
+        self.fecha = fecha if fecha is not None else ahora()
+        self.vence = vence if vence is not None else self.fecha + timedelta(days=DIAS_PRESTAMO)
+
+
+class Reserva:
+    # Lugar de un usuario en la fila de espera de un libro sin ejemplares disponibles
+    __slots__ = ("id_usuario", "id_libro", "fecha")
+
+    def __init__(self, id_usuario, id_libro, fecha=None):
+        self.id_usuario = id_usuario
+        self.id_libro = id_libro
+        self.fecha = fecha if fecha is not None else ahora()
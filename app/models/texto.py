@@ -0,0 +1,16 @@
+import re
+import unicodedata
+
+# Marcas diacríticas combinables (tildes, diéresis, virgulilla, etc.) que quedan
+# separadas de su letra después de la descomposición NFD
+_DIACRITICOS = re.compile("[\u0300-\u036f]")
+
+
+def normalizar(texto):
+    # Clave de búsqueda y orden: sin distinguir mayúsculas ni tildes, así
+    # "García", "garcia" y "GARCÍA" son iguales (la ñ queda como n).
+    # Los textos ASCII, la gran mayoría, solo se pasan a minúsculas
+    if texto.isascii():
+        return texto.lower()
+    texto = unicodedata.normalize("NFD", texto.casefold())
+    return unicodedata.normalize("NFC", _DIACRITICOS.sub("", texto))
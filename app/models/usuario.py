@@ -1,4 +1,13 @@
+from models.texto import normalizar
+from models.versiones import siguiente_version
+
+
 class Usuario:
+    __slots__ = (
+        "id_usuario", "nombre", "apellido", "dni", "telefono", "direccion", "nro_direccion", "libros", "version",
+        "nombre_n", "apellido_n", "dni_n",
+    )
+
     def __init__(
         self, id_usuario, nombre, apellido, dni, telefono, direccion, nro_direccion, libros=None
     ):
@@ -10,3 +19,12 @@ class Usuario:
         self.direccion = direccion
         self.nro_direccion = nro_direccion
         self.libros = libros if libros is not None else []
+        # Cambia con cada edición, préstamo o devolución (ver models/versiones.py)
+        self.version = siguiente_version()
+        self.actualizar_claves()
+
+    def actualizar_claves(self):
+        # Claves normalizadas para buscar y ordenar (ver Libro.actualizar_claves)
+        self.nombre_n = normalizar(self.nombre)
+        self.apellido_n = normalizar(self.apellido)
+        self.dni_n = str(self.dni)
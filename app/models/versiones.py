@@ -0,0 +1,7 @@
+from itertools import count
+
+# Versión de Libro y Usuario: cada alta o cambio recibe un número nuevo, único en
+# todo el proceso, así (id, versión) identifica un contenido aunque el objeto se
+# reemplace (ej: al recargar una réplica). La asigna quien hace el cambio, después
+# de hacerlo: quien lea la versión nueva ve también el contenido nuevo
+siguiente_version = count(1).__next__
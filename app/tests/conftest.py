@@ -0,0 +1,50 @@
+import os
+import sys
+
+import pytest
+
+# Los módulos se importan como desde app.py (models, utils, ...)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.biblioteca import Biblioteca  # noqa: E402
+from models.biblioteca_sqlite import BibliotecaSQLite  # noqa: E402
+
+
+@pytest.fixture(params=["memoria", "sqlite"])
+def nueva_biblioteca(request, tmp_path):
+    # Fábrica de bibliotecas vacías del backend del parámetro
+    creadas = []
+
+    def crear():
+        if request.param == "memoria":
+            biblioteca = Biblioteca()
+        else:
+            biblioteca = BibliotecaSQLite(str(tmp_path / f"biblioteca{len(creadas)}.db"))
+        creadas.append(biblioteca)
+        return biblioteca
+
+    yield crear
+    for biblioteca in creadas:
+        if isinstance(biblioteca, BibliotecaSQLite):
+            biblioteca.cerrar()
+
+
+@pytest.fixture
+def estado():
+    return estado_comparable
+
+
+def estado_comparable(biblioteca):
+    # Estado comparable entre backends: sin fechas ni versiones,
+    # que dependen del momento y del backend
+    libros = sorted(
+        (l.id_libro, l.titulo, l.autor, l.genero, l.stock, l.prestados) for l in biblioteca.libros
+    )
+    usuarios = sorted(
+        (u.id_usuario, u.nombre, u.apellido, [p.id_libro for p in biblioteca.prestamos_de(u.id_usuario)])
+        for u in biblioteca.users
+    )
+    reservas = {
+        libro[0]: [r.id_usuario for r in biblioteca.reservas_de_libro(libro[0])] for libro in libros
+    }
+    return libros, usuarios, reservas, biblioteca.estadisticas()
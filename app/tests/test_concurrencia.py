@@ -0,0 +1,81 @@
+import random
+import threading
+from collections import Counter
+
+from models.biblioteca import ErrorBiblioteca
+from models.libro import Libro
+from models.usuario import Usuario
+
+LIBROS = 30
+USUARIOS = 20
+HILOS = 8
+OPERACIONES = 150
+
+
+def poblar(biblioteca):
+    azar = random.Random(1)
+    generos = ["Drama", "Poesía", "Ensayo"]
+    biblioteca.agregar_libros(
+        [Libro(None, f"Libro {i}", f"Autor {i % 4}", azar.choice(generos), azar.randint(0, 3)) for i in range(LIBROS)]
+    )
+    biblioteca.agregar_usuarios(
+        [Usuario(None, f"Nombre {i}", f"Apellido {i}", i, "telefono", "calle", i) for i in range(USUARIOS)]
+    )
+
+
+def operar(biblioteca, semilla, errores):
+    azar = random.Random(semilla)
+    for _ in range(OPERACIONES):
+        id_usuario, id_libro = azar.randint(1, USUARIOS), azar.randint(1, LIBROS)
+        operacion = azar.random()
+        try:
+            if operacion < 0.3:
+                biblioteca.prestar(id_usuario, id_libro)
+            elif operacion < 0.55:
+                biblioteca.devolver(id_usuario, id_libro)
+            elif operacion < 0.65:
+                biblioteca.reservar(id_usuario, id_libro)
+            elif operacion < 0.7:
+                biblioteca.cancelar_reserva(id_usuario, id_libro)
+            elif operacion < 0.8:
+                pares = [(azar.randint(1, USUARIOS), azar.randint(1, LIBROS)) for _ in range(3)]
+                biblioteca.prestar_lote(pares, todo_o_nada=azar.random() < 0.5)
+            elif operacion < 0.9:
+                pares = [(id_usuario, l.id_libro) for l in biblioteca.obtener_usuario(id_usuario).libros]
+                biblioteca.devolver_lote(pares[:3], todo_o_nada=azar.random() < 0.5)
+            else:
+                libro = biblioteca.obtener_libro(id_libro)
+                genero = azar.choice(["Drama", "Poesía", "Ensayo", "Cuento"])
+                biblioteca.editar_libro(libro, libro.titulo, libro.autor, genero, libro.stock + azar.randint(0, 1))
+        except ErrorBiblioteca:
+            pass
+        except Exception as error:
+            errores.append(error)
+
+
+def test_estadisticas_coinciden_con_los_registros(nueva_biblioteca):
+    # Con préstamos, devoluciones, reservas, lotes y ediciones simultáneos,
+    # los totales acumulados tienen que dar lo mismo que sumar libro por libro
+    biblioteca = nueva_biblioteca()
+    poblar(biblioteca)
+    errores = []
+    hilos = [threading.Thread(target=operar, args=(biblioteca, semilla, errores)) for semilla in range(HILOS)]
+    for hilo in hilos:
+        hilo.start()
+    for hilo in hilos:
+        hilo.join()
+    assert errores == []
+
+    libros = biblioteca.libros
+    users = biblioteca.users
+    assert biblioteca.estadisticas() == {
+        "libros": len(libros),
+        "usuarios": len(users),
+        "disponibles": sum(l.stock for l in libros),
+        "prestados": sum(l.prestados for l in libros),
+        "usuarios_con_prestamos": sum(1 for u in users if u.libros),
+        "libros_por_genero": dict(Counter(l.genero for l in libros)),
+    }
+    # Cada ejemplar prestado corresponde a un préstamo de algún usuario
+    prestamos = Counter(l.id_libro for u in users for l in u.libros)
+    assert {l.id_libro: l.prestados for l in libros if l.prestados} == dict(prestamos)
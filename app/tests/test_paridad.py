@@ -0,0 +1,136 @@
+import random
+
+import pytest
+
+from models.biblioteca import Biblioteca, ErrorBiblioteca
+from models.biblioteca_sqlite import BibliotecaSQLite
+from models.libro import Libro
+from models.usuario import Usuario
+
+
+def resultado(funcion, *args, **kwargs):
+    # Lo que devolvió la operación, reducido a algo comparable entre backends
+    try:
+        devuelto = funcion(*args, **kwargs)
+    except ErrorBiblioteca as error:
+        return type(error).__name__
+    if funcion.__name__ in ("prestar_lote", "devolver_lote"):
+        aplicado, resultados = devuelto
+        return aplicado, [type(r).__name__ if isinstance(r, ErrorBiblioteca) else "ok" for r in resultados]
+    return "ok"
+
+
+def operaciones(semilla, cantidad=250):
+    # Secuencia de operaciones al azar sobre pocos libros y usuarios, para que
+    # haya ejemplares agotados, filas de espera y lotes con pares repetidos
+    azar = random.Random(semilla)
+    for _ in range(cantidad):
+        operacion = azar.random()
+        id_usuario, id_libro = azar.randint(1, 12), azar.randint(1, 10)
+        if operacion < 0.05:
+            yield "agregar_libros", ([("Libro", "Autor", azar.choice(["Drama", "Poesía"]), azar.randint(0, 2))],)
+        elif operacion < 0.08:
+            yield "agregar_usuarios", ([("Nombre", "Apellido", azar.randint(1, 99))],)
+        elif operacion < 0.3:
+            yield "prestar", (id_usuario, id_libro)
+        elif operacion < 0.45:
+            yield "devolver", (id_usuario, id_libro)
+        elif operacion < 0.6:
+            yield "reservar", (id_usuario, id_libro)
+        elif operacion < 0.65:
+            yield "cancelar_reserva", (id_usuario, id_libro)
+        elif operacion < 0.75:
+            pares = [(azar.randint(1, 12), azar.randint(1, 10)) for _ in range(azar.randint(1, 5))]
+            yield "prestar_lote", (pares, azar.random() < 0.5)
+        elif operacion < 0.85:
+            pares = [(azar.randint(1, 12), azar.randint(1, 10)) for _ in range(azar.randint(1, 5))]
+            yield "devolver_lote", (pares, azar.random() < 0.5)
+        elif operacion < 0.94:
+            yield "editar_libro", (id_libro, azar.choice(["Drama", "Ensayo"]), azar.randint(0, 3))
+        elif operacion < 0.97:
+            yield "eliminar", (id_libro,)
+        else:
+            yield "eliminar_usuario", (id_usuario,)
+
+
+def ejecutar(biblioteca, nombre, args):
+    if nombre == "agregar_libros":
+        libros = [Libro(None, *datos) for datos in args[0]]
+        return resultado(biblioteca.agregar_libros, libros), [l.id_libro for l in libros]
+    if nombre == "agregar_usuarios":
+        users = [Usuario(None, *datos, "telefono", "calle", 1) for datos in args[0]]
+        return resultado(biblioteca.agregar_usuarios, users), [u.id_usuario for u in users]
+    if nombre in ("prestar_lote", "devolver_lote"):
+        pares, todo_o_nada = args
+        return resultado(getattr(biblioteca, nombre), pares, todo_o_nada=todo_o_nada)
+    if nombre == "editar_libro":
+        id_libro, genero, stock = args
+        libro = biblioteca.obtener_libro(id_libro)
+        if libro is None:
+            return "sin libro"
+        return resultado(biblioteca.editar_libro, libro, libro.titulo, libro.autor, genero, stock)
+    return resultado(getattr(biblioteca, nombre), *args)
+
+
+def poblar(biblioteca):
+    biblioteca.agregar_libros([Libro(None, f"Libro {i}", f"Autor {i % 3}", "Drama", i % 3) for i in range(8)])
+    biblioteca.agregar_usuarios([Usuario(None, f"Nombre {i}", "Apellido", i, "t", "d", 1) for i in range(10)])
+
+
+@pytest.mark.parametrize("semilla", range(20))
+def test_mismos_resultados_en_ambos_backends(semilla, tmp_path, estado):
+    memoria = Biblioteca()
+    sqlite = BibliotecaSQLite(str(tmp_path / "biblioteca.db"))
+    try:
+        poblar(memoria)
+        poblar(sqlite)
+        for paso, (nombre, args) in enumerate(operaciones(semilla)):
+            en_memoria = ejecutar(memoria, nombre, args)
+            en_sqlite = ejecutar(sqlite, nombre, args)
+            assert en_memoria == en_sqlite, (paso, nombre, args)
+            assert estado(memoria) == estado(sqlite), (paso, nombre, args)
+    finally:
+        sqlite.cerrar()
+
+
+def test_reserva_pasa_al_siguiente_de_la_fila(nueva_biblioteca):
+    # Al devolver el único ejemplar se presta al primero de la fila;
+    # si ese cancela antes, al segundo
+    biblioteca = nueva_biblioteca()
+    biblioteca.agregar_libros([Libro(None, "Único", "Autor", "Drama", 1)])
+    biblioteca.agregar_usuarios([Usuario(None, f"Nombre {i}", "Apellido", i, "t", "d", 1) for i in range(3)])
+    biblioteca.prestar(1, 1)
+    biblioteca.reservar(2, 1)
+    biblioteca.reservar(3, 1)
+    with pytest.raises(ErrorBiblioteca):
+        biblioteca.prestar(3, 1)
+
+    biblioteca.devolver(1, 1)
+    assert [p.id_libro for p in biblioteca.prestamos_de(2)] == [1]
+    assert [r.id_usuario for r in biblioteca.reservas_de_libro(1)] == [3]
+
+    biblioteca.reservar(1, 1)
+    biblioteca.cancelar_reserva(3, 1)
+    biblioteca.devolver_lote([(2, 1)])
+    assert [p.id_libro for p in biblioteca.prestamos_de(1)] == [1]
+    assert biblioteca.reservas_de_libro(1) == []
+
+
+def test_lote_todo_o_nada(nueva_biblioteca, estado):
+    biblioteca = nueva_biblioteca()
+    biblioteca.agregar_libros([Libro(None, "Uno", "Autor", "Drama", 1), Libro(None, "Dos", "Autor", "Drama", 1)])
+    biblioteca.agregar_usuarios([Usuario(None, f"Nombre {i}", "Apellido", i, "t", "d", 1) for i in range(2)])
+    antes = estado(biblioteca)
+
+    # El segundo par pide el mismo ejemplar que el primero: no se presta ninguno
+    aplicado, resultados = biblioteca.prestar_lote([(1, 1), (2, 1), (2, 2)], todo_o_nada=True)
+    assert not aplicado and isinstance(resultados[1], ErrorBiblioteca)
+    assert estado(biblioteca) == antes
+
+    # Sin todo_o_nada se prestan los que se pueden
+    aplicado, resultados = biblioteca.prestar_lote([(1, 1), (2, 1), (2, 2)])
+    assert aplicado and [isinstance(r, ErrorBiblioteca) for r in resultados] == [False, True, False]
+    assert biblioteca.estadisticas()["prestados"] == 2
+
+    aplicado, _ = biblioteca.devolver_lote([(1, 1), (1, 2)], todo_o_nada=True)
+    assert not aplicado and biblioteca.estadisticas()["prestados"] == 2
@@ -0,0 +1,73 @@
+import os
+import random
+
+from models.biblioteca import Biblioteca, ErrorBiblioteca
+from models.libro import Libro
+from models.persistencia import Persistencia, registros_de
+from models.usuario import Usuario
+
+
+def abrir(directorio):
+    biblioteca = Biblioteca()
+    persistencia = Persistencia(str(directorio))
+    persistencia.cargar(biblioteca)
+    return biblioteca, persistencia
+
+
+def operar(biblioteca, semilla, cantidad=300):
+    azar = random.Random(semilla)
+    for _ in range(cantidad):
+        libros = [l.id_libro for l in biblioteca.libros]
+        users = [u.id_usuario for u in biblioteca.users]
+        operacion = azar.random()
+        try:
+            if operacion < 0.1 or not libros or not users:
+                biblioteca.agregar_libros([Libro(None, f"Libro {azar.random()}", "Autor", "Drama", azar.randint(0, 2))])
+                biblioteca.agregar_usuarios([Usuario(None, "Nombre", "Apellido", azar.randint(1, 99), "t", "d", 1)])
+                continue
+            id_usuario, id_libro = azar.choice(users), azar.choice(libros)
+            if operacion < 0.4:
+                biblioteca.prestar(id_usuario, id_libro)
+            elif operacion < 0.6:
+                biblioteca.devolver(id_usuario, id_libro)
+            elif operacion < 0.75:
+                biblioteca.reservar(id_usuario, id_libro)
+            elif operacion < 0.8:
+                biblioteca.cancelar_reserva(id_usuario, id_libro)
+            elif operacion < 0.9:
+                libro = biblioteca.obtener_libro(id_libro)
+                biblioteca.editar_libro(libro, libro.titulo + "!", libro.autor, "Poesía", libro.stock + 1)
+            elif operacion < 0.95:
+                biblioteca.eliminar(id_libro)
+            else:
+                biblioteca.eliminar_usuario(id_usuario)
+        except ErrorBiblioteca:
+            pass
+
+
+def test_registro_reinicio_compactacion_reinicio(tmp_path, estado):
+    biblioteca, persistencia = abrir(tmp_path)
+    operar(biblioteca, 1)
+    esperado = list(registros_de(biblioteca))
+    persistencia.cerrar()
+
+    # Reinicio: se vuelve a aplicar el registro de operaciones
+    biblioteca, persistencia = abrir(tmp_path)
+    assert list(registros_de(biblioteca)) == esperado
+    operar(biblioteca, 2)
+    biblioteca.compactar()
+    operar(biblioteca, 3)
+    esperado = list(registros_de(biblioteca))
+    esperado_estado = estado(biblioteca)
+    persistencia.cerrar()
+    assert "instantanea.jsonl" in os.listdir(tmp_path)
+
+    # Reinicio: instantánea más las operaciones posteriores a la compactación
+    biblioteca, persistencia = abrir(tmp_path)
+    assert list(registros_de(biblioteca)) == esperado
+    assert estado(biblioteca) == esperado_estado
+    # Los ids siguen después de los que ya se usaron
+    nuevo = Libro(None, "Nuevo", "Autor", "Drama", 1)
+    biblioteca.agregar_libros([nuevo])
+    assert nuevo.id_libro > max(registro[1] for registro in esperado if registro[0] == "libro")
+    persistencia.cerrar()
@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+
+
+class RespuestaCacheada:
+    # Cuerpo ya serializado de una respuesta y los datos para volver a armarla
+    __slots__ = ("cuerpo", "mimetype", "headers")
+
+    def __init__(self, cuerpo, mimetype, headers):
+        self.cuerpo = cuerpo
+        self.mimetype = mimetype
+        self.headers = headers
+
+
+class CacheRespuestas:
+    # Caché LRU de respuestas, acotada por cantidad de entradas y por bytes.
+    # Todas las entradas pertenecen a una misma generación de la biblioteca:
+    # cuando llega una consulta con una generación nueva se descartan todas,
+    # así nunca se sirve un resultado calculado antes de un cambio.
+    def __init__(self, max_entradas=1024, max_bytes=32 * 2**20):
+        self.max_entradas = max_entradas
+        self.max_bytes = max_bytes
+        self._entradas = OrderedDict()
+        self._bytes = 0
+        self._generacion = None
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+        self.desalojos = 0
+        self.invalidaciones = 0
+        self.no_modificados = 0
+
+    def _invalidar_si_cambio(self, generacion):
+        if generacion != self._generacion:
+            if self._entradas:
+                self.invalidaciones += 1
+            self._entradas.clear()
+            self._bytes = 0
+            self._generacion = generacion
+
+    def obtener(self, clave, generacion):
+        with self._lock:
+            self._invalidar_si_cambio(generacion)
+            entrada = self._entradas.get(clave)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return entrada
+
+    def guardar(self, clave, generacion, entrada):
+        # generacion es la leída ANTES de calcular la respuesta: si mientras tanto
+        # hubo un cambio, la respuesta puede estar desactualizada y no se guarda
+        tamanio = len(entrada.cuerpo)
+        if tamanio > self.max_bytes:
+            return
+        with self._lock:
+            if generacion != self._generacion:
+                return
+            anterior = self._entradas.pop(clave, None)
+            if anterior is not None:
+                self._bytes -= len(anterior.cuerpo)
+            self._entradas[clave] = entrada
+            self._bytes += tamanio
+            while len(self._entradas) > self.max_entradas or self._bytes > self.max_bytes:
+                _, desalojada = self._entradas.popitem(last=False)
+                self._bytes -= len(desalojada.cuerpo)
+                self.desalojos += 1
+
+    def contar_no_modificado(self):
+        # Respuestas 304: el cliente ya tenía el resultado y no se buscó en la caché
+        with self._lock:
+            self.no_modificados += 1
+
+    def estadisticas(self):
+        with self._lock:
+            consultas = self.aciertos + self.fallos
+            return {
+                "entradas": len(self._entradas),
+                "bytes": self._bytes,
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "tasa_aciertos": round(self.aciertos / consultas, 4) if consultas else 0.0,
+                "desalojos": self.desalojos,
+                "invalidaciones": self.invalidaciones,
+                "no_modificados": self.no_modificados,
+            }
+
+
+class CacheFragmentos:
+    # Caché LRU de fragmentos HTML ya renderizados (ej: una fila de tabla), por
+    # cantidad de entradas. La clave lleva la versión de los registros que muestra
+    # el fragmento: un cambio genera una clave nueva y la entrada vieja queda sin
+    # uso hasta que se desaloja, así no hace falta invalidar nada
+    def __init__(self, max_entradas=20_000):
+        self.max_entradas = max_entradas
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def obtener(self, clave):
+        with self._lock:
+            fragmento = self._entradas.get(clave)
+            if fragmento is None:
+                self.fallos += 1
+                return None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return fragmento
+
+    def guardar(self, clave, fragmento):
+        with self._lock:
+            self._entradas[clave] = fragmento
+            if len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    def estadisticas(self):
+        with self._lock:
+            return {"entradas": len(self._entradas), "aciertos": self.aciertos, "fallos": self.fallos}
@@ -0,0 +1,154 @@
+import cProfile
+import os
+import threading
+import time
+from bisect import bisect_left
+
+
+# Límites (en segundos) de los intervalos de los histogramas de tiempos
+LIMITES_SEGUNDOS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+class Histograma:
+    # Cantidad de observaciones por intervalo (no acumuladas), más la suma y el total
+    __slots__ = ("cuentas", "suma", "cantidad")
+
+    def __init__(self, intervalos):
+        self.cuentas = [0] * (intervalos + 1)
+        self.suma = 0.0
+        self.cantidad = 0
+
+
+def _escapar(valor):
+    return str(valor).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _etiquetas(etiquetas, extra=()):
+    # (("ruta", "/libros"), ("metodo", "GET")) -> {ruta="/libros",metodo="GET"}
+    pares = tuple(etiquetas) + tuple(extra)
+    if not pares:
+        return ""
+    return "{" + ",".join(f'{clave}="{_escapar(valor)}"' for clave, valor in pares) + "}"
+
+
+def _numero(valor):
+    return repr(float(valor)) if isinstance(valor, float) else str(valor)
+
+
+class Metricas:
+    # Contadores e histogramas en memoria, exportados en el formato de texto de Prometheus.
+    # Las etiquetas se pasan como tupla de pares (clave, valor). Registrar una
+    # observación cuesta una búsqueda binaria y unas sumas con el lock tomado.
+    # Los valores que ya lleva otro objeto (ej: la caché) se leen recién al exportar,
+    # con funciones recolectoras que devuelven pares (etiquetas, valor)
+    def __init__(self, limites=LIMITES_SEGUNDOS):
+        self.limites = limites
+        self._lock = threading.Lock()
+        self._tipos = {}
+        self._ayudas = {}
+        self._contadores = {}
+        self._histogramas = {}
+        self._recolectores = []
+
+    def describir(self, nombre, tipo, ayuda):
+        # tipo: "counter", "gauge" o "histogram"
+        self._tipos[nombre] = tipo
+        self._ayudas[nombre] = ayuda
+
+    def contar(self, nombre, etiquetas=(), cantidad=1):
+        clave = (nombre, etiquetas)
+        with self._lock:
+            self._contadores[clave] = self._contadores.get(clave, 0) + cantidad
+
+    def observar(self, nombre, valor, etiquetas=()):
+        clave = (nombre, etiquetas)
+        intervalo = bisect_left(self.limites, valor)
+        with self._lock:
+            histograma = self._histogramas.get(clave)
+            if histograma is None:
+                histograma = self._histogramas[clave] = Histograma(len(self.limites))
+            histograma.cuentas[intervalo] += 1
+            histograma.suma += valor
+            histograma.cantidad += 1
+
+    def agregar_recolector(self, nombre, tipo, ayuda, recolector):
+        self.describir(nombre, tipo, ayuda)
+        self._recolectores.append((nombre, recolector))
+
+    def exportar(self):
+        with self._lock:
+            contadores = dict(self._contadores)
+            histogramas = {
+                clave: (list(h.cuentas), h.suma, h.cantidad) for clave, h in self._histogramas.items()
+            }
+        muestras = {}
+        for (nombre, etiquetas), valor in contadores.items():
+            muestras.setdefault(nombre, []).append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+        for nombre, recolector in self._recolectores:
+            for etiquetas, valor in recolector():
+                muestras.setdefault(nombre, []).append(f"{nombre}{_etiquetas(etiquetas)} {_numero(valor)}")
+        for (nombre, etiquetas), (cuentas, suma, cantidad) in histogramas.items():
+            lineas = muestras.setdefault(nombre, [])
+            acumulado = 0
+            for limite, cuenta in zip(self.limites + ("+Inf",), cuentas):
+                acumulado += cuenta
+                le = limite if isinstance(limite, str) else _numero(limite)
+                lineas.append(f"{nombre}_bucket{_etiquetas(etiquetas, (('le', le),))} {acumulado}")
+            lineas.append(f"{nombre}_sum{_etiquetas(etiquetas)} {_numero(suma)}")
+            lineas.append(f"{nombre}_count{_etiquetas(etiquetas)} {cantidad}")
+
+        salida = []
+        for nombre in sorted(muestras):
+            if nombre in self._ayudas:
+                salida.append(f"# HELP {nombre} {self._ayudas[nombre]}")
+                salida.append(f"# TYPE {nombre} {self._tipos[nombre]}")
+            salida.extend(muestras[nombre])
+        return "\n".join(salida) + "\n"
+
+
+class Perfilador:
+    # Perfila con cProfile una de cada "cada" peticiones (0 = apagado) y guarda el
+    # resultado en "directorio", un archivo .prof por petición (se abre con pstats
+    # o snakeviz). Se perfila una sola petición a la vez: si hay otra en curso,
+    # la que toca se saltea, así el costo queda acotado aunque haya mucha carga
+    def __init__(self, cada=0, directorio="perfiles"):
+        self.cada = cada
+        self.directorio = directorio
+        self.guardados = 0
+        self._peticiones = 0
+        self._lock = threading.Lock()
+        self._en_curso = threading.Lock()
+
+    def iniciar(self):
+        # Devuelve (perfil ya activado, número de la petición) si a esta petición
+        # le toca, si no None. "cada" se lee una sola vez: /metrics/perfilador
+        # puede cambiarlo (incluso a 0) mientras tanto
+        cada = self.cada
+        if not cada:
+            return None
+        with self._lock:
+            self._peticiones += 1
+            numero = self._peticiones
+        if numero % cada or not self._en_curso.acquire(blocking=False):
+            return None
+        perfil = cProfile.Profile()
+        try:
+            perfil.enable()
+        except ValueError:
+            # Otro perfilador ya está activo en el proceso
+            self._en_curso.release()
+            return None
+        return perfil, numero
+
+    def terminar(self, perfilado, nombre):
+        # perfilado: lo que devolvió iniciar() para esta petición
+        perfil, numero = perfilado
+        perfil.disable()
+        try:
+            os.makedirs(self.directorio, exist_ok=True)
+            nombre = "".join(c if c.isalnum() else "_" for c in nombre).strip("_") or "raiz"
+            archivo = f"{time.strftime('%Y%m%d-%H%M%S')}-{numero}-{nombre}.prof"
+            perfil.dump_stats(os.path.join(self.directorio, archivo))
+            self.guardados += 1
+        finally:
+            self._en_curso.release()